@@ -0,0 +1,10 @@
+"""
+Benchmarks and load tests that run without GCS, Cloud Vision or Groq.
+
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.load --students 20 --teachers 2 --output load.json
+
+benchmarks.fakes holds the local stand-ins (filesystem bucket, Vision client,
+OpenAI-compatible chat server), each with configurable latency. Both suites
+write machine-readable JSON so results can be compared across commits.
+"""
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from gcvutils.local_storage import LocalBucket
+
+FAKE_FEEDBACK = ("The answer covers the main points of the model answer. The derivation in the second part "
+                 "skips a step and the final result is missing units. Grade: 7/10.")
+
+
+class FakeVisionClient:
+    """
+    Stands in for vision.ImageAnnotatorClient: document_text_detection and
+    batch_annotate_images return canned text after `latency_seconds` per request.
+    """
+
+    def __init__(self, latency_seconds=0.0, text="Handwritten answer recognised by the fake Vision client."):
+        self.latency_seconds = latency_seconds
+        self.text = text
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "images": 0, "bytes": 0}
+
+    def _response(self, content):
+        with self._lock:
+            self.stats["images"] += 1
+            self.stats["bytes"] += len(content)
+        return SimpleNamespace(error=SimpleNamespace(message="", code=0),
+                               full_text_annotation=SimpleNamespace(text=f"{self.text} ({len(content)} bytes)"))
+
+    def _request(self):
+        with self._lock:
+            self.stats["requests"] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def document_text_detection(self, image, timeout=None, **kwargs):
+        self._request()
+        return self._response(image.content)
+
+    def batch_annotate_images(self, requests, timeout=None, **kwargs):
+        self._request()
+        return SimpleNamespace(responses=[self._response(r.image.content) for r in requests])
+
+
+class FakeChatServer:
+    """
+    OpenAI-compatible /chat/completions endpoint on localhost, so the real Groq
+    client, connection pool and streaming path are exercised. Replies with canned
+    feedback after `latency_seconds`, streaming one word every `token_seconds`.
+    """
+
+    def __init__(self, latency_seconds=0.0, token_seconds=0.0, reply=FAKE_FEEDBACK, port=0):
+        self.latency_seconds = latency_seconds
+        self.token_seconds = token_seconds
+        self.reply = reply
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-chat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # Headers and body are separate writes on a kept-alive socket
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                server.requests += 1
+                if server.latency_seconds:
+                    time.sleep(server.latency_seconds)
+                if body.get("stream"):
+                    self._stream(body)
+                else:
+                    self._complete(body)
+
+            def _chunk(self, body, delta, finish_reason=None):
+                return {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": body.get("model", "fake"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+            def _complete(self, body):
+                prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+                completion_tokens = len(server.reply) // 4
+                payload = json.dumps({
+                    "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion",
+                    "created": int(time.time()), "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": server.reply},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                events = [self._chunk(body, {"role": "assistant", "content": ""})]
+                words = server.reply.split(" ")
+                events += [self._chunk(body, {"content": word if i == 0 else f" {word}"})
+                           for i, word in enumerate(words)]
+                events.append(self._chunk(body, {}, "stop"))
+                for event in events:
+                    if server.token_seconds:
+                        time.sleep(server.token_seconds)
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def install_fakes(root, storage_latency=0.0, vision_latency=0.0, llm_latency=0.0, llm_token_seconds=0.0):
+    """
+    Points the app at local stand-ins: a filesystem bucket under root, a fake
+    Vision client and a fake chat server. Job queue, OCR cache and record store
+    state also go under root. Call before importing the app's views.
+
+    Returns a namespace with bucket, vision_client and chat_server.
+    """
+    root = os.path.abspath(root)
+    os.environ["EVALMATE_STORAGE"] = f"local:{os.path.join(root, 'bucket')}"
+    os.environ["EVALMATE_JOBS_DB"] = os.path.join(root, "jobs.sqlite3")
+    os.environ["EVALMATE_OCR_CACHE_DIR"] = os.path.join(root, "ocr_cache")
+    os.environ["EVALMATE_STORE_PATH"] = os.path.join(root, "records.sqlite3")
+    os.environ["EVALMATE_WARM_MODELS"] = "0"
+
+    chat_server = FakeChatServer(llm_latency, llm_token_seconds).start()
+    os.environ["EVALMATE_LLM_BASE_URL"] = chat_server.url
+
+    from gcvutils import cloud
+    bucket = LocalBucket(os.path.join(root, "bucket"), latency_seconds=storage_latency)
+    vision_client = FakeVisionClient(vision_latency)
+    cloud.set_shared("bucket", bucket)
+    cloud.set_shared("vision_client", vision_client)
+
+    # The gateway may already exist with a backend pointing at Groq
+    import views.LM as LM
+    LM.gateway.set_backend(LM.GroqBackend(api_key="fake", base_url=chat_server.url))
+
+    return SimpleNamespace(root=root, bucket=bucket, vision_client=vision_client, chat_server=chat_server)
@@ -0,0 +1,139 @@
+"""
+Load generator: many simulated students and teachers driving the dashboards
+concurrently through Streamlit's AppTest, against the local fakes.
+
+Each simulated user logs in through session state and reruns its dashboard
+--reruns times; teachers also bulk-grade one pending assignment through the
+fake chat server. Per-role rerun latency, errors and the bucket traffic they
+caused are written as JSON:
+
+    python -m benchmarks.load --students 20 --teachers 2 --output load.json
+    python -m benchmarks.load --students 50 --storage-latency 0.03 --llm-latency 0.3
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import install_fakes
+from benchmarks.report import REPO_ROOT, summarise, write_report
+
+SCRIPT = os.path.join(REPO_ROOT, "views", "about_signin.py")
+SUBJECTS = ("DTE", "NIC", "XAI", "Maths")
+
+
+def seed(bucket, assignments, students):
+    """Writes assignments, extracted submissions and some feedback in the app's storage layout."""
+    from gcvutils.records import GcsRecordStore
+    store = GcsRecordStore(bucket)
+    for i in range(assignments):
+        title = f"Assignment {i}"
+        extracted = {}
+        for s in range(students):
+            if (i + s) % 2 == 0:  # Half the students submitted each assignment
+                path = f"extracted_texts/{title.replace(' ', '_')}/student{s}_extractedtext.txt"
+                bucket.blob(path).upload_from_string(f"Answer of student{s} to {title}. " * 40)
+                extracted[f"student{s}"] = path
+        graded = {}
+        for username in list(extracted)[: len(extracted) // 3]:
+            feedback = f"Feedback for {username} on {title}."
+            bucket.blob(f"feedbacks/{title}/{username}_feedback.txt").upload_from_string(feedback)
+            graded[username] = {"feedback": feedback, "finalized": True}
+        record = {"title": title, "subject": SUBJECTS[i % len(SUBJECTS)],
+                  "submission_deadline": "2099-12-31 23:59:00", "model_answer": "Model answer. " * 30,
+                  "extracted_texts": extracted, "graded_students": graded, "created_at": i,
+                  "submitted_files": []}
+        store.update("assignments", title, lambda _, r=record: r)
+    for s in range(students):
+        titles = [f"Assignment {i}" for i in range(assignments) if (i + s) % 2 == 0]
+        store.update("submissions", f"student{s}", lambda _, t=titles: t)
+
+
+def secrets(students, teachers):
+    return {
+        "teachers": {f"teacher{t}": "password" for t in range(teachers)},
+        "students": {f"student{s}": "password" for s in range(students)},
+        "gcs": {"bucket_name": "evalmate-bench"},
+        "google_credentials": {},
+    }
+
+
+def simulate_user(role, username, reruns, app_secrets, timeout):
+    """Logs one user in and reruns their dashboard; returns per-run timings and errors."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(SCRIPT, default_timeout=timeout)
+    for key, value in app_secrets.items():
+        at.secrets[key] = value
+    at.session_state["logged_in"] = True
+    at.session_state["navigation"] = "dashboard"
+    at.session_state["user_type"] = role
+    at.session_state["username"] = username
+
+    seconds, errors = [], []
+
+    def run(action=None):
+        start = time.perf_counter()
+        try:
+            (action() if action else at).run()
+            if at.exception:
+                errors.append(str(at.exception[0].value))
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        seconds.append(time.perf_counter() - start)
+
+    for i in range(reruns):
+        bulk = [b for b in at.button if b.key and b.key.startswith("bulk_")] if role == "Teacher" and i == 1 else []
+        run(bulk[0].click if bulk else None)
+    return {"role": role, "username": username, "seconds": seconds, "errors": errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--teachers", type=int, default=2)
+    parser.add_argument("--assignments", type=int, default=10)
+    parser.add_argument("--reruns", type=int, default=5, help="Script runs per simulated user")
+    parser.add_argument("--storage-latency", type=float, default=0.0, help="Seconds added to each bucket request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds before the fake LLM answers")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed per script run")
+    parser.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="evalmate-load-") as root:
+        fakes = install_fakes(root, storage_latency=args.storage_latency, llm_latency=args.llm_latency)
+        try:
+            seed(fakes.bucket, args.assignments, args.students)
+            seeded = dict(fakes.bucket.stats)
+            app_secrets = secrets(args.students, args.teachers)
+
+            users = ([("Student", f"student{s}") for s in range(args.students)] +
+                     [("Teacher", f"teacher{t}") for t in range(args.teachers)])
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(users)) as pool:
+                sessions = list(pool.map(
+                    lambda user: simulate_user(*user, args.reruns, app_secrets, args.timeout), users))
+            elapsed = time.perf_counter() - start
+            traffic = {k: v - seeded.get(k, 0) for k, v in fakes.bucket.stats.items()}
+        finally:
+            fakes.chat_server.stop()
+
+    results = []
+    for role in ("Student", "Teacher"):
+        role_sessions = [s for s in sessions if s["role"] == role]
+        seconds = [t for s in role_sessions for t in s["seconds"]]
+        errors = [e for s in role_sessions for e in s["errors"]]
+        results.append(summarise(f"{role.lower()}_dashboard rerun", seconds, users=len(role_sessions),
+                                 errors=len(errors), sample_errors=sorted(set(errors))[:5]))
+    runs = sum(len(s["seconds"]) for s in sessions)
+    results.append({"name": "totals", "wall_seconds": round(elapsed, 3),
+                    "runs_per_second": round(runs / elapsed, 3) if elapsed else None,
+                    "bucket_requests": traffic, "llm_requests": fakes.chat_server.requests,
+                    "bytes_downloaded_per_run": round(traffic["bytes_downloaded"] / runs) if runs else None})
+
+    write_report("load", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Accuracy and throughput of the maths OCR inference backends on sample PDFs.
+
+Each backend runs in a fresh interpreter (thread settings and quantization are
+per process) over every page of the PDFs, bypassing routing and the OCR cache.
+Throughput is reported as pages per second per core; accuracy as similarity to
+each page's text layer and agreement with the first backend's output:
+
+    python -m benchmarks.math_ocr_benchmark
+    python -m benchmarks.math_ocr_benchmark simple_equations.pdf --backends torch int8 --threads 2
+
+With --check-batch, every page's formula crops are also recognized one by one
+and any crop where the batched LatexOCR pass disagrees is reported.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from gcvutils.inference import INFERENCE_BACKENDS
+from benchmarks.vision_benchmark import similarity
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def page_formula_crops(image, p2t, crop_formula):
+    """The formula crops extract_text_and_latex sends to LatexOCR for one page."""
+    from gcvutils.matheqs import FORMULA_TYPES, formula_box
+
+    extracted = p2t.recognize(image)
+    if isinstance(extracted, dict):
+        extracted = [extracted]
+    if not isinstance(extracted, list):
+        return []
+    boxes = [formula_box(item, image.size) for item in extracted if item.get('type') in FORMULA_TYPES]
+    return [crop_formula(box) for box in boxes if box]
+
+
+def run_backend(pdfs, threads, max_pages=None, check_batch=False):
+    """Worker side: OCRs every page with the backend named in EVALMATE_INFERENCE_BACKEND."""
+    from gcvutils.inference import INFERENCE_BACKEND, configure_threads
+    configure_threads(threads)
+
+    from gcvutils.matheqs import check_latexocr_batch, extract_text_and_latex, model_registry
+    from gcvutils.rasterize import (LAYOUT_DPI, FORMULA_DPI, fitz_lock, iter_pdf_pages, make_page_cropper,
+                                    open_pdf)
+
+    start = time.perf_counter()
+    p2t, latexocr = model_registry.get("pix2text"), model_registry.get("latexocr")
+    load_seconds = time.perf_counter() - start
+
+    pages = []
+    ocr_seconds = 0.0
+    mismatches = []
+    formulas_checked = 0
+    for path in pdfs:
+        with open(path, "rb") as f:
+            doc = open_pdf(f.read())
+        for i, page, image in iter_pdf_pages(doc, dpi=LAYOUT_DPI):
+            if max_pages is not None and i >= max_pages:
+                break
+            with fitz_lock:
+                reference = page.get_text("text").strip()
+            crop_formula = make_page_cropper(page, LAYOUT_DPI, FORMULA_DPI)
+            start = time.perf_counter()
+            text = extract_text_and_latex(image, p2t, latexocr, crop_formula=crop_formula)
+            elapsed = time.perf_counter() - start
+            if check_batch:
+                crops = page_formula_crops(image, p2t, crop_formula)
+                formulas_checked += len(crops)
+                if crops:
+                    mismatches += [{"pdf": os.path.basename(path), "page": i + 1, "formula": index,
+                                    "batched": batched, "single": single}
+                                   for index, batched, single in check_latexocr_batch(latexocr, crops)]
+            ocr_seconds += elapsed
+            pages.append({"pdf": os.path.basename(path), "page": i + 1, "seconds": round(elapsed, 3),
+                          "text": text, "reference": reference})
+
+    result = {
+        "backend": INFERENCE_BACKEND,
+        "threads": threads,
+        "load_seconds": round(load_seconds, 2),
+        "ocr_seconds": round(ocr_seconds, 2),
+        "pages_per_second_per_core": round(len(pages) / ocr_seconds / threads, 4) if ocr_seconds else None,
+        "pages": pages,
+    }
+    if check_batch:
+        result["batch_check"] = {"formulas": formulas_checked, "mismatches": mismatches}
+    return result
+
+
+def benchmark_backend(backend, pdfs, threads, max_pages=None, check_batch=False):
+    """Runs one backend in a subprocess and returns its results."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_path = f.name
+    try:
+        command = [sys.executable, "-m", "benchmarks.math_ocr_benchmark", *pdfs,
+                   "--threads", str(threads), "--worker-output", result_path]
+        if max_pages is not None:
+            command += ["--max-pages", str(max_pages)]
+        if check_batch:
+            command.append("--check-batch")
+        env = {**os.environ, "EVALMATE_INFERENCE_BACKEND": backend}
+        proc = subprocess.run(command, cwd=REPO_ROOT, env=env)
+        if proc.returncode != 0:
+            return {"backend": backend, "threads": threads, "error": f"worker exited with {proc.returncode}"}
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def score(results):
+    """Adds accuracy (vs the text layer) and agreement (vs the first backend) to each result."""
+    baseline = next((r for r in results if "pages" in r), None)
+    for result in results:
+        if "pages" not in result:
+            continue
+        accuracy = [similarity(p["reference"], p["text"]) for p in result["pages"] if p["reference"]]
+        result["accuracy_mean"] = round(sum(accuracy) / len(accuracy), 4) if accuracy else None
+        agreement = [similarity(b["text"], p["text"]) for b, p in zip(baseline["pages"], result["pages"])]
+        result["agreement_with_baseline"] = round(sum(agreement) / len(agreement), 4) if agreement else None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="PDFs to benchmark (default: the sample PDFs in the repo root)")
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    parser.add_argument("--threads", type=int, default=1, help="Intra-op threads per backend run")
+    parser.add_argument("--max-pages", type=int, help="Only benchmark the first N pages of each PDF")
+    parser.add_argument("--check-batch", action="store_true",
+                        help="Also compare batched LatexOCR output with per-formula output")
+    parser.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    pdfs = [os.path.abspath(p) for p in args.pdfs] or sorted(glob.glob(os.path.join(REPO_ROOT, "*.pdf")))
+
+    if args.worker_output:
+        result = run_backend(pdfs, args.threads, args.max_pages, args.check_batch)
+        with open(args.worker_output, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = score([benchmark_backend(b, pdfs, args.threads, args.max_pages, args.check_batch)
+                     for b in args.backends])
+    report = json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    for result in results:
+        if "error" in result:
+            print(f"❌ {result['backend']}: {result['error']}", file=sys.stderr)
+            continue
+        accuracy = f", accuracy {result['accuracy_mean']:.1%}" if result["accuracy_mean"] is not None else ""
+        agreement = (f", agreement {result['agreement_with_baseline']:.1%}"
+                     if result["agreement_with_baseline"] is not None else "")
+        print(f"⚡ {result['backend']}: {result['pages_per_second_per_core']} pages/s/core"
+              f"{agreement}{accuracy}", file=sys.stderr)
+        if "batch_check" in result:
+            check = result["batch_check"]
+            icon = "✅" if not check["mismatches"] else "❌"
+            print(f"{icon} {result['backend']}: batched LatexOCR differs from per-formula output on "
+                  f"{len(check['mismatches'])} of {check['formulas']} formulas", file=sys.stderr)
+
+    if any(result.get("batch_check", {}).get("mismatches") for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
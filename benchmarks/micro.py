@@ -0,0 +1,136 @@
+"""
+Micro-benchmarks of the hot paths, run against the local fakes.
+
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.micro --storage-latency 0.03 --llm-latency 0.2 --iterations 20
+
+load_data is a page-script function in views/about_signin.py that delegates
+to the shared catalogue; the catalogue calls it makes (and the JSON writes the
+dashboards make) are timed here directly. extract_text_and_latex is skipped when the OCR models are not
+installed locally.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import install_fakes
+from benchmarks.report import REPO_ROOT, SAMPLE_PDFS, summarise, timed, write_report
+
+
+def bench_convert_pdf(iterations):
+    from gcvutils.matheqs import convert_pdf_bytes_to_images
+    results = []
+    for name in SAMPLE_PDFS:
+        with open(os.path.join(REPO_ROOT, name), "rb") as f:
+            pdf_bytes = f.read()
+        pages = len(convert_pdf_bytes_to_images(pdf_bytes))
+        results.append(summarise(f"convert_pdf_bytes_to_images[{name}]",
+                                 timed(lambda: convert_pdf_bytes_to_images(pdf_bytes), iterations),
+                                 pages=pages, pdf_bytes=len(pdf_bytes)))
+    return results
+
+
+def bench_extract_text_and_latex(iterations):
+    name = "extract_text_and_latex[simple_equations.pdf p1]"
+    try:
+        from gcvutils.matheqs import extract_text_and_latex, model_registry
+        p2t, latexocr = model_registry.get("pix2text"), model_registry.get("latexocr")
+    except Exception as e:
+        return [{"name": name, "skipped": f"OCR models unavailable: {e}"}]
+
+    from gcvutils.rasterize import LAYOUT_DPI, FORMULA_DPI, iter_pdf_pages, make_page_cropper, open_pdf
+    with open(os.path.join(REPO_ROOT, "simple_equations.pdf"), "rb") as f:
+        doc = open_pdf(f.read())
+    _, page, image = next(iter_pdf_pages(doc, dpi=LAYOUT_DPI))
+    crop_formula = make_page_cropper(page, LAYOUT_DPI, FORMULA_DPI)
+    return [summarise(name, timed(lambda: extract_text_and_latex(image, p2t, latexocr, crop_formula),
+                                  iterations))]
+
+
+def bench_catalogue(fakes, iterations, assignments=50):
+    from gcvutils.catalogue import SharedCatalogue
+    from gcvutils.records import GcsRecordStore
+
+    store = GcsRecordStore(fakes.bucket, prefix="bench_records/")
+    for i in range(assignments):
+        record = {"title": f"Assignment {i}", "model_answer": "x" * 2000, "extracted_texts": {},
+                  "graded_students": {}, "created_at": i}
+        store.update("assignments", record["title"], lambda _, r=record: r)
+    catalogue = SharedCatalogue(store, fakes.bucket)
+    feedbacks = {f"student{i}": {"Assignment 0": "Good work"} for i in range(200)}
+    catalogue.put_json("bench/student_feedbacks.json", feedbacks)
+
+    def cold_records():
+        catalogue.invalidate("assignments")
+        catalogue.records("assignments")
+
+    def cold_json():
+        catalogue.invalidate_json("bench/student_feedbacks.json")
+        catalogue.json("bench/student_feedbacks.json")
+
+    return [
+        summarise("load_data[records, revalidated]", timed(cold_records, iterations), records=assignments),
+        summarise("load_data[records, cached]", timed(lambda: catalogue.records("assignments"), iterations)),
+        summarise("load_data[json, revalidated]", timed(cold_json, iterations)),
+        summarise("load_data[json, cached]",
+                  timed(lambda: catalogue.json("bench/student_feedbacks.json"), iterations)),
+        summarise("put_json[json]",
+                  timed(lambda: catalogue.put_json("bench/student_feedbacks.json", feedbacks), iterations)),
+    ]
+
+
+def bench_llm(iterations):
+    from views.LM import LLM
+    llm = LLM()
+    student_answer = "Newton's second law states that force equals mass times acceleration. " * 20
+    model_answer = "F = ma; the net force on a body equals its mass times its acceleration."
+
+    first_tokens = []
+
+    def stream_once():
+        start = time.perf_counter()
+        for i, _ in enumerate(llm.stream_AI(student_answer, model_answer)):
+            if i == 0:
+                first_tokens.append(time.perf_counter() - start)
+
+    results = [summarise("LLM.AI", timed(lambda: llm.AI(student_answer, model_answer), iterations))]
+    results.append(summarise("LLM.stream_AI", timed(stream_once, iterations)))
+    results.append(summarise("LLM.stream_AI[first token]", first_tokens))
+    return results
+
+
+BENCHMARKS = ("convert_pdf", "extract_text_and_latex", "catalogue", "llm")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--storage-latency", type=float, default=0.0, help="Seconds added to each bucket request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds before the fake LLM answers")
+    parser.add_argument("--llm-token-seconds", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="evalmate-bench-") as root:
+        fakes = install_fakes(root, storage_latency=args.storage_latency, llm_latency=args.llm_latency,
+                              llm_token_seconds=args.llm_token_seconds)
+        try:
+            results = []
+            if "convert_pdf" in args.benchmarks:
+                results += bench_convert_pdf(args.iterations)
+            if "extract_text_and_latex" in args.benchmarks:
+                results += bench_extract_text_and_latex(args.iterations)
+            if "catalogue" in args.benchmarks:
+                results += bench_catalogue(fakes, args.iterations)
+            if "llm" in args.benchmarks:
+                results += bench_llm(args.iterations)
+        finally:
+            fakes.chat_server.stop()
+
+    write_report("micro", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
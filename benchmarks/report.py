@@ -0,0 +1,68 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from gcvutils.tracing import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDFS = ("printed.pdf", "simple_equations.pdf", "new_eqs.pdf", "latexcheck1 1.pdf")
+
+
+def summarise(name, seconds, **extra):
+    """One result row: latency percentiles in milliseconds plus any extra fields."""
+    ms = [s * 1000 for s in seconds]
+    row = {
+        "name": name,
+        "iterations": len(ms),
+        "p50_ms": round(percentile(ms, 0.5), 3) if ms else None,
+        "p95_ms": round(percentile(ms, 0.95), 3) if ms else None,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+        "min_ms": round(min(ms), 3) if ms else None,
+    }
+    row.update(extra)
+    return row
+
+
+def timed(func, iterations):
+    """Calls func() `iterations` times and returns the wall time of each call."""
+    seconds = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def write_report(suite, config, results, output=None):
+    """Writes {suite, commit, environment, config, results} as JSON to output (or stdout)."""
+    report = json.dumps({
+        "suite": suite,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }, indent=4, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    for row in results:
+        if row.get("skipped"):
+            print(f"⏭️ {row['name']}: skipped ({row['skipped']})", file=sys.stderr)
+        else:
+            print(f"⏱️ {row['name']}: p50 {row.get('p50_ms')} ms, p95 {row.get('p95_ms')} ms", file=sys.stderr)
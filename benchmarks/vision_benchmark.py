@@ -0,0 +1,116 @@
+"""
+Compares Cloud Vision page encodings on sample PDFs: bytes sent, encode and
+request latency, and recognition accuracy.
+
+Accuracy is measured against each page's embedded text layer, so it is only
+reported for digitally produced pages (the repo's printed.pdf and friends).
+Without --ocr only the encoding side is measured and no credentials are needed:
+
+    python -m benchmarks.vision_benchmark
+    python -m benchmarks.vision_benchmark printed.pdf --ocr --output vision_benchmark.json
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import sys
+import time
+
+from gcvutils.rasterize import fitz_lock, open_pdf
+from gcvutils.tracing import percentile
+from gcvutils.vision_encoding import encode_page_for_vision
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("legacy", "adaptive")
+
+
+def _normalise(text):
+    return " ".join(text.split())
+
+
+def similarity(reference, text):
+    """Character-level similarity in [0, 1] between whitespace-normalised texts."""
+    return difflib.SequenceMatcher(None, _normalise(reference), _normalise(text), autojunk=False).ratio()
+
+
+def benchmark_pdf(path, modes, vision_client=None, max_pages=None):
+    with open(path, "rb") as f:
+        doc = open_pdf(f.read())
+    with fitz_lock:
+        page_count = len(doc) if max_pages is None else min(len(doc), max_pages)
+
+    rows = []
+    for page_num in range(page_count):
+        with fitz_lock:
+            page = doc.load_page(page_num)
+            reference = page.get_text("text").strip()
+        for mode in modes:
+            start = time.perf_counter()
+            content, info = encode_page_for_vision(page, mode=mode)
+            row = {"pdf": os.path.basename(path), "page": page_num + 1, **info,
+                   "encode_ms": round((time.perf_counter() - start) * 1000, 1)}
+            if vision_client is not None:
+                from google.cloud import vision
+                start = time.perf_counter()
+                response = vision_client.document_text_detection(image=vision.Image(content=content))
+                row["request_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                text = response.full_text_annotation.text if response.full_text_annotation else ""
+                row["accuracy"] = round(similarity(reference, text), 4) if reference else None
+            rows.append(row)
+    return rows
+
+
+def summarise(rows, modes):
+    summary = {}
+    for mode in modes:
+        mode_rows = [r for r in rows if r["mode"] == mode]
+        requests = [r["request_ms"] for r in mode_rows if "request_ms" in r]
+        accuracy = [r["accuracy"] for r in mode_rows if r.get("accuracy") is not None]
+        summary[mode] = {
+            "pages": len(mode_rows),
+            "bytes": sum(r["bytes"] for r in mode_rows),
+            "encode_ms_p50": percentile([r["encode_ms"] for r in mode_rows], 0.5),
+            "request_ms_p50": percentile(requests, 0.5),
+            "request_ms_p95": percentile(requests, 0.95),
+            "accuracy_mean": round(sum(accuracy) / len(accuracy), 4) if accuracy else None,
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="PDFs to benchmark (default: the sample PDFs in the repo root)")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--ocr", action="store_true", help="Send every page to Cloud Vision (uses st.secrets)")
+    parser.add_argument("--max-pages", type=int, help="Only benchmark the first N pages of each PDF")
+    parser.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+    args = parser.parse_args(argv)
+
+    pdfs = args.pdfs or sorted(glob.glob(os.path.join(REPO_ROOT, "*.pdf")))
+    vision_client = None
+    if args.ocr:
+        from gcvutils.cloud import get_vision_client
+        vision_client = get_vision_client()
+
+    rows = []
+    for path in pdfs:
+        rows.extend(benchmark_pdf(path, args.modes, vision_client, args.max_pages))
+    summary = summarise(rows, args.modes)
+
+    report = json.dumps({"summary": summary, "pages": rows}, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    for mode, stats in summary.items():
+        accuracy = f", accuracy {stats['accuracy_mean']:.1%}" if stats["accuracy_mean"] is not None else ""
+        latency = f", request p50 {stats['request_ms_p50']} ms" if stats["request_ms_p50"] is not None else ""
+        print(f"📦 {mode}: {stats['pages']} pages, {stats['bytes'] / 1e6:.2f} MB{latency}{accuracy}",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
 import streamlit as st
-import os
-os.system("pip uninstall -y opencv-python opencv-python-headless && pip install opencv-python-headless==4.8.1.78")
+from gcvutils.environment import headless_opencv_problem
+
+# The headless OpenCV swap runs in startup.sh at provision time; here we only check, once per process.
+@st.cache_resource
+def check_environment():
+    problem = headless_opencv_problem()
+    if problem:
+        print(f"⚠️ {problem}; run `python -m gcvutils.environment` when provisioning")
+    return problem
+
+environment_problem = check_environment()
+if environment_problem:
+    st.warning(f"⚠️ Environment problem: {environment_problem}. PDF extraction may fail until the "
+               "app is re-provisioned (`python -m gcvutils.environment`).")
 
 
 about_page = st.Page(
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BlobTextCache:
+    """
+    Bounded, process-wide cache of small text objects keyed by (name, generation).
+
+    prefetch() starts downloads on a thread pool without waiting; get() returns the
+    text, waiting for an in-flight download if there is one. A new generation of an
+    object is a new key, so re-uploaded files are never served stale. Objects whose
+    generation is not known are downloaded on every get() and never cached.
+    """
+
+    def __init__(self, bucket, max_entries=512, max_workers=8):
+        self.bucket = bucket
+        self.max_entries = max_entries
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-prefetch")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _download(self, name, generation=None):
+        # Pinned, so the cached text always belongs to the generation in its key
+        return self.bucket.blob(name).download_as_text(if_generation_match=generation)
+
+    def _future(self, name, generation):
+        key = (name, generation)
+        with self._lock:
+            future = self._entries.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._pool.submit(self._download, name, generation)
+                self._entries[key] = future
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return future
+
+    def prefetch(self, items):
+        """Starts downloading every (name, generation) pair that is not cached yet."""
+        for name, generation in items:
+            if generation is not None:
+                self._future(name, generation)
+
+    def get(self, name, generation=None, timeout=60):
+        if generation is None:
+            return self._download(name)
+        return self._future(name, generation).result(timeout=timeout)
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+# How long a snapshot is served without asking storage whether it changed.
+# Writes made through this process invalidate immediately; writes from other
+# servers become visible within this window.
+CATALOGUE_TTL_SECONDS = float(os.environ.get("EVALMATE_CATALOGUE_TTL", 15))
+
+
+def freeze(value):
+    """Read-only view of decoded JSON: dicts become mapping proxies, lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class SharedCatalogue:
+    """
+    Process-wide read-through cache over a RecordStore and JSON blobs.
+
+    Every session reads the same frozen snapshot, so memory does not grow with the
+    number of users. A snapshot older than the TTL is revalidated by the first
+    reader only (others wait for it): record kinds through the store's listing,
+    which re-downloads changed generations only, and blobs through a metadata
+    lookup of their generation. Writes go through update()/delete()/put_json()
+    so the affected snapshot is dropped at once.
+    """
+
+    def __init__(self, store, bucket, ttl=CATALOGUE_TTL_SECONDS):
+        self.store = store
+        self.bucket = bucket
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._records = {}  # kind -> (checked_at, snapshot, {key: (source record, frozen)})
+        self._blobs = {}    # blob name -> (checked_at, generation, frozen value)
+        self.stats = {"hits": 0, "revalidations": 0, "blob_downloads": 0, "invalidations": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _flight(self, name):
+        """One lock per cached item, so concurrent misses trigger a single revalidation."""
+        with self._lock:
+            return self._flights.setdefault(name, threading.Lock())
+
+    def _fresh(self, checked_at):
+        return time.monotonic() - checked_at < self.ttl
+
+    # -- records --------------------------------------------------------------
+    def records(self, kind):
+        """Returns a read-only {key: record} snapshot of every record of kind."""
+        entry = self._records.get(kind)
+        if entry is not None and self._fresh(entry[0]):
+            self._count("hits")
+            return entry[1]
+
+        with self._flight(f"records:{kind}"):
+            entry = self._records.get(kind)
+            if entry is not None and self._fresh(entry[0]):
+                self._count("hits")
+                return entry[1]
+
+            listed = self.store.list(kind)
+            previous = entry[2] if entry is not None else {}
+            frozen = {}
+            for key, record in listed.items():
+                # The store hands back the same object for unchanged records; so do we
+                known = previous.get(key)
+                frozen[key] = known if known is not None and known[0] is record else (record, freeze(record))
+            snapshot = MappingProxyType({key: view for key, (_, view) in frozen.items()})
+            self._records[kind] = (time.monotonic(), snapshot, frozen)
+            self._count("revalidations")
+            return snapshot
+
+    def record(self, kind, key):
+        return self.records(kind).get(key)
+
+    def update(self, kind, key, mutate):
+        """RecordStore.update() that also drops the cached snapshot of kind."""
+        try:
+            return self.store.update(kind, key, mutate)
+        finally:
+            self.invalidate(kind)
+
+    def delete(self, kind, key):
+        try:
+            self.store.delete(kind, key)
+        finally:
+            self.invalidate(kind)
+
+    def invalidate(self, kind):
+        with self._lock:
+            entry = self._records.get(kind)
+            if entry is not None:
+                # Keep the frozen records so unchanged ones are reused on the next read
+                self._records[kind] = (float("-inf"), entry[1], entry[2])
+            self.stats["invalidations"] += 1
+
+    # -- JSON blobs -----------------------------------------------------------
+    def json(self, name):
+        """Returns the decoded JSON blob as a read-only view, or None if it does not exist."""
+        entry = self._blobs.get(name)
+        if entry is not None and self._fresh(entry[0]):
+            self._count("hits")
+            return entry[2]
+
+        with self._flight(f"blob:{name}"):
+            entry = self._blobs.get(name)
+            if entry is not None and self._fresh(entry[0]):
+                self._count("hits")
+                return entry[2]
+
+            blob = self.bucket.get_blob(name)
+            if blob is None:
+                value, generation = None, 0
+            elif entry is not None and entry[1] == blob.generation:
+                value, generation = entry[2], blob.generation
+            else:
+                value = freeze(json.loads(blob.download_as_text(if_generation_match=blob.generation)))
+                generation = blob.generation
+                self._count("blob_downloads")
+            self._blobs[name] = (time.monotonic(), generation, value)
+            self._count("revalidations")
+            return value
+
+    def put_json(self, name, data):
+        try:
+            self.bucket.blob(name).upload_from_string(json.dumps(data, indent=4), content_type="application/json")
+        finally:
+            self.invalidate_json(name)
+
+    def invalidate_json(self, name):
+        with self._lock:
+            entry = self._blobs.get(name)
+            if entry is not None:
+                self._blobs[name] = (float("-inf"), entry[1], entry[2])
+            self.stats["invalidations"] += 1
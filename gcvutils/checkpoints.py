@@ -0,0 +1,97 @@
+"""
+Page-level checkpoints for PDF text extraction.
+
+Each OCR'd page is written to the bucket as soon as it completes, under
+
+    extraction_checkpoints/<engine>/<sha256 of engine version and PDF bytes>/<page>.txt
+
+so a retry of the same PDF (after a Vision API error, a Pix2Text failure or a
+dead worker) only OCRs the pages that are still missing. Unlike the OCR cache,
+checkpoints are never evicted and need no rendering to look up. They are
+deleted once the assembled text has been written; those of extractions that
+failed and were never retried expire after EVALMATE_CHECKPOINT_TTL_HOURS
+(swept by the job dispatcher, see sweep_expired_checkpoints).
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+CHECKPOINT_PREFIX = "extraction_checkpoints/"
+CHECKPOINT_WORKERS = 8
+CHECKPOINT_TTL_SECONDS = float(os.environ.get("EVALMATE_CHECKPOINT_TTL_HOURS", 24)) * 3600
+
+
+class PageCheckpoint:
+    """The per-page results already extracted from one PDF by one OCR engine."""
+
+    def __init__(self, bucket, engine, version, pdf_bytes):
+        self.bucket = bucket
+        digest = hashlib.sha256(f"{version}\0".encode() + pdf_bytes).hexdigest()
+        self.prefix = f"{CHECKPOINT_PREFIX}{engine}/{digest}/"
+        self.pages = self._load()
+        self.resumed = len(self.pages)
+        if self.resumed:
+            print(f"⏯️ Resuming extraction: {self.resumed} page(s) restored from checkpoint {self.prefix}")
+
+    def _path(self, index):
+        return f"{self.prefix}{index:05d}.txt"
+
+    def _load(self):
+        try:
+            names = [blob.name for blob in self.bucket.list_blobs(prefix=self.prefix)]
+        except Exception as e:
+            print(f"⚠️ Could not list extraction checkpoint {self.prefix}: {e}")
+            return {}
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=CHECKPOINT_WORKERS, thread_name_prefix="checkpoint") as pool:
+            texts = list(pool.map(lambda name: self.bucket.blob(name).download_as_text(), names))
+        return {int(name[len(self.prefix):].split(".")[0]): text for name, text in zip(names, texts)}
+
+    def __contains__(self, index):
+        return index in self.pages
+
+    def get(self, index):
+        return self.pages.get(index)
+
+    def put(self, index, text):
+        """Persists one page's text. A failed write only costs the page being OCR'd again on a retry."""
+        self.pages[index] = text
+        try:
+            self.bucket.blob(self._path(index)).upload_from_string(text, content_type="text/plain")
+        except Exception as e:
+            print(f"⚠️ Could not checkpoint page {index + 1}: {e}")
+
+    def clear(self):
+        """Deletes the checkpoint once the document's text has been stored."""
+        names = [self._path(index) for index in self.pages]
+
+        def delete(name):
+            try:
+                self.bucket.blob(name).delete()
+            except Exception:
+                pass  # Left-over pages are harmless and are reused if the same PDF is extracted again
+
+        with ThreadPoolExecutor(max_workers=CHECKPOINT_WORKERS, thread_name_prefix="checkpoint") as pool:
+            list(pool.map(delete, names))
+
+
+def sweep_expired_checkpoints(bucket, ttl_seconds=CHECKPOINT_TTL_SECONDS):
+    """
+    Deletes checkpoint pages last written more than ttl_seconds ago, i.e. those of
+    extractions that failed or were abandoned and not retried. Returns the number deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+    expired = [blob for blob in bucket.list_blobs(prefix=CHECKPOINT_PREFIX)
+               if blob.updated is not None and blob.updated < cutoff]
+
+    def delete(blob):
+        try:
+            blob.delete()
+        except Exception:
+            pass  # Already removed by another process's sweep or a successful retry
+
+    with ThreadPoolExecutor(max_workers=CHECKPOINT_WORKERS, thread_name_prefix="checkpoint") as pool:
+        list(pool.map(delete, expired))
+    return len(expired)
@@ -0,0 +1,83 @@
+import os
+import threading
+
+import streamlit as st
+
+# One connection pool per process, sized for the thread pools that share it
+# (Vision/OCR page workers, submission prefetch, record listing).
+GCS_POOL_SIZE = int(os.environ.get("EVALMATE_GCS_POOL_SIZE", 32))
+
+# (connect, read) timeout for GCS requests made without an explicit timeout. Retries are
+# left to google-cloud-storage's per-call policy (DEFAULT_RETRY, or conditional on a
+# generation precondition), so the session adds none: one retry layer, one backoff.
+GCS_TIMEOUT = (5, 60)
+
+# Timeout for a single Cloud Vision request
+VISION_TIMEOUT_SECONDS = 120
+
+# EVALMATE_STORAGE=local:<directory> swaps the bucket for a filesystem-backed stand-in
+STORAGE_BACKEND = os.environ.get("EVALMATE_STORAGE", "gcs")
+
+_lock = threading.RLock()
+_shared = {}
+
+
+def _once(name, factory):
+    """Builds a shared object on first use; every later caller in the process gets the same one."""
+    with _lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def get_credentials():
+    def build():
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_info(st.secrets["google_credentials"])
+    return _once("credentials", build)
+
+
+def get_storage_client():
+    def build():
+        import requests
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+        from google.cloud.storage.constants import _DEFAULT_TIMEOUT
+
+        class PolicySession(AuthorizedSession):
+            def request(self, method, url, *args, **kwargs):
+                # The library passes its default on every call; a timeout chosen by the caller is kept
+                if kwargs.get("timeout") in (None, _DEFAULT_TIMEOUT):
+                    kwargs["timeout"] = GCS_TIMEOUT
+                return super().request(method, url, *args, **kwargs)
+
+        credentials = get_credentials()
+        session = PolicySession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=GCS_POOL_SIZE, pool_maxsize=GCS_POOL_SIZE,
+                                                max_retries=0)
+        session.mount("https://", adapter)
+        return storage.Client(credentials=credentials, project=credentials.project_id, _http=session)
+    return _once("storage_client", build)
+
+
+def get_bucket():
+    """The app's bucket, shared by every module and session in this process."""
+    def build():
+        if STORAGE_BACKEND.startswith("local:"):
+            from gcvutils.local_storage import LocalBucket
+            return LocalBucket(STORAGE_BACKEND[len("local:"):])
+        return get_storage_client().bucket(st.secrets["gcs"]["bucket_name"])
+    return _once("bucket", build)
+
+
+def get_vision_client():
+    def build():
+        from google.cloud import vision
+        return vision.ImageAnnotatorClient(credentials=get_credentials())
+    return _once("vision_client", build)
+
+
+def set_shared(name, value):
+    """Replaces a shared client ("bucket", "vision_client", ...), e.g. with a fake in benchmarks."""
+    with _lock:
+        _shared[name] = value
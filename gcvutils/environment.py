@@ -0,0 +1,47 @@
+import subprocess
+import sys
+from importlib import metadata
+
+# pix2text depends on opencv-python, which needs libGL; the app must run the headless build
+OPENCV_HEADLESS_VERSION = "4.8.1.78"
+
+
+def _installed_version(distribution):
+    try:
+        return metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def headless_opencv_problem():
+    """
+    Describes what is wrong with the installed OpenCV builds, or returns None if only
+    the pinned headless build is present. Only reads package metadata, so it is cheap
+    enough to call at startup.
+    """
+    if _installed_version("opencv-python") is not None:
+        return "opencv-python is installed; it needs libGL and can break PDF extraction"
+    headless = _installed_version("opencv-python-headless")
+    if headless != OPENCV_HEADLESS_VERSION:
+        return f"opencv-python-headless is {headless or 'missing'}, expected {OPENCV_HEADLESS_VERSION}"
+    return None
+
+
+def ensure_headless_opencv():
+    """
+    Swaps opencv-python for the pinned headless build if a dependency pulled it in.
+    Runs pip, so it belongs in provisioning (startup.sh), never in the app process;
+    returns True if a reinstall was needed.
+    """
+    if headless_opencv_problem() is None:
+        return False
+    print("🔧 Replacing opencv-python with opencv-python-headless...")
+    subprocess.run([sys.executable, "-m", "pip", "uninstall", "-y", "opencv-python", "opencv-python-headless"],
+                   check=False)
+    subprocess.run([sys.executable, "-m", "pip", "install", f"opencv-python-headless=={OPENCV_HEADLESS_VERSION}"],
+                   check=False)
+    return True
+
+
+if __name__ == "__main__":
+    ensure_headless_opencv()
@@ -0,0 +1,111 @@
+import os
+import threading
+
+# "torch": the models as shipped (FP32). "int8": Linear layers dynamically
+# quantized to INT8, which is where the transformer decoders spend their time on CPU.
+INFERENCE_BACKENDS = ("torch", "int8")
+INFERENCE_BACKEND = os.environ.get("EVALMATE_INFERENCE_BACKEND", "torch")
+
+# Per-worker thread budgets. By default the cores are split evenly between the
+# OCR worker processes so concurrent jobs do not oversubscribe the CPU.
+INFERENCE_INTRA_OP_THREADS = int(os.environ.get("EVALMATE_INTRA_OP_THREADS", 0))  # 0: cores / workers
+INFERENCE_INTER_OP_THREADS = int(os.environ.get("EVALMATE_INTER_OP_THREADS", 1))
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# Budget for this process (set by the OCR worker initializer) and whether torch has been configured
+_budget = {"intra_op": None, "configured": False}
+_budget_lock = threading.Lock()
+
+
+def thread_budget(workers=1, intra_op=INFERENCE_INTRA_OP_THREADS):
+    """Intra-op threads for one of `workers` processes sharing this machine."""
+    if intra_op > 0:
+        return intra_op
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+
+def set_thread_budget(intra_op):
+    """
+    Records this process's intra-op budget without importing torch (safe in a pool
+    initializer). The OpenMP/MKL variables are set now, before anything loads those
+    runtimes; torch itself is configured by ensure_threads() when a model is first built.
+    """
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(intra_op))
+    with _budget_lock:
+        _budget["intra_op"] = intra_op
+
+
+def ensure_threads():
+    """Applies the thread budget to torch once per process; call before building a torch model."""
+    with _budget_lock:
+        if _budget["configured"]:
+            return
+        intra_op = _budget["intra_op"] or thread_budget()
+    configure_threads(intra_op)
+
+
+def configure_threads(intra_op, inter_op=INFERENCE_INTER_OP_THREADS):
+    """
+    Pins torch's thread pools for this process. Must run before torch does any
+    parallel work (set_num_interop_threads fails afterwards), i.e. before models load.
+    """
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(intra_op))
+    with _budget_lock:
+        _budget["configured"] = True
+    try:
+        import torch
+    except ImportError as e:
+        print(f"⚠️ torch unavailable, inference threads not configured: {e}")
+        return
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError as e:
+        print(f"⚠️ Inter-op threads already fixed for this process: {e}")
+    print(f"🧵 Inference threads: intra-op {intra_op}, inter-op {inter_op}")
+
+
+def _torch_modules(obj, seen, depth):
+    """Yields the top-level torch modules reachable through obj's attributes."""
+    import torch
+    if id(obj) in seen or depth < 0:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, torch.nn.Module):
+        yield obj
+        return
+    attributes = getattr(obj, "__dict__", None)
+    if not attributes:
+        return
+    for value in attributes.values():
+        yield from _torch_modules(value, seen, depth - 1)
+
+
+def quantize_int8(model, depth=3):
+    """
+    Dynamically quantizes the Linear layers of every torch module held by model
+    (a Pix2Text or LatexOCR wrapper), in place. Returns the number of modules quantized.
+    """
+    import torch
+    quantized = 0
+    for module in _torch_modules(model, set(), depth):
+        try:
+            module.eval()
+            torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            quantized += 1
+        except Exception as e:
+            print(f"⚠️ Could not quantize {type(module).__name__}, keeping FP32: {e}")
+    return quantized
+
+
+def prepare_model(name, model, backend=INFERENCE_BACKEND):
+    """Applies the configured inference backend to a freshly loaded model."""
+    if backend == "int8":
+        count = quantize_int8(model)
+        print(f"⚡ {name}: {count} module(s) quantized to INT8")
+    elif backend != "torch":
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {INFERENCE_BACKENDS}")
+    return model
@@ -0,0 +1,430 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Persistent job queue shared by every Streamlit server process on this machine
+JOBS_DB_PATH = os.path.expanduser(os.environ.get("EVALMATE_JOBS_DB", "~/.streamlit/jobs.sqlite3"))
+
+# Admission control: OCR jobs running at once (across processes) and jobs allowed to wait
+MAX_RUNNING_JOBS = int(os.environ.get("EVALMATE_MAX_OCR_JOBS", 2))
+MAX_QUEUED_JOBS = int(os.environ.get("EVALMATE_MAX_QUEUED_JOBS", 50))
+
+# A running job's worker renews its lease every JOB_HEARTBEAT_SECONDS; a job whose lease
+# has not been renewed for JOB_LEASE_SECONDS belongs to a dead process and is requeued
+JOB_HEARTBEAT_SECONDS = 30
+JOB_LEASE_SECONDS = 4 * JOB_HEARTBEAT_SECONDS
+
+# How often each dispatcher deletes page checkpoints of extractions that were never retried
+CHECKPOINT_SWEEP_SECONDS = 60 * 60
+
+# Each OCR worker starts loading the maths models in the background as soon as it is spawned
+WARM_MODELS = os.environ.get("EVALMATE_WARM_MODELS", "1") != "0"
+
+# Worker stats older than this (e.g. from workers of a replaced pool) are not shown
+WORKER_STATS_MAX_AGE_SECONDS = 24 * 60 * 60
+
+# Identifies this process's stats row when it is an OCR worker
+_WORKER_ID = uuid.uuid4().hex
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when admission control rejects a new job."""
+
+
+def _connect():
+    os.makedirs(os.path.dirname(JOBS_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+               id TEXT PRIMARY KEY,
+               kind TEXT NOT NULL,
+               owner TEXT,
+               payload TEXT NOT NULL,
+               status TEXT NOT NULL,
+               result TEXT,
+               error TEXT,
+               acknowledged INTEGER NOT NULL DEFAULT 0,
+               created_at REAL NOT NULL,
+               started_at REAL,
+               finished_at REAL
+           )"""
+    )
+    if "heartbeat_at" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+        try:
+            conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        except sqlite3.OperationalError:
+            pass  # Added by another process in the meantime
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+    # Model and OCR cache stats reported by the workers, which the server process cannot see
+    conn.execute("CREATE TABLE IF NOT EXISTS worker_stats (worker TEXT PRIMARY KEY, pid INTEGER, "
+                 "updated_at REAL NOT NULL, stats TEXT NOT NULL)")
+    # Requests to every dispatcher on this machine to replace its worker pool
+    conn.execute("CREATE TABLE IF NOT EXISTS worker_controls (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "action TEXT NOT NULL, created_at REAL NOT NULL)")
+    return conn
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def submit_job(kind, payload, owner=None):
+    """Queues a job and returns its id. Raises JobQueueFull when the queue is at capacity."""
+    job_id = uuid.uuid4().hex
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        if queued >= MAX_QUEUED_JOBS:
+            conn.execute("ROLLBACK")
+            raise JobQueueFull(f"{queued} jobs are already waiting")
+        conn.execute(
+            "INSERT INTO jobs (id, kind, owner, payload, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, owner, json.dumps(payload), QUEUED, time.time()),
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    ensure_dispatcher()
+    return job_id
+
+
+def ensure_dispatcher():
+    """Starts this process's dispatcher so jobs queued before a restart are picked up."""
+    _dispatcher.start()
+    _dispatcher.wake.set()
+
+
+def get_job(job_id):
+    conn = _connect()
+    try:
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def queue_position(job_id):
+    """Number of queued jobs ahead of this one (0 when it is next or already running)."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return 0
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                            (QUEUED, row["created_at"])).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def unacknowledged_jobs(owner):
+    """Finished jobs of this owner whose results the UI has not applied yet."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE owner = ? AND status IN (?, ?) AND acknowledged = 0 ORDER BY created_at",
+            (owner, DONE, FAILED),
+        ).fetchall()
+        return [_row_to_job(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def active_jobs(owner):
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT * FROM jobs WHERE owner = ? AND status IN (?, ?) ORDER BY created_at",
+                            (owner, QUEUED, RUNNING)).fetchall()
+        return [_row_to_job(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def acknowledge_job(job_id):
+    conn = _connect()
+    try:
+        conn.execute("UPDATE jobs SET acknowledged = 1 WHERE id = ?", (job_id,))
+    finally:
+        conn.close()
+
+
+def worker_stats(max_age=WORKER_STATS_MAX_AGE_SECONDS):
+    """Latest stats of each OCR worker that reported recently: {"worker", "pid", "updated_at", "stats"}."""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT * FROM worker_stats WHERE updated_at > ? ORDER BY updated_at DESC",
+                            (time.time() - max_age,)).fetchall()
+    finally:
+        conn.close()
+    return [{**dict(row), "stats": json.loads(row["stats"])} for row in rows]
+
+
+def restart_workers():
+    """
+    Asks every dispatcher on this machine to replace its worker pool. Running jobs
+    finish on the old workers; the new ones load the OCR models again on first use,
+    which both frees their memory now and picks up new model versions.
+    """
+    conn = _connect()
+    try:
+        conn.execute("INSERT INTO worker_controls (action, created_at) VALUES (?, ?)", ("restart", time.time()))
+        conn.execute("DELETE FROM worker_stats")  # Every current worker is being replaced
+    finally:
+        conn.close()
+    _dispatcher.wake.set()
+
+
+def _report_worker_stats():
+    """Runs in a worker after each job: stores its model and OCR cache stats for the admin panels."""
+    stats = {}
+    ocr_cache = sys.modules.get("gcvutils.ocr_cache")
+    if ocr_cache is not None:
+        stats["ocr_cache"] = dict(ocr_cache.page_cache.stats)
+    matheqs = sys.modules.get("gcvutils.matheqs")
+    if matheqs is not None:
+        stats["models"] = matheqs.model_registry.metrics()
+        stats["model_store"] = dict(matheqs.model_store.stats)
+    conn = _connect()
+    try:
+        conn.execute("INSERT OR REPLACE INTO worker_stats (worker, pid, updated_at, stats) VALUES (?, ?, ?, ?)",
+                     (_WORKER_ID, os.getpid(), time.time(), json.dumps(stats, default=str)))
+    finally:
+        conn.close()
+
+
+def _warm_models():
+    """Loads the maths OCR models in a worker; failures are logged, and the first job retries the load."""
+    try:
+        from gcvutils.matheqs import model_registry
+    except Exception as e:
+        print(f"⚠️ OCR model warm-up skipped: {e}")
+        return
+    model_registry.warm()
+
+
+def _init_worker():
+    """
+    Runs once in each worker process: records its share of the cores and, with
+    WARM_MODELS, starts loading the OCR models on a background thread. Nothing heavy
+    is imported on the initializer's own thread, since a failing initializer breaks
+    the pool for every job kind.
+    """
+    from gcvutils.inference import set_thread_budget, thread_budget
+    set_thread_budget(thread_budget(MAX_RUNNING_JOBS))
+    if WARM_MODELS:
+        threading.Thread(target=_warm_models, name="model-warmup", daemon=True).start()
+
+
+def _renew_lease(job_id, stop):
+    """Runs in the worker while the job does: keeps the job's lease from expiring."""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            conn = _connect()
+            try:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+                             (time.time(), job_id, RUNNING))
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ Could not renew the lease of job {job_id}: {e}")
+
+
+def run_job(kind, payload, job_id=None):
+    """Executes one job inside a worker process and returns a JSON-serialisable result."""
+    from gcvutils.tracing import trace_context
+    stop = threading.Event()
+    if job_id is not None:
+        threading.Thread(target=_renew_lease, args=(job_id, stop), name="job-lease", daemon=True).start()
+    try:
+        with trace_context(job=kind, subject=payload.get("subject"), assignment=payload.get("title")):
+            return _run_job(kind, payload)
+    finally:
+        stop.set()
+        try:
+            _report_worker_stats()
+        except Exception as e:
+            print(f"⚠️ Could not report worker stats: {e}")
+
+
+def _run_job(kind, payload):
+    if kind == "extract_maths":
+        from gcvutils.matheqs import process_pdf_from_gcs_to_text
+        path = process_pdf_from_gcs_to_text(payload["pdf_blob_path"], payload["title"], payload["username"])
+    elif kind == "extract_handwritten":
+        from gcvutils.textextract_gcv import extract_handwritten_text_from_pdf
+        path = extract_handwritten_text_from_pdf(payload["pdf_blob_path"], payload["title"], payload["username"])
+    else:
+        raise ValueError(f"Unknown job kind: {kind}")
+    _record_submission(payload, path)
+    return {"extracted_blob_path": path}
+
+
+def _record_submission(payload, extracted_blob_path):
+    """
+    Writes the submission into the catalogue from the worker, so it is recorded even
+    if the student closed the page; the dashboard only reports the job's status.
+    """
+    from gcvutils.cloud import get_bucket
+    from gcvutils.records import open_record_store, record_extracted_submission
+    record_extracted_submission(open_record_store(get_bucket()), payload["title"], payload["username"],
+                                payload["pdf_blob_path"], extracted_blob_path)
+
+
+class _Dispatcher:
+    """Claims queued jobs from SQLite and runs them on a process pool, within MAX_RUNNING_JOBS."""
+
+    def __init__(self):
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+        self._broken = False
+        self._in_flight = 0
+        self._last_sweep = float("-inf")
+        self._last_control = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="ocr-job-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _claim(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Only jobs whose worker stopped renewing the lease; long jobs that are alive keep theirs
+            conn.execute("UPDATE jobs SET status = ?, started_at = NULL, heartbeat_at = NULL "
+                         "WHERE status = ? AND COALESCE(heartbeat_at, started_at) < ?",
+                         (QUEUED, RUNNING, time.time() - JOB_LEASE_SECONDS))
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+            if running >= MAX_RUNNING_JOBS:
+                conn.execute("COMMIT")
+                return None
+            row = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                               (QUEUED,)).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute("UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                             (RUNNING, now, now, row["id"]))
+            conn.execute("COMMIT")
+            return _row_to_job(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            self._in_flight -= 1
+        conn = _connect()
+        try:
+            error = None if future.cancelled() else future.exception()
+            if isinstance(error, BrokenProcessPool):
+                # A worker died (e.g. out of memory); the loop replaces the pool before the next submit
+                self._broken = True
+                error = f"The extraction worker stopped unexpectedly: {error}"
+            if future.cancelled():
+                conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE id = ?", (QUEUED, job_id))
+            elif error is None:
+                conn.execute("UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                             (DONE, json.dumps(future.result()), time.time(), job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                             (FAILED, str(error), time.time(), job_id))
+        finally:
+            conn.close()
+        self.wake.set()
+
+    def _new_pool(self, cancel_futures=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=cancel_futures)
+        self._broken = False
+        # Spawned workers avoid forking Streamlit's threads and torch's state
+        self._pool = ProcessPoolExecutor(max_workers=MAX_RUNNING_JOBS,
+                                         mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_worker)
+        if WARM_MODELS:
+            # Workers are spawned on demand; spawn them all now so they warm up before the first job
+            for _ in range(MAX_RUNNING_JOBS):
+                self._pool.submit(os.getpid)
+
+    def _submit(self, conn, job):
+        """Hands a claimed job to the pool; if the pool is unusable the job goes back to the queue."""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._pool.submit(run_job, job["kind"], job["payload"], job["id"])
+        except Exception as e:  # BrokenProcessPool, or RuntimeError once shut down
+            with self._lock:
+                self._in_flight -= 1
+            conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?",
+                         (QUEUED, job["id"], RUNNING))
+            print(f"⚠️ OCR worker pool unusable ({type(e).__name__}: {e}); replacing it")
+            self._broken = True
+            return False
+        future.add_done_callback(lambda f, job_id=job["id"]: self._finish(job_id, f))
+        return True
+
+    def _sweep_checkpoints(self):
+        """Starts a background sweep of expired extraction checkpoints at most once per interval."""
+        if time.monotonic() - self._last_sweep < CHECKPOINT_SWEEP_SECONDS:
+            return
+        self._last_sweep = time.monotonic()
+
+        def sweep():
+            try:
+                from gcvutils.checkpoints import sweep_expired_checkpoints
+                from gcvutils.cloud import get_bucket
+                deleted = sweep_expired_checkpoints(get_bucket())
+                if deleted:
+                    print(f"🧹 Deleted {deleted} expired extraction checkpoint page(s)")
+            except Exception as e:
+                print(f"⚠️ Extraction checkpoint sweep failed: {e}")
+
+        threading.Thread(target=sweep, name="checkpoint-sweep", daemon=True).start()
+
+    def _check_controls(self, conn):
+        """Replaces the pool when restart_workers() was called since the last check."""
+        latest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM worker_controls").fetchone()[0]
+        if self._last_control is not None and latest > self._last_control:
+            print("🔄 Restarting OCR workers on request; running jobs finish on the old ones")
+            self._new_pool(cancel_futures=False)
+        self._last_control = latest
+
+    def _loop(self):
+        self._new_pool()
+        while True:
+            self.wake.wait(timeout=2)
+            self.wake.clear()
+            self._sweep_checkpoints()
+            try:
+                if self._broken:
+                    self._new_pool()
+                conn = _connect()
+                try:
+                    self._check_controls(conn)
+                    while self._in_flight < MAX_RUNNING_JOBS:
+                        job = self._claim(conn)
+                        if job is None or not self._submit(conn, job):
+                            break
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"❌ OCR job dispatcher error: {e}")
+
+
+_dispatcher = _Dispatcher()
@@ -0,0 +1,235 @@
+"""
+Filesystem-backed stand-in for a google.cloud.storage Bucket.
+
+Implements the subset of the Bucket/Blob API the app uses (blob, get_blob,
+list_blobs, upload/download/exists/reload/delete, generation preconditions),
+so local development, tests and benchmarks can run without GCS. Objects live
+under <root>/objects and their metadata under <root>/meta.
+"""
+import base64
+import fnmatch
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gexc
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+
+class _WriteLock:
+    """Serialises writes across threads and, where flock exists, across processes."""
+
+    def __init__(self, path):
+        self._path = path
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            self._file = open(self._path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._thread_lock.release()
+
+
+_BYTES_STAT = {"downloads": "bytes_downloaded", "uploads": "bytes_uploaded"}
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.generation = None
+        self.metageneration = None
+        self.size = None
+        self.md5_hash = None
+        self.crc32c = None
+        self.content_type = None
+        self.updated = None
+
+    # -- metadata -----------------------------------------------------------
+    def _load_meta(self):
+        meta = self.bucket._read_meta(self.name)
+        if meta is None:
+            return False
+        self.generation = meta["generation"]
+        self.metageneration = 1
+        self.size = meta["size"]
+        self.md5_hash = meta["md5_hash"]
+        self.crc32c = meta.get("crc32c")
+        self.content_type = meta.get("content_type")
+        self.updated = datetime.fromtimestamp(meta["updated"], tz=timezone.utc)
+        return True
+
+    def exists(self, **kwargs):
+        self.bucket._simulate_latency()
+        self.bucket._count("metadata")
+        return self.bucket._read_meta(self.name) is not None
+
+    def reload(self, **kwargs):
+        self.bucket._simulate_latency()
+        self.bucket._count("metadata")
+        if not self._load_meta():
+            raise gexc.NotFound(f"No such object: {self.bucket.name}/{self.name}")
+
+    # -- downloads ------------------------------------------------------------
+    def download_as_bytes(self, if_generation_match=None, **kwargs):
+        self.bucket._simulate_latency()
+        if not self._load_meta():
+            raise gexc.NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        if if_generation_match is not None and if_generation_match != self.generation:
+            raise gexc.PreconditionFailed(f"Generation mismatch for {self.name}")
+        with open(self.bucket._object_path(self.name), "rb") as f:
+            data = f.read()
+        self.bucket._count("downloads", len(data))
+        return data
+
+    def download_as_text(self, encoding="utf-8", **kwargs):
+        return self.download_as_bytes(**kwargs).decode(encoding)
+
+    def download_to_file(self, file_obj, **kwargs):
+        file_obj.write(self.download_as_bytes(**kwargs))
+
+    def download_to_filename(self, filename, **kwargs):
+        with open(filename, "wb") as f:
+            self.download_to_file(f, **kwargs)
+
+    # -- uploads --------------------------------------------------------------
+    def upload_from_string(self, data, content_type=None, if_generation_match=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket._simulate_latency()
+        self.bucket._write(self, data, content_type, if_generation_match)
+
+    def upload_from_file(self, file_obj, content_type=None, if_generation_match=None, **kwargs):
+        self.upload_from_string(file_obj.read(), content_type=content_type,
+                                if_generation_match=if_generation_match)
+
+    def upload_from_filename(self, filename, content_type=None, if_generation_match=None, **kwargs):
+        with open(filename, "rb") as f:
+            self.upload_from_file(f, content_type=content_type, if_generation_match=if_generation_match)
+
+    def delete(self, if_generation_match=None, **kwargs):
+        self.bucket._simulate_latency()
+        self.bucket._delete(self.name, if_generation_match)
+
+
+class LocalBucket:
+    def __init__(self, root, latency_seconds=0.0):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.name = os.path.basename(self.root) or "local"
+        self.latency_seconds = latency_seconds
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "meta"), exist_ok=True)
+        self._lock = _WriteLock(os.path.join(self.root, ".lock"))
+        self._stats_lock = threading.Lock()
+        # Request counts and bytes moved, for benchmarks
+        self.stats = {"downloads": 0, "bytes_downloaded": 0, "uploads": 0, "bytes_uploaded": 0,
+                      "metadata": 0, "listings": 0}
+
+    def _count(self, name, size=None):
+        with self._stats_lock:
+            self.stats[name] += 1
+            if size is not None:
+                self.stats[_BYTES_STAT[name]] += size
+
+    def _simulate_latency(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _object_path(self, name):
+        return os.path.join(self.root, "objects", *name.split("/"))
+
+    def _meta_path(self, name):
+        return os.path.join(self.root, "meta", *name.split("/")) + ".json"
+
+    def _read_meta(self, name):
+        try:
+            with open(self._meta_path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _atomic_write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write(self, blob, data, content_type, if_generation_match):
+        with self._lock:
+            current = self._read_meta(blob.name)
+            current_generation = current["generation"] if current else 0
+            if if_generation_match is not None and if_generation_match != current_generation:
+                raise gexc.PreconditionFailed(f"Generation mismatch for {blob.name}")
+            meta = {
+                "generation": max(time.time_ns() // 1000, current_generation + 1),
+                "size": len(data),
+                "md5_hash": base64.b64encode(hashlib.md5(data).digest()).decode(),
+                "crc32c": (base64.b64encode(google_crc32c.Checksum(data).digest()).decode()
+                           if google_crc32c is not None else None),
+                "content_type": content_type or "application/octet-stream",
+                "updated": time.time(),
+            }
+            self._atomic_write(self._object_path(blob.name), data)
+            self._atomic_write(self._meta_path(blob.name), json.dumps(meta).encode())
+        self._count("uploads", len(data))
+        blob._load_meta()
+
+    def _delete(self, name, if_generation_match):
+        with self._lock:
+            current = self._read_meta(name)
+            if current is None:
+                raise gexc.NotFound(f"No such object: {self.name}/{name}")
+            if if_generation_match is not None and if_generation_match != current["generation"]:
+                raise gexc.PreconditionFailed(f"Generation mismatch for {name}")
+            os.remove(self._meta_path(name))
+            os.remove(self._object_path(name))
+
+    def blob(self, name, **kwargs):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name, **kwargs):
+        self._simulate_latency()
+        self._count("metadata")
+        blob = LocalBlob(self, name)
+        return blob if blob._load_meta() else None
+
+    def list_blobs(self, prefix=None, match_glob=None, **kwargs):
+        self._simulate_latency()
+        self._count("listings")
+        meta_root = os.path.join(self.root, "meta")
+        names = []
+        for directory, _, files in os.walk(meta_root):
+            for filename in files:
+                if filename.endswith(".json"):
+                    rel = os.path.relpath(os.path.join(directory, filename), meta_root)
+                    names.append(rel[:-len(".json")].replace(os.sep, "/"))
+        for name in sorted(names):
+            if prefix and not name.startswith(prefix):
+                continue
+            if match_glob and not fnmatch.fnmatchcase(name, match_glob.replace("**", "*")):
+                continue
+            blob = LocalBlob(self, name)
+            if blob._load_meta():
+                yield blob
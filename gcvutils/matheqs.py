@@ -1,68 +1,186 @@
-import fitz  # PyMuPDF
 from PIL import Image
-from io import BytesIO
-from pix2text import Pix2Text
-from pix2tex.cli import LatexOCR
-from google.cloud import storage
-from google.oauth2 import service_account
 import streamlit as st
 import os
+from gcvutils.model_registry import ModelRegistry
+from gcvutils.model_store import ModelStore
+from gcvutils.inference import INFERENCE_BACKEND, ensure_threads, prepare_model
+from gcvutils.rasterize import (LAYOUT_DPI, FORMULA_DPI, open_pdf, iter_pdf_pages, render_page,
+                                make_page_cropper, prefetch, fitz_lock)
+from gcvutils.ocr_cache import page_cache, page_cache_key, enable_shared_tier
+from gcvutils.page_routing import ROUTE_OCR, ROUTE_TEXT, route_page, log_routing
+from gcvutils.tracing import span
+from gcvutils.checkpoints import PageCheckpoint
+
+from gcvutils.cloud import get_bucket
 
 # Setup GCS access
-credentials = service_account.Credentials.from_service_account_info(st.secrets["google_credentials"])
-bucket_name = st.secrets["gcs"]["bucket_name"]
-client = storage.Client(credentials=credentials)
-bucket = client.bucket(bucket_name)
-
-# Persistent directory for models
-PIX2TEXT_MODEL_DIR = os.path.expanduser("model/pix2text/breezedeus-Pix2Text")
-LATEXOCR_MODEL_PATH = os.path.expanduser("~/.streamlit/latexocr/weights.pth")
-
-def ensure_pix2text_model():
-    expected_files = ["config.json", "model.safetensors"]  # Adjust as per model contents
-    missing_files = [f for f in expected_files if not os.path.exists(os.path.join(PIX2TEXT_MODEL_DIR, f))]
-    if missing_files:
-        st.info("📦 Downloading Pix2Text model files from GCS...")
-        for blob in bucket.list_blobs(prefix="models/pix2text/breezedeus-Pix2Text/"):
-            rel_path = blob.name.replace("models/pix2text/breezedeus-Pix2Text/", "")
-            if rel_path:
-                local_path = os.path.join(PIX2TEXT_MODEL_DIR, rel_path)
-                os.makedirs(os.path.dirname(local_path), exist_ok=True)
-                blob.download_to_filename(local_path)
-        st.success("✅ Pix2Text model files downloaded.")
-
-def ensure_latexocr_model():
-    if not os.path.exists(LATEXOCR_MODEL_PATH):
-        st.info("📦 Downloading LatexOCR weights from GCS...")
-        latexocr_blob = bucket.blob("models/latexocr/weights.pth")
-        os.makedirs(os.path.dirname(LATEXOCR_MODEL_PATH), exist_ok=True)
-        latexocr_blob.download_to_filename(LATEXOCR_MODEL_PATH)
-        st.success("✅ LatexOCR weights downloaded.")
+bucket = get_bucket()
+enable_shared_tier(bucket)
+
+# Part of the OCR cache key; bump when models or post-processing change
+MATH_OCR_ENGINE = "pix2text+latexocr"
+MATH_OCR_ENGINE_VERSION = f"pix2text-0.3/region-batch-2/{INFERENCE_BACKEND}"
+
+# Model artifacts in the bucket, mirrored once per machine into the shared local model store
+PIX2TEXT_MODEL_PREFIX = "models/pix2text/breezedeus-Pix2Text/"
+LATEXOCR_MODEL_PREFIX = "models/latexocr/"
+model_store = ModelStore(bucket)
+
+# pix2text/pix2tex pull in torch, so they are imported only when a model is first built
+def _load_pix2text():
+    ensure_threads()
+    from pix2text import Pix2Text
+    model_dir = model_store.ensure("pix2text", PIX2TEXT_MODEL_PREFIX)
+    return prepare_model("pix2text", Pix2Text(model_dir=model_dir, use_fast=True))
+
+def _load_latexocr():
+    ensure_threads()
+    from pix2tex.cli import LatexOCR
+    weights_path = os.path.join(model_store.ensure("latexocr", LATEXOCR_MODEL_PREFIX), "weights.pth")
+    return prepare_model("latexocr", LatexOCR(weights_path=weights_path))
+
+# Shared by every job in this process; models are built on first use
+model_registry = ModelRegistry({
+    "pix2text": _load_pix2text,
+    "latexocr": _load_latexocr,
+})
 
 def init_models():
+    """Returns the shared (Pix2Text, LatexOCR) pair, loading them once per process."""
     try:
-        ensure_pix2text_model()
-        p2t = Pix2Text(model_dir=PIX2TEXT_MODEL_DIR, use_fast=True)
-        st.success("✅ Pix2Text model loaded successfully.")
+        p2t = model_registry.get("pix2text")
     except Exception as e:
         st.error(f"❌ Pix2Text failed to load: {e}")
         p2t = None
 
     try:
-        ensure_latexocr_model()
-        latexocr = LatexOCR(weights_path=LATEXOCR_MODEL_PATH)
-        st.success("✅ LatexOCR model loaded successfully.")
+        latexocr = model_registry.get("latexocr")
     except Exception as e:
         st.error(f"❌ LatexOCR failed to load: {e}")
         latexocr = None
 
     return p2t, latexocr
 
+# Pix2Text labels formulas 'formula' or, by layout, 'isolated' (display) and 'embedding' (inline)
+FORMULA_TYPES = ('formula', 'isolated', 'embedding')
+
 def clean_latex_string(latex):
     return latex.replace(r'\left', '').replace(r'\right', '')
 
-def extract_text_and_latex(image, p2t_model, latexocr_model):
-    full_text = ""
+def formula_box(item, image_size, margin=4):
+    """Returns the (left, top, right, bottom) crop box of a Pix2Text item, or None if it has no position."""
+    position = item.get('position')
+    if position is None:
+        return None
+    points = [(float(p[0]), float(p[1])) for p in position]
+    if not points:
+        return None
+    width, height = image_size
+    left = max(int(min(x for x, _ in points)) - margin, 0)
+    top = max(int(min(y for _, y in points)) - margin, 0)
+    right = min(int(max(x for x, _ in points)) + margin, width)
+    bottom = min(int(max(y for _, y in points)) + margin, height)
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right, bottom
+
+def _latexocr_input(latexocr_model, crop):
+    """
+    The image LatexOCR.__call__ would feed the model for crop: padded, fitted to the
+    model's size limits and, with the image resizer, rescaled until the resizer agrees.
+    """
+    import numpy as np
+    import torch
+    from pix2tex.cli import minmax_size
+    from pix2tex.dataset.transforms import test_transform
+    from pix2tex.utils import pad
+
+    args = latexocr_model.args
+    img = minmax_size(pad(crop), args.max_dimensions, args.min_dimensions)
+    if latexocr_model.image_resizer is None or args.no_resize:
+        return pad(img).convert("RGB")
+    input_image = img.convert("RGB").copy()
+    r, w, h = 1, input_image.size[0], input_image.size[1]
+    with torch.no_grad():
+        for _ in range(10):
+            h = int(h * r)
+            resample = Image.Resampling.BILINEAR if r > 1 else Image.Resampling.LANCZOS
+            img = pad(minmax_size(input_image.resize((w, h), resample), args.max_dimensions, args.min_dimensions))
+            t = test_transform(image=np.array(img.convert("RGB")))['image'][:1].unsqueeze(0)
+            w = (latexocr_model.image_resizer(t.to(args.device)).argmax(-1).item() + 1) * 32
+            if w == img.size[0]:
+                break
+            r = w / img.size[0]
+    return img.convert("RGB")
+
+def _latexocr_batch(latexocr_model, crops):
+    """
+    Runs all formula crops through LatexOCR in a single forward pass.
+
+    Each crop is prepared exactly as LatexOCR.__call__ does (see _latexocr_input),
+    then pasted onto a white canvas padded to a multiple of 32 so they can be
+    stacked into one batch. check_latexocr_batch compares the two paths.
+    """
+    import numpy as np
+    import torch
+    from pix2tex.dataset.transforms import test_transform
+    from pix2tex.utils import post_process, token2str
+
+    args = latexocr_model.args
+    prepared = [_latexocr_input(latexocr_model, crop) for crop in crops]
+    width = -(-max(img.size[0] for img in prepared) // 32) * 32
+    height = -(-max(img.size[1] for img in prepared) // 32) * 32
+    tensors = []
+    for img in prepared:
+        canvas = Image.new("RGB", (width, height), (255, 255, 255))
+        canvas.paste(img, (0, 0))
+        tensors.append(test_transform(image=np.array(canvas))['image'][:1])
+    batch = torch.stack(tensors).to(args.device)
+    with torch.no_grad():
+        decoded = latexocr_model.model.generate(batch, temperature=args.get('temperature', .25))
+    return [post_process(text) for text in token2str(decoded, latexocr_model.tokenizer)]
+
+def check_latexocr_batch(latexocr_model, crops, temperature=1e-4):
+    """
+    Returns (index, batched, single) for every crop whose batched LaTeX differs from
+    LatexOCR's own call. LatexOCR samples its tokens, so both paths run at a near-zero
+    temperature (effectively greedy) to make them comparable.
+    """
+    args = latexocr_model.args
+    saved = args.get('temperature')
+    args.temperature = temperature
+    try:
+        batched = _latexocr_batch(latexocr_model, crops)
+        single = [latexocr_model(crop) for crop in crops]
+    finally:
+        if saved is None:
+            del args['temperature']
+        else:
+            args.temperature = saved
+    return [(i, b, s) for i, (b, s) in enumerate(zip(batched, single)) if b != s]
+
+def recognize_formulas(latexocr_model, crops):
+    """Returns LaTeX for each crop, batched when possible and one by one otherwise."""
+    if not crops:
+        return []
+    try:
+        return _latexocr_batch(latexocr_model, crops)
+    except Exception as e:
+        print(f"⚠️ Batched LatexOCR failed, falling back to per-formula inference: {e}")
+    results = []
+    for crop in crops:
+        try:
+            results.append(latexocr_model(crop))
+        except Exception as e:
+            st.error(f"❌ LatexOCR failed on formula: {e}")
+            results.append(None)
+    return results
+
+def extract_text_and_latex(image, p2t_model, latexocr_model, crop_formula=None):
+    """
+    Recognizes one page. crop_formula, if given, maps a formula box in image
+    pixels to a (typically higher resolution) image of that region.
+    """
     try:
         extracted = p2t_model.recognize(image)
         st.write("🔍 Raw Pix2Text Output:", extracted)
@@ -70,81 +188,154 @@ def extract_text_and_latex(image, p2t_model, latexocr_model):
         st.error(f"❌ Pix2Text recognition failed: {e}")
         return "[Pix2Text recognition error]"
 
-    if isinstance(extracted, list):
-        for item in extracted:
-            if item['type'] == 'text':
-                full_text += item['text'].strip() + "\n"
-            elif item['type'] == 'formula' and latexocr_model:
-                try:
-                    latex = latexocr_model(image)
-                    cleaned_latex = clean_latex_string(latex)
-                    full_text += cleaned_latex.strip() + "\n"
-                except Exception as e:
-                    st.error(f"❌ LatexOCR failed on formula: {e}")
-    elif isinstance(extracted, dict):
-        if extracted.get('type') == 'text':
-            full_text += extracted['text'].strip() + "\n"
-        elif extracted.get('type') == 'formula' and latexocr_model:
-            try:
-                latex = latexocr_model(image)
-                cleaned_latex = clean_latex_string(latex)
-                full_text += cleaned_latex.strip() + "\n"
-            except Exception as e:
-                st.error(f"❌ LatexOCR failed on formula: {e}")
-    elif isinstance(extracted, str):
-        full_text += extracted.strip() + "\n"
-    else:
-        full_text += "[Unsupported format]\n"
-
-    return full_text.strip()
+    if isinstance(extracted, str):
+        return extracted.strip()
+    if isinstance(extracted, dict):
+        extracted = [extracted]
+    if not isinstance(extracted, list):
+        return "[Unsupported format]"
+
+    # Crop every detected formula so LatexOCR sees the formula, not the whole page
+    lines = [None] * len(extracted)
+    formula_indices, crops = [], []
+    for i, item in enumerate(extracted):
+        if item.get('type') == 'text':
+            lines[i] = item.get('text', '')
+        elif item.get('type') in FORMULA_TYPES:
+            lines[i] = item.get('text', '')  # Pix2Text's own LaTeX, used if LatexOCR is unavailable
+            box = formula_box(item, image.size)
+            if latexocr_model and box:
+                formula_indices.append(i)
+                crops.append(crop_formula(box) if crop_formula else image.crop(box))
+
+    # One batched pass over all crops, results written back in reading order
+    for i, latex in zip(formula_indices, recognize_formulas(latexocr_model, crops)):
+        if latex:
+            lines[i] = clean_latex_string(latex)
+
+    return "\n".join(line.strip() for line in lines if line and line.strip())
 
 def download_pdf_from_gcs(pdf_blob_path):
     blob = bucket.blob(pdf_blob_path)
     if not blob.exists():
         raise FileNotFoundError(f"📁 GCS blob not found: {pdf_blob_path}")
-    return blob.download_as_bytes()
+    with span("download", blob=pdf_blob_path) as s:
+        pdf_bytes = blob.download_as_bytes()
+        s["bytes"] = len(pdf_bytes)
+    return pdf_bytes
 
-def convert_pdf_bytes_to_images(pdf_bytes, dpi=500):
-    images = []
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+def convert_pdf_bytes_to_images(pdf_bytes, dpi=LAYOUT_DPI, ocr_pages_only=False):
+    """
+    Renders every page into memory. Prefer iter_pdf_pages for long documents.
+    With ocr_pages_only, typed and blank pages are skipped (see iter_routed_pages).
+    """
+    doc = open_pdf(pdf_bytes)
     st.info(f"📄 PDF loaded with {len(doc)} pages")
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        pix = page.get_pixmap(dpi=dpi)
-        img_data = pix.tobytes("png")
-        image = Image.open(BytesIO(img_data)).convert("RGB")
-        images.append(image)
-    return images
-
-def process_pdf_from_gcs_to_text(pdf_blob_path):
+    if ocr_pages_only:
+        return [image for *_, image in iter_routed_pages(doc, dpi=dpi) if image is not None]
+    return [image for _, _, image in iter_pdf_pages(doc, dpi=dpi)]
+
+def iter_routed_pages(doc, dpi=LAYOUT_DPI, skip=()):
+    """
+    Yields (page_number, page, route, text, reason, image) one page at a time.
+    Only pages routed to OCR are rendered; image is None for the others. Pages in
+    skip (already extracted) are neither routed nor rendered and yield only their number.
+    """
+    with fitz_lock:
+        page_count = len(doc)
+    for page_num in range(page_count):
+        if page_num in skip:
+            yield page_num, None, ROUTE_OCR, None, "restored from checkpoint", None
+            continue
+        with fitz_lock:
+            page = doc.load_page(page_num)
+        with span("rasterize", engine=MATH_OCR_ENGINE, page=page_num + 1, dpi=dpi) as s:
+            route, text, reason = route_page(page)
+            image = render_page(page, dpi) if route == ROUTE_OCR else None
+            s["route"] = route
+        yield page_num, page, route, text, reason, image
+
+def process_pdf_from_gcs_to_text(pdf_blob_path, title, username):
+    """
+    Extracts text and LaTeX from every page of the PDF and uploads it; returns the
+    blob path of the text. Each OCR'd page is checkpointed as soon as it is done, so
+    if a page (or the upload) fails the error is raised and a retry of the same PDF
+    resumes at the first page that is still missing. The checkpoint is only deleted
+    once the text has been stored.
+    """
     try:
         pdf_bytes = download_pdf_from_gcs(pdf_blob_path)
         st.info(f"📥 PDF downloaded from GCS: {len(pdf_bytes)} bytes")
-        images = convert_pdf_bytes_to_images(pdf_bytes)
-        st.success(f"🖼️ {len(images)} page(s) converted to images.")
 
-        p2t, latexocr = init_models()
-        if not p2t:
-            return "[Pix2Text failed to initialize]"
+        doc = open_pdf(pdf_bytes)
+        with fitz_lock:
+            page_count = len(doc)
+        st.info(f"📄 PDF loaded with {page_count} pages")
+        checkpoint = PageCheckpoint(bucket, MATH_OCR_ENGINE, MATH_OCR_ENGINE_VERSION, pdf_bytes)
 
+        # Pages are routed and rendered on a background thread while the previous page
+        # is OCR'd; only a couple of pages are ever held in memory. The models are
+        # loaded on the first page that actually needs OCR.
         full_text = ""
-        for i, img in enumerate(images):
+        cached_pages = 0
+        routes = {}
+        p2t = latexocr = None
+        for i, page, route, text, reason, img in prefetch(iter_routed_pages(doc, dpi=LAYOUT_DPI,
+                                                                           skip=set(checkpoint.pages))):
+            routes[i] = (route, reason)
+            if i in checkpoint:
+                result = checkpoint.get(i)
+                st.text_area(f"📄 Extracted Text - Page {i+1} (checkpoint)", result, height=200)
+                full_text += result + "\n\n"
+                continue
+            if route != ROUTE_OCR:
+                if route == ROUTE_TEXT:
+                    st.text_area(f"📄 Extracted Text - Page {i+1} (text layer)", text, height=200)
+                    full_text += text + "\n\n"
+                continue
+
             st.image(img, caption=f"Page {i+1} Preview", use_column_width=True)
-            result = extract_text_and_latex(img, p2t, latexocr)
+            cache_key = page_cache_key(img.tobytes(), MATH_OCR_ENGINE, MATH_OCR_ENGINE_VERSION,
+                                       f"{LAYOUT_DPI}/{FORMULA_DPI}")
+            result = page_cache.get(cache_key)
+            if result is None:
+                if p2t is None:
+                    p2t, latexocr = init_models()
+                    if not p2t:
+                        # Keep the pages done so far; the retry resumes here
+                        raise RuntimeError(f"Page {i+1}: Pix2Text failed to initialize")
+                crop_formula = make_page_cropper(page, LAYOUT_DPI, FORMULA_DPI)
+                with span("ocr", engine=MATH_OCR_ENGINE, page=i + 1, pages=1):
+                    result = extract_text_and_latex(img, p2t, latexocr, crop_formula=crop_formula)
+                if result.startswith("[Pix2Text"):
+                    # Keep the pages done so far; the retry resumes here
+                    raise RuntimeError(f"Page {i+1}: {result}")
+                page_cache.put(cache_key, result)
+            else:
+                cached_pages += 1
+            checkpoint.put(i, result)
             st.text_area(f"📄 Extracted Text - Page {i+1}", result, height=200)
             full_text += result + "\n\n"
+            del img
 
+        counts = log_routing(routes, page_count)
+        print(f"♻️ OCR cache: {cached_pages}/{counts[ROUTE_OCR]} OCR page(s) reused, "
+              f"{checkpoint.resumed} restored from checkpoint")
         if not full_text.strip():
             st.warning("⚠️ No text extracted from any page.")
 
-        return full_text.strip()
+        blob_path = upload_extracted_text_to_gcs(full_text.strip(), title, username)
+        checkpoint.clear()
+        return blob_path
     except Exception as e:
+        # Fails the job rather than storing an error marker as the student's answer
         st.error(f"❌ Error during PDF processing: {e}")
-        return "[Error processing PDF]"
+        raise
 
 def upload_extracted_text_to_gcs(output_text, title, username):
     blob_path = f"extracted_texts/{title.replace(' ', '_')}/{username}_extractedtext.txt"
     blob = bucket.blob(blob_path)
-    blob.upload_from_string(output_text, content_type="text/plain")
+    with span("gcs_write", blob=blob_path, bytes=len(output_text.encode("utf-8"))):
+        blob.upload_from_string(output_text, content_type="text/plain")
     st.success(f"✅ Uploaded extracted text to: `{blob_path}`")
     return blob_path
\ No newline at end of file
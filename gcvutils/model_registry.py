@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _current_rss_bytes():
+    """Returns the resident memory of this process in bytes (best effort)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux; it is a peak, not a current value
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for heavy models.
+
+    Each model is built lazily by its loader the first time it is requested and
+    then shared by every Streamlit session thread. Loading is guarded by a
+    per-model lock so concurrent sessions never build the same model twice.
+    """
+
+    def __init__(self, loaders):
+        self._loaders = dict(loaders)
+        self._models = {}
+        self._stats = {name: {"loaded": False, "load_count": 0, "load_seconds": None,
+                              "rss_delta_bytes": None, "loaded_at": None, "last_error": None}
+                       for name in self._loaders}
+        self._locks = {name: threading.Lock() for name in self._loaders}
+
+    def names(self):
+        return list(self._loaders)
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def get(self, name):
+        """Returns the model, loading it first if needed. Loader errors propagate."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            # Another session may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+            return self._load_locked(name)
+
+    def _load_locked(self, name):
+        stats = self._stats[name]
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = self._loaders[name]()
+        except Exception as e:
+            stats["last_error"] = str(e)
+            raise
+        stats.update(
+            loaded=True,
+            load_count=stats["load_count"] + 1,
+            load_seconds=round(time.perf_counter() - start, 3),
+            rss_delta_bytes=max(_current_rss_bytes() - rss_before, 0),
+            loaded_at=time.time(),
+            last_error=None,
+        )
+        self._models[name] = model
+        print(f"✅ Model '{name}' loaded in {stats['load_seconds']}s")
+        return model
+
+    def warm(self, names=None):
+        """Loads the given models (all by default), logging instead of raising on failure."""
+        for name in names or self.names():
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"❌ Warm-up of model '{name}' failed: {e}")
+
+    def metrics(self):
+        """Returns a snapshot of per-model load statistics plus current process RSS."""
+        snapshot = {name: dict(stats) for name, stats in self._stats.items()}
+        snapshot["_process"] = {"rss_bytes": _current_rss_bytes()}
+        return snapshot
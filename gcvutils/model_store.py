@@ -0,0 +1,207 @@
+"""
+Versioned local store for the OCR model artifacts kept in the bucket.
+
+    model_dir = model_store.ensure("pix2text", "models/pix2text/breezedeus-Pix2Text/")
+
+An artifact is every object under a bucket prefix. Its manifest (relative path,
+size, MD5/CRC32C, generation) comes from the bucket listing and its version is a
+hash of the manifest, so a re-uploaded model lands in a new directory:
+
+    <EVALMATE_MODEL_STORE>/<name>/<version>/                files, read-only
+    <EVALMATE_MODEL_STORE>/<name>/<version>.manifest.json   written last; marks the version complete
+
+Files are fetched concurrently (large ones as parallel byte ranges), checked
+against the manifest and renamed into place under a per-version file lock, so
+workers that start together download once and never read a partial file. All
+processes open the same files, so memory-mapped weights (safetensors) share one
+copy in the page cache.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gcvutils.tracing import span
+from gcvutils.uploads import file_checksums
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+MODEL_STORE_DIR = os.path.expanduser(os.environ.get("EVALMATE_MODEL_STORE", "~/.streamlit/models"))
+MODEL_DOWNLOAD_WORKERS = int(os.environ.get("EVALMATE_MODEL_DOWNLOAD_WORKERS", 8))
+
+# Files above this size are downloaded as parallel byte ranges (GCS only)
+MODEL_SLICED_THRESHOLD = 64 * 1024 * 1024
+MODEL_SLICE_SIZE = 32 * 1024 * 1024
+
+_MANIFEST_SUFFIX = ".manifest.json"
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+class _FileLock:
+    """Exclusive lock on a path, held across threads and, where flock exists, across processes."""
+
+    def __init__(self, path):
+        self._path = path
+        with _thread_locks_guard:
+            self._thread_lock = _thread_locks.setdefault(path, threading.Lock())
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            self._file = open(self._path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._thread_lock.release()
+
+
+def build_manifest(bucket, prefix):
+    """The files under prefix with their sizes, checksums and generations, plus a version hash of them."""
+    files = {}
+    for blob in bucket.list_blobs(prefix=prefix):
+        rel_path = blob.name[len(prefix):]
+        if rel_path and not rel_path.endswith("/"):
+            files[rel_path] = {"size": blob.size, "md5_hash": blob.md5_hash, "crc32c": blob.crc32c,
+                               "generation": blob.generation}
+    if not files:
+        raise FileNotFoundError(f"No model files under {prefix}")
+    version = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:16]
+    return {"prefix": prefix, "version": version, "files": files}
+
+
+def _verified(path, entry):
+    """True if the file at path has the manifest's size and checksum."""
+    with open(path, "rb") as f:
+        checksums = file_checksums(f)
+    if checksums["size"] != entry["size"]:
+        return False
+    if entry["md5_hash"]:
+        return checksums["md5_hash"] == entry["md5_hash"]
+    if entry["crc32c"] and checksums["crc32c"]:
+        return checksums["crc32c"] == entry["crc32c"]
+    return True
+
+
+def _download_slices(blob, filename, workers):
+    """Downloads blob as concurrent byte ranges if it is a GCS blob; returns False otherwise."""
+    try:
+        from google.cloud.storage import Blob, transfer_manager
+    except ImportError:
+        return False
+    if not isinstance(blob, Blob):
+        return False
+    transfer_manager.download_chunks_concurrently(blob, filename, chunk_size=MODEL_SLICE_SIZE,
+                                                  max_workers=workers, worker_type=transfer_manager.THREAD)
+    return True
+
+
+class ModelStore:
+    """Downloads model artifacts from the bucket once per machine and hands out their local directory."""
+
+    def __init__(self, bucket, root=MODEL_STORE_DIR, workers=MODEL_DOWNLOAD_WORKERS):
+        self.bucket = bucket
+        self.root = root
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.stats = {"downloads": 0, "files": 0, "bytes": 0, "seconds": 0.0, "reused": 0}
+
+    def _marker(self, name, version):
+        return os.path.join(self.root, name, f"{version}{_MANIFEST_SUFFIX}")
+
+    def latest(self, name):
+        """Directory of the most recently completed local version of name, or None."""
+        try:
+            markers = [f for f in os.listdir(os.path.join(self.root, name)) if f.endswith(_MANIFEST_SUFFIX)]
+        except OSError:
+            return None
+        if not markers:
+            return None
+        newest = max(markers, key=lambda f: os.path.getmtime(os.path.join(self.root, name, f)))
+        return os.path.join(self.root, name, newest[:-len(_MANIFEST_SUFFIX)])
+
+    def ensure(self, name, prefix):
+        """
+        Returns the local directory holding the current version of the artifact
+        under prefix, downloading it first if no complete copy exists yet.
+        """
+        try:
+            manifest = build_manifest(self.bucket, prefix)
+        except Exception as e:
+            # Offline or listing denied: a previously completed version is still usable
+            local = self.latest(name)
+            if local is None:
+                raise
+            print(f"⚠️ Could not list {prefix} ({e}); using local model {local}")
+            return local
+
+        directory = os.path.join(self.root, name, manifest["version"])
+        marker = self._marker(name, manifest["version"])
+        if not os.path.exists(marker):
+            os.makedirs(directory, exist_ok=True)
+            with _FileLock(f"{directory}.lock"):
+                # Another worker may have completed this version while we waited for the lock
+                if not os.path.exists(marker):
+                    self._download(name, manifest, directory)
+                    self._write_marker(marker, manifest)
+                    return directory
+        with self._lock:
+            self.stats["reused"] += 1
+        return directory
+
+    def _download(self, name, manifest, directory):
+        # Files already renamed into place were verified by an earlier, interrupted download
+        todo = [(rel_path, entry) for rel_path, entry in manifest["files"].items()
+                if not os.path.exists(os.path.join(directory, rel_path))]
+        size = sum(entry["size"] for _, entry in todo)
+        print(f"📦 Downloading {name} model ({len(todo)} files, {size / 1e6:.0f} MB)...")
+        start = time.perf_counter()
+        with span("download", artifact=name, version=manifest["version"], files=len(todo), bytes=size):
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"model-{name}") as pool:
+                list(pool.map(lambda item: self._fetch(manifest["prefix"] + item[0],
+                                                       os.path.join(directory, item[0]), item[1]), todo))
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.stats["downloads"] += 1
+            self.stats["files"] += len(todo)
+            self.stats["bytes"] += size
+            self.stats["seconds"] += seconds
+        print(f"✅ {name} model downloaded in {seconds:.1f}s to {directory}")
+
+    def _fetch(self, blob_name, path, entry):
+        """Downloads one file next to its destination, verifies it and renames it into place."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        os.close(fd)
+        try:
+            # Pinned to the listed generation, so the file always matches its manifest entry
+            blob = self.bucket.blob(blob_name, generation=entry["generation"])
+            if entry["size"] <= MODEL_SLICED_THRESHOLD or not _download_slices(blob, tmp_path, self.workers):
+                blob.download_to_filename(tmp_path)
+            if not _verified(tmp_path, entry):
+                raise ValueError(f"Checksum mismatch for {blob_name}")
+            os.chmod(tmp_path, 0o444)  # Shared by every worker; nothing may modify it in place
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def _write_marker(marker, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(marker), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, marker)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+# Local tier: one small text file per page result, evicted least-recently-used first
+OCR_CACHE_DIR = os.path.expanduser(os.environ.get("EVALMATE_OCR_CACHE_DIR", "~/.streamlit/ocr_cache"))
+OCR_CACHE_MAX_BYTES = int(os.environ.get("EVALMATE_OCR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Shared tier: same results stored in the bucket so every server benefits
+OCR_CACHE_SHARED = os.environ.get("EVALMATE_OCR_CACHE_SHARED", "0") == "1"
+OCR_CACHE_PREFIX = "ocr_cache/"
+
+
+def page_cache_key(page_bytes, engine, version, dpi):
+    """Content address of one rendered page for a given OCR engine, version and DPI."""
+    h = hashlib.sha256()
+    h.update(f"{engine}\0{version}\0{dpi}\0".encode())
+    h.update(page_bytes)
+    return h.hexdigest()
+
+
+class OcrCache:
+    """Two-tier (local disk LRU + optional bucket) cache of per-page OCR text."""
+
+    def __init__(self, directory=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES, shared_bucket=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.shared_bucket = shared_bucket
+        self._lock = threading.Lock()
+        self._size = None
+        self.stats = {"hits_local": 0, "hits_shared": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        """Returns the cached text for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)  # Marks the entry as recently used
+            self._count("hits_local")
+            return text
+        except OSError:
+            pass
+
+        if self.shared_bucket is not None:
+            try:
+                blob = self.shared_bucket.blob(f"{OCR_CACHE_PREFIX}{key}.txt")
+                text = blob.download_as_text()
+                self._write_local(key, text)
+                self._count("hits_shared")
+                return text
+            except Exception:
+                pass
+
+        self._count("misses")
+        return None
+
+    def put(self, key, text):
+        self._write_local(key, text)
+        self._count("stores")
+        if self.shared_bucket is not None:
+            try:
+                self.shared_bucket.blob(f"{OCR_CACHE_PREFIX}{key}.txt").upload_from_string(
+                    text, content_type="text/plain")
+            except Exception as e:
+                print(f"⚠️ Could not write shared OCR cache entry {key[:12]}: {e}")
+
+    def _write_local(self, key, text):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write OCR cache entry {key[:12]}: {e}")
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(text.encode("utf-8"))
+            if self._size > self.max_bytes:
+                self._evict_locked()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".txt"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _evict_locked(self):
+        """Deletes least recently used entries until the cache is at 90% of its budget."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+                self.stats["evictions"] += 1
+            except OSError:
+                pass
+
+    def hit_rate(self):
+        hits = self.stats["hits_local"] + self.stats["hits_shared"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+# Process-wide instance shared by the Vision and Pix2Text pipelines
+page_cache = OcrCache()
+
+
+def enable_shared_tier(bucket):
+    """Attaches the bucket tier when EVALMATE_OCR_CACHE_SHARED=1."""
+    if OCR_CACHE_SHARED and page_cache.shared_bucket is None:
+        page_cache.shared_bucket = bucket
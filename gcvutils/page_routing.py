@@ -0,0 +1,92 @@
+import os
+
+import fitz  # PyMuPDF
+
+from gcvutils.rasterize import fitz_lock
+
+# Where each page goes before any OCR model sees it
+ROUTE_TEXT = "text"    # Digital page: the embedded text layer is used as is
+ROUTE_BLANK = "blank"  # Nothing written on the page
+ROUTE_OCR = "ocr"      # Scanned or handwritten: rasterize and OCR
+
+# A text layer counts as usable with at least this many characters, of which
+# at most TEXT_MAX_GARBAGE_RATIO may be unmapped glyphs (U+FFFD / private use).
+TEXT_MIN_CHARS = 20
+TEXT_MAX_GARBAGE_RATIO = 0.05
+
+# Pages whose images cover more than this fraction may hold handwriting or a
+# scan, whatever their text layer says, so they are OCR'd.
+IMAGE_MAX_COVERAGE = 0.3
+
+# Tablet handwriting is stored as vector paths or ink annotations
+DRAWING_MAX_PATHS = 200
+
+# EVALMATE_USE_TEXT_LAYER=0 sends every non-blank page to OCR
+USE_TEXT_LAYER = os.environ.get("EVALMATE_USE_TEXT_LAYER", "1") != "0"
+
+
+def _garbage_ratio(text):
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 1.0
+    garbage = sum(1 for c in chars if c == "�" or 0xE000 <= ord(c) <= 0xF8FF)
+    return garbage / len(chars)
+
+
+def _image_coverage(page):
+    page_rect = page.rect
+    page_area = abs(page_rect) or 1.0
+    covered = 0.0
+    for info in page.get_image_info():
+        covered += abs(fitz.Rect(info["bbox"]) & page_rect)
+    return min(covered / page_area, 1.0)
+
+
+def _has_ink_annotations(page):
+    return any(True for _ in page.annots(types=[fitz.PDF_ANNOT_INK]))
+
+
+def route_page(page, use_text_layer=USE_TEXT_LAYER):
+    """
+    Decides how one page should be read.
+
+    Returns (route, text, reason): text is the embedded text for ROUTE_TEXT and
+    an empty string otherwise; reason is a short explanation for the logs.
+    """
+    with fitz_lock:
+        text = page.get_text("text").strip()
+        coverage = _image_coverage(page)
+        drawing_paths = len(page.get_drawings())
+        has_ink = _has_ink_annotations(page)
+
+    if use_text_layer and len(text) >= TEXT_MIN_CHARS:
+        garbage = _garbage_ratio(text)
+        if garbage > TEXT_MAX_GARBAGE_RATIO:
+            return ROUTE_OCR, "", f"text layer unreadable ({garbage:.0%} unmapped glyphs)"
+        if coverage > IMAGE_MAX_COVERAGE:
+            return ROUTE_OCR, "", f"text layer plus images covering {coverage:.0%} of the page"
+        if drawing_paths > DRAWING_MAX_PATHS or has_ink:
+            return ROUTE_OCR, "", "text layer plus hand-drawn strokes"
+        return ROUTE_TEXT, text, f"text layer with {len(text)} characters"
+
+    if not text and coverage == 0 and drawing_paths == 0 and not has_ink:
+        return ROUTE_BLANK, "", "no text, images or drawings"
+
+    if use_text_layer and coverage == 0 and drawing_paths == 0 and not has_ink:
+        # A stray header or page number and nothing else
+        return ROUTE_TEXT, text, f"short text layer ({len(text)} characters) and nothing else"
+    # Any image or stroke may be a handwritten answer, however little ink it has
+    return ROUTE_OCR, "", (f"scanned or handwritten (images cover {coverage:.0%}, "
+                           f"{drawing_paths} drawing paths{', ink annotations' if has_ink else ''})")
+
+
+def log_routing(routes, total_pages):
+    """Prints one line per page and a summary; routes maps page index -> (route, reason)."""
+    counts = {ROUTE_TEXT: 0, ROUTE_BLANK: 0, ROUTE_OCR: 0}
+    for i in range(total_pages):
+        route, reason = routes[i]
+        counts[route] += 1
+        print(f"🧭 Page {i+1}: {route} — {reason}")
+    print(f"🧭 Routing: {counts[ROUTE_TEXT]} text layer, {counts[ROUTE_BLANK]} blank, "
+          f"{counts[ROUTE_OCR]} sent to OCR (of {total_pages})")
+    return counts
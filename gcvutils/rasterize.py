@@ -0,0 +1,118 @@
+import contextvars
+import queue
+import threading
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Per-stage resolutions: Pix2Text only needs a moderate DPI to find the layout,
+# formula crops are re-rendered at high DPI for LatexOCR.
+LAYOUT_DPI = 200
+FORMULA_DPI = 500
+
+# Pages rendered ahead of OCR; bounds peak memory independently of page count
+RENDER_QUEUE_SIZE = 2
+
+# PyMuPDF is not thread-safe, so every call into it goes through this lock.
+# OCR runs outside the lock, which is what lets rendering and OCR overlap.
+fitz_lock = threading.RLock()
+
+
+def open_pdf(pdf_bytes):
+    with fitz_lock:
+        return fitz.open(stream=pdf_bytes, filetype="pdf")
+
+
+def pixmap_to_image(pix):
+    """Wraps a pixmap's raw sample buffer as a PIL image (no PNG encode/decode)."""
+    if pix.n == 1:
+        mode = "L"
+    elif pix.alpha:
+        mode = "RGBA"
+    else:
+        mode = "RGB"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+
+def render_page(page, dpi, clip=None, grayscale=False):
+    """Renders a page (or a clipped region of it) straight into a PIL image."""
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    with fitz_lock:
+        pix = page.get_pixmap(dpi=dpi, clip=clip, colorspace=colorspace, alpha=False)
+        image = pixmap_to_image(pix)
+        del pix
+    return image
+
+
+def iter_pdf_pages(doc, dpi=LAYOUT_DPI, grayscale=False):
+    """Yields (page_number, page, image) one page at a time."""
+    with fitz_lock:
+        page_count = len(doc)
+    for page_num in range(page_count):
+        with fitz_lock:
+            page = doc.load_page(page_num)
+        yield page_num, page, render_page(page, dpi, grayscale=grayscale)
+
+
+def make_page_cropper(page, source_dpi=LAYOUT_DPI, target_dpi=FORMULA_DPI):
+    """
+    Returns a function mapping a (left, top, right, bottom) box in pixels of an
+    image rendered at source_dpi to a fresh render of that region at target_dpi.
+    """
+    scale = 72.0 / source_dpi
+
+    def crop(box):
+        left, top, right, bottom = box
+        clip = fitz.Rect(left * scale, top * scale, right * scale, bottom * scale)
+        with fitz_lock:
+            clip &= page.rect
+        return render_page(page, target_dpi, clip=clip)
+
+    return crop
+
+
+def prefetch(iterable, maxsize=RENDER_QUEUE_SIZE):
+    """
+    Consumes iterable on a background thread and yields its items through a
+    bounded queue, so the producer works at most maxsize items ahead.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((None, item)):
+                    return
+        except BaseException as e:
+            put((e, None))
+            return
+        put((None, done))
+
+    # The producer runs in the caller's context, so e.g. trace attributes carry over
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                              name="pdf-render", daemon=True)
+    worker.start()
+    try:
+        while True:
+            error, item = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # Unblocks the producer if the consumer stops early
+        stop.set()
+        worker.join(timeout=5)
@@ -0,0 +1,268 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+from google.api_core import exceptions as gexc
+
+from gcvutils.tracing import span
+
+# Backend selection: "gcs" (one object per record) or "sqlite" (local deployments)
+RECORD_STORE_BACKEND = os.environ.get("EVALMATE_STORE", "gcs")
+RECORD_STORE_PATH = os.path.expanduser(os.environ.get("EVALMATE_STORE_PATH", "~/.streamlit/records.sqlite3"))
+RECORDS_PREFIX = "records/"
+
+# Attempts at a read-modify-write (or a consistent read) before giving up on a hot record
+MAX_UPDATE_ATTEMPTS = 8
+
+# Marks the one-time import of the legacy whole-file catalogue as done
+MIGRATION_KIND = "meta"
+MIGRATION_KEY = "legacy_catalogue_migration"
+
+
+class ConflictError(Exception):
+    """Raised when a record changed between read and write."""
+
+
+class RecordStore(ABC):
+    """
+    Keyed JSON records grouped by kind ("assignments", "submissions", ...).
+
+    Every write touches one record only and is conditional on the generation that
+    was read, so concurrent writers never overwrite each other silently.
+    """
+
+    @abstractmethod
+    def get(self, kind, key):
+        """Returns (record, generation); (None, 0) when the record does not exist."""
+
+    @abstractmethod
+    def put(self, kind, key, record, generation):
+        """Writes record if its current generation is still `generation` (0 = must not exist)."""
+
+    @abstractmethod
+    def delete(self, kind, key, generation=None):
+        """Deletes the record, if its generation is still `generation` when one is given."""
+
+    @abstractmethod
+    def list(self, kind):
+        """Returns {key: record} for every record of kind."""
+
+    def update(self, kind, key, mutate):
+        """
+        Applies mutate(current_record_or_None) -> new record (None deletes) and
+        writes it conditionally, re-reading and retrying on conflicts.
+        """
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            current, generation = self.get(kind, key)
+            new = mutate(json.loads(json.dumps(current)) if current is not None else None)
+            try:
+                if new is None:
+                    if current is not None:
+                        self.delete(kind, key, generation)
+                else:
+                    self.put(kind, key, new, generation)
+                return new
+            except ConflictError:
+                continue
+        raise ConflictError(f"{kind}/{key} kept changing; gave up after {MAX_UPDATE_ATTEMPTS} attempts")
+
+
+class GcsRecordStore(RecordStore):
+    """One JSON object per record under records/<kind>/, guarded by generation preconditions."""
+
+    def __init__(self, bucket, prefix=RECORDS_PREFIX, download_workers=8):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.download_workers = download_workers
+        self._lock = threading.Lock()
+        # Incremental index: kind -> {key: (generation, record)}; only changed records are re-downloaded
+        self._index = {}
+
+    def _name(self, kind, key):
+        return f"{self.prefix}{kind}/{quote(key, safe='')}.json"
+
+    def _remember(self, kind, key, generation, record):
+        with self._lock:
+            entries = self._index.setdefault(kind, {})
+            if record is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = (generation, record)
+
+    def get(self, kind, key):
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            blob = self.bucket.get_blob(self._name(kind, key))
+            if blob is None:
+                return None, 0
+            try:
+                record = json.loads(blob.download_as_text(if_generation_match=blob.generation))
+            except (gexc.PreconditionFailed, gexc.NotFound):
+                continue  # Replaced or deleted between the metadata read and the download
+            self._remember(kind, key, blob.generation, record)
+            return record, blob.generation
+        raise ConflictError(f"{kind}/{key} kept changing; gave up reading after {MAX_UPDATE_ATTEMPTS} attempts")
+
+    def put(self, kind, key, record, generation):
+        blob = self.bucket.blob(self._name(kind, key))
+        data = json.dumps(record, indent=4)
+        try:
+            with span("gcs_write", blob=blob.name, bytes=len(data.encode("utf-8"))):
+                blob.upload_from_string(data, content_type="application/json", if_generation_match=generation)
+        except gexc.PreconditionFailed as e:
+            raise ConflictError(f"{kind}/{key} was modified concurrently") from e
+        self._remember(kind, key, blob.generation, record)
+
+    def delete(self, kind, key, generation=None):
+        blob = self.bucket.blob(self._name(kind, key))
+        try:
+            blob.delete(if_generation_match=generation)
+        except gexc.NotFound:
+            pass
+        except gexc.PreconditionFailed as e:
+            raise ConflictError(f"{kind}/{key} was modified concurrently") from e
+        self._remember(kind, key, None, None)
+
+    def _download(self, blob):
+        try:
+            return blob, json.loads(blob.download_as_text(if_generation_match=blob.generation))
+        except (gexc.NotFound, gexc.PreconditionFailed):
+            return blob, None  # Changed or deleted mid-listing; picked up on the next list
+
+    def list(self, kind):
+        prefix = f"{self.prefix}{kind}/"
+        listed = {unquote(b.name[len(prefix):-len(".json")]): b
+                  for b in self.bucket.list_blobs(prefix=prefix) if b.name.endswith(".json")}
+        with self._lock:
+            known = dict(self._index.get(kind, {}))
+
+        changed = [b for key, b in listed.items() if key not in known or known[key][0] != b.generation]
+        fresh = {}
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.download_workers) as pool:
+                for blob, record in pool.map(self._download, changed):
+                    if record is not None:
+                        fresh[unquote(blob.name[len(prefix):-len(".json")])] = (blob.generation, record)
+
+        entries = {}
+        for key, blob in listed.items():
+            if key in fresh:
+                entries[key] = fresh[key]
+            elif key in known and known[key][0] == blob.generation:
+                entries[key] = known[key]
+        with self._lock:
+            self._index[kind] = entries
+        return {key: record for key, (_, record) in entries.items()}
+
+
+class SqliteRecordStore(RecordStore):
+    """Records in a local SQLite file; the row version plays the role of the GCS generation."""
+
+    def __init__(self, path=RECORD_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS records (
+                                kind TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                version INTEGER NOT NULL,
+                                data TEXT NOT NULL,
+                                PRIMARY KEY (kind, key))""")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, kind, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, version FROM records WHERE kind = ? AND key = ?",
+                               (kind, key)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def put(self, kind, key, record, generation):
+        data = json.dumps(record)
+        with self._connect() as conn:
+            if generation == 0:
+                try:
+                    conn.execute("INSERT INTO records (kind, key, version, data) VALUES (?, ?, 1, ?)",
+                                 (kind, key, data))
+                except sqlite3.IntegrityError as e:
+                    raise ConflictError(f"{kind}/{key} already exists") from e
+            else:
+                cur = conn.execute("UPDATE records SET data = ?, version = version + 1 "
+                                   "WHERE kind = ? AND key = ? AND version = ?",
+                                   (data, kind, key, generation))
+                if cur.rowcount == 0:
+                    raise ConflictError(f"{kind}/{key} was modified concurrently")
+
+    def delete(self, kind, key, generation=None):
+        with self._connect() as conn:
+            if generation is None:
+                conn.execute("DELETE FROM records WHERE kind = ? AND key = ?", (kind, key))
+            else:
+                cur = conn.execute("DELETE FROM records WHERE kind = ? AND key = ? AND version = ?",
+                                   (kind, key, generation))
+                if cur.rowcount == 0 and self.get(kind, key)[0] is not None:
+                    raise ConflictError(f"{kind}/{key} was modified concurrently")
+
+    def list(self, kind):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, data FROM records WHERE kind = ?", (kind,)).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+
+def open_record_store(bucket):
+    if RECORD_STORE_BACKEND == "sqlite":
+        return SqliteRecordStore(RECORD_STORE_PATH)
+    return GcsRecordStore(bucket)
+
+
+def record_extracted_submission(store, title, username, pdf_blob_path, extracted_blob_path):
+    """Adds a finished extraction to its assignment record and to the student's submitted titles."""
+    def record_submission(current):
+        if current is not None:
+            submitted = current.setdefault("submitted_files", [])
+            if pdf_blob_path not in submitted:
+                submitted.append(pdf_blob_path)
+            current.setdefault("extracted_texts", {})[username] = extracted_blob_path
+        return current
+
+    def record_title(current):
+        titles = list(current or [])
+        return titles if title in titles else titles + [title]
+
+    store.update("assignments", title, record_submission)
+    store.update("submissions", username, record_title)
+
+
+def migrate_legacy_catalogue(store, load_legacy, assignments_file, submissions_file):
+    """
+    One-time import of the old whole-file assignments/submissions JSON into per-record storage.
+
+    load_legacy(blob_name, default) must return default only when the file does not
+    exist and raise on any other failure: both files are read before anything is
+    written, so a failed read aborts the migration and it is retried on the next start.
+    Records that already exist are kept, so an interrupted import can simply be re-run;
+    a marker record is written once it has completed.
+    """
+    if store.get(MIGRATION_KIND, MIGRATION_KEY)[0] is not None:
+        return False
+    if store.list("assignments") or store.list("submissions"):
+        # Imported before the marker existed
+        store.update(MIGRATION_KIND, MIGRATION_KEY, lambda _: {"migrated": True})
+        return False
+    assignments = load_legacy(assignments_file, [])
+    submissions = load_legacy(submissions_file, {})
+    for position, assignment in enumerate(assignments if isinstance(assignments, list) else []):
+        if assignment.get("title"):
+            assignment.setdefault("created_at", position)
+            store.update("assignments", assignment["title"],
+                         lambda current, a=assignment: a if current is None else current)
+    for username, titles in (submissions if isinstance(submissions, dict) else {}).items():
+        store.update("submissions", username, lambda current, t=titles: list(t) if current is None else current)
+    store.update(MIGRATION_KIND, MIGRATION_KEY, lambda _: {"migrated": True})
+    return True
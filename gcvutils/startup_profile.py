@@ -0,0 +1,87 @@
+"""
+Import-time profile of the modules loaded at app startup.
+
+Each module is imported in a fresh interpreter with `-X importtime`, and the
+slowest imports are written as JSON so startup regressions show up in review:
+
+    python -m gcvutils.startup_profile --output startup_profile.json
+    python -m gcvutils.startup_profile views.LM --budget-seconds 2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# What the login page pulls in; the OCR stack (torch, pix2text) must not appear here
+STARTUP_MODULES = [
+    "streamlit",
+    "views.about_signin",
+    "views.LM",
+    "views.grading",
+    "gcvutils.records",
+    "gcvutils.jobs",
+    "gcvutils.ocr_cache",
+    "gcvutils.blob_cache",
+]
+
+HEAVY_MODULES = ("torch", "pix2text", "pix2tex", "transformers", "cv2")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_import(module, top=15):
+    """Imports module in a subprocess and returns its wall time and the slowest nested imports."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=REPO_ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        imports.append({"module": name.strip(), "self_ms": int(self_us) / 1000,
+                        "cumulative_ms": int(cumulative_us) / 1000})
+
+    loaded = {entry["module"].split(".")[0] for entry in imports}
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "wall_seconds": round(wall, 3),
+        "heavy_modules": sorted(loaded.intersection(HEAVY_MODULES)),
+        "slowest": sorted(imports, key=lambda e: e["cumulative_ms"], reverse=True)[:top],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=STARTUP_MODULES)
+    parser.add_argument("--output", help="Write the profile to this JSON file instead of stdout")
+    parser.add_argument("--budget-seconds", type=float,
+                        help="Exit non-zero if any module takes longer than this to import")
+    args = parser.parse_args(argv)
+
+    results = [profile_import(module) for module in args.modules]
+    report = json.dumps({"python": sys.version.split()[0], "results": results}, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    for result in results:
+        status = "✅" if result["ok"] else "❌"
+        heavy = f" ⚠️ pulls in {', '.join(result['heavy_modules'])}" if result["heavy_modules"] else ""
+        print(f"{status} {result['module']}: {result['wall_seconds']}s{heavy}", file=sys.stderr)
+
+    over_budget = args.budget_seconds is not None and any(
+        r["wall_seconds"] > args.budget_seconds for r in results)
+    return 1 if over_budget or not all(r["ok"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
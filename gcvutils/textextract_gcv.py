@@ -1,64 +1,210 @@
 from google.cloud import vision
-from google.oauth2 import service_account
+from google.api_core import exceptions as gexc
 import fitz  # PyMuPDF
 import streamlit as st
-from google.cloud import storage
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
+import time
+from gcvutils.rasterize import fitz_lock
+from gcvutils.ocr_cache import page_cache, page_cache_key, enable_shared_tier
+from gcvutils.page_routing import ROUTE_OCR, ROUTE_TEXT, route_page, log_routing
+from gcvutils.vision_encoding import encode_page_for_vision
+from gcvutils.tracing import span, propagate
+from gcvutils.checkpoints import PageCheckpoint
 
-# Setup credentials and bucket from Streamlit secrets
-creds = service_account.Credentials.from_service_account_info(st.secrets["google_credentials"])
-bucket_name = st.secrets["gcs"]["bucket_name"]
-client = storage.Client(credentials=creds)
-bucket = client.bucket(bucket_name)
-vision_client = vision.ImageAnnotatorClient(credentials=creds)
+from gcvutils.cloud import get_bucket, get_vision_client, VISION_TIMEOUT_SECONDS
 
-def extract_handwritten_text_from_pdf(gcs_pdf_blob_path, assignment_title, username):
+# Shared bucket handle; the Vision client is created on first use
+bucket = get_bucket()
+enable_shared_tier(bucket)
+
+# Part of the OCR cache key; bump when the Vision request or post-processing changes
+VISION_ENGINE = "gcv-document-text"
+VISION_ENGINE_VERSION = "1"
+
+# Concurrency for Cloud Vision: pages are grouped into batch_annotate_images
+# requests (API limit: 16 images) and groups are sent from a bounded thread pool.
+VISION_MAX_WORKERS = 4
+VISION_BATCH_SIZE = 4
+VISION_MAX_RETRIES = 3
+VISION_BACKOFF_SECONDS = 1.0
+
+# gRPC status codes worth retrying: DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, INTERNAL, UNAVAILABLE
+RETRYABLE_STATUS_CODES = {4, 8, 13, 14}
+RETRYABLE_EXCEPTIONS = (gexc.DeadlineExceeded, gexc.ResourceExhausted, gexc.InternalServerError,
+                        gexc.ServiceUnavailable, gexc.TooManyRequests)
+
+def _backoff(attempt):
+    """Exponential backoff with jitter."""
+    time.sleep(VISION_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+def _annotate_images(vision_client, contents):
+    """Runs DOCUMENT_TEXT_DETECTION over encoded images, one response per image, in order."""
+    if len(contents) == 1:
+        return [vision_client.document_text_detection(image=vision.Image(content=contents[0]),
+                                                      timeout=VISION_TIMEOUT_SECONDS)]
+    feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+    requests = [vision.AnnotateImageRequest(image=vision.Image(content=c), features=[feature])
+                for c in contents]
+    return list(vision_client.batch_annotate_images(requests=requests, timeout=VISION_TIMEOUT_SECONDS).responses)
+
+def ocr_page_group(vision_client, pages, max_retries=VISION_MAX_RETRIES):
+    """
+    OCRs a group of (page_index, image_bytes) pairs in one request.
+    Pages that fail with a transient error are retried with backoff; returns {page_index: text}.
+    """
+    with span("ocr", engine=VISION_ENGINE, pages=len(pages),
+              bytes=sum(len(content) for _, content in pages)):
+        return _ocr_page_group(vision_client, pages, max_retries)
+
+def _ocr_page_group(vision_client, pages, max_retries):
+    results = {}
+    pending = list(pages)
+    for attempt in range(max_retries + 1):
+        try:
+            responses = _annotate_images(vision_client, [content for _, content in pending])
+        except RETRYABLE_EXCEPTIONS:
+            if attempt == max_retries:
+                raise
+            _backoff(attempt)
+            continue
+
+        retry = []
+        for (i, content), response in zip(pending, responses):
+            if response.error.message:
+                if response.error.code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+                    retry.append((i, content))
+                    continue
+                raise Exception(f"❌ API Error on page {i+1}: {response.error.message}")
+            annotations = response.full_text_annotation
+            results[i] = annotations.text.strip() if annotations else ""
+
+        if not retry:
+            return results
+        pending = retry
+        _backoff(attempt)
+    return results
+
+def extract_handwritten_text_from_pdf(gcs_pdf_blob_path, assignment_title, username,
+                                      vision_client=None, max_workers=VISION_MAX_WORKERS,
+                                      batch_size=VISION_BATCH_SIZE):
     """
     Extract handwritten text from a PDF stored in GCS using Google Cloud Vision,
     and save the extracted result back to GCS.
+
+    Pages with a usable text layer or nothing on them skip Vision entirely. The rest
+    are sent concurrently (batch_size pages per request, max_workers requests
+    in flight); the text is reassembled in page order. vision_client may be any
+    object with document_text_detection/batch_annotate_images, e.g. a local fake.
+
+    Each OCR'd page is checkpointed as soon as its group completes, so after an
+    API error a retry of the same PDF only sends the pages that are still missing.
     """
 
+    if vision_client is None:
+        vision_client = get_vision_client()
+
     # Step 1: Download PDF from GCS as bytes stream
     pdf_blob = bucket.blob(gcs_pdf_blob_path)
     pdf_stream = BytesIO()
-    pdf_blob.download_to_file(pdf_stream)
+    with span("download", blob=gcs_pdf_blob_path) as s:
+        pdf_blob.download_to_file(pdf_stream)
+        s["bytes"] = pdf_stream.tell()
     pdf_stream.seek(0)
 
     # Step 2: Load PDF into PyMuPDF
-    doc = fitz.open(stream=pdf_stream.read(), filetype="pdf")
-    total_pages = len(doc)
-    full_text = ""
+    pdf_bytes = pdf_stream.getvalue()
+    with fitz_lock:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        total_pages = len(doc)
+    checkpoint = PageCheckpoint(bucket, VISION_ENGINE, VISION_ENGINE_VERSION, pdf_bytes)
 
     progress_bar = st.progress(0)
+    page_texts = {}
+    page_keys = {}
+    routes = {}
+    cached_pages = 0
+    bytes_sent = 0
+
+    # Step 3: Render pages and send them to Vision as groups fill up
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vision") as pool:
+        futures = []
+        group = []
+        for i in range(total_pages):
+            with fitz_lock:
+                page = doc.load_page(i)
 
-    # Step 3: Iterate over each page and extract text
-    for i, page in enumerate(doc):
-        progress_bar.progress(int((i / total_pages) * 100))
+            # Typed and blank pages never reach Vision
+            route, text, reason = route_page(page)
+            routes[i] = (route, reason)
+            if route == ROUTE_OCR and i in checkpoint:
+                # OCR'd by an earlier, failed attempt
+                page_texts[i] = checkpoint.get(i)
+            elif route != ROUTE_OCR:
+                if route == ROUTE_TEXT:
+                    page_texts[i] = text
+            else:
+                # Grayscale at a DPI sized to the page, in whichever encoding is smallest
+                with span("rasterize", engine=VISION_ENGINE, page=i + 1) as s:
+                    img_bytes, encoding = encode_page_for_vision(page)
+                    s.update(dpi=encoding["dpi"], format=encoding["format"], bytes=encoding["bytes"])
 
-        # Render image at DPI 150 to stay well below GCV's 40MB limit
-        pix = page.get_pixmap(dpi=150)  # Reduced from 300 to 150
-        img_bytes = pix.tobytes("png")
+                # Unchanged pages are served from the OCR cache
+                page_keys[i] = page_cache_key(img_bytes, VISION_ENGINE, VISION_ENGINE_VERSION,
+                                              f"{encoding['mode']}/{encoding['dpi']}/{encoding['format']}")
+                cached = page_cache.get(page_keys[i])
+                if cached is not None:
+                    page_texts[i] = cached
+                    cached_pages += 1
+                else:
+                    group.append((i, img_bytes))
+                    bytes_sent += encoding["bytes"]
+            if group and (len(group) >= batch_size or i == total_pages - 1):
+                futures.append(pool.submit(propagate(ocr_page_group), vision_client, group))
+                group = []
 
-        # Create vision.Image object
-        gcv_image = vision.Image(content=img_bytes)
-        response = vision_client.document_text_detection(image=gcv_image)
-        annotations = response.full_text_annotation
+        # On a failure, groups already in flight still finish and are checkpointed before the error is raised
+        error = None
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                if error is None:
+                    error = e
+                    for pending in futures:
+                        pending.cancel()
+                continue
+            for i, text in results.items():
+                page_texts[i] = text
+                page_cache.put(page_keys[i], text)
+                checkpoint.put(i, text)
+            progress_bar.progress(int(len(page_texts) / max(total_pages, 1) * 100))
+        if error is not None:
+            raise error
 
-        if annotations and annotations.text.strip():
-            full_text += annotations.text.strip() + "\n\n"
+    full_text = ""
+    for i in range(total_pages):
+        text = page_texts.get(i, "")
+        if text:
+            full_text += text + "\n\n"
             print(f"✅ Extracted text from page {i+1}")
         else:
             print(f"⚠️ No text found on page {i+1}")
 
-        if response.error.message:
-            raise Exception(f"❌ API Error on page {i+1}: {response.error.message}")
-
     progress_bar.progress(100)
+    counts = log_routing(routes, total_pages)
+    print(f"♻️ OCR cache: {cached_pages}/{counts[ROUTE_OCR]} OCR page(s) reused, "
+          f"{checkpoint.resumed} restored from checkpoint, "
+          f"{counts[ROUTE_OCR] - cached_pages - checkpoint.resumed} sent to Cloud Vision")
+    print(f"📦 Sent {bytes_sent / 1e6:.2f} MB of page images to Cloud Vision")
 
     # Step 4: Upload extracted text back to GCS
     blob_path = f"extracted_texts/{assignment_title.replace(' ', '_')}/{username}_extractedtext.txt"
     blob = bucket.blob(blob_path)
-    blob.upload_from_string(full_text.strip(), content_type='text/plain')
+    with span("gcs_write", blob=blob_path, bytes=len(full_text.strip().encode("utf-8"))):
+        blob.upload_from_string(full_text.strip(), content_type='text/plain')
 
     print(f"✅ Uploaded extracted text to: {blob_path}")
-    return blob_path
\ No newline at end of file
+    checkpoint.clear()
+    return blob_path
@@ -0,0 +1,280 @@
+"""
+Per-stage spans for the submission-to-feedback pipeline.
+
+    with span("ocr", engine="vision", pages=4) as s:
+        ...
+        s["bytes"] = sent
+
+Every span records its stage, duration, outcome and attributes (bytes, pages,
+tokens, subject, ...) and is handed to the configured sinks. Attributes set with
+trace_context() (e.g. the assignment subject for a job) apply to every span
+opened inside it, including in pools started with propagate().
+
+EVALMATE_TRACE_SINKS is a comma-separated list of:
+    jsonl[:path]       append spans to a JSON-lines file (default; shared by all processes)
+    prometheus[:port]  serve /metrics in the Prometheus text format
+    otel               forward spans to OpenTelemetry, if opentelemetry-api is installed
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_SINKS = os.environ.get("EVALMATE_TRACE_SINKS", "jsonl")
+TRACE_LOG_PATH = os.path.expanduser(os.environ.get("EVALMATE_TRACE_LOG", "~/.streamlit/traces.jsonl"))
+TRACE_LOG_MAX_BYTES = 20 * 1024 * 1024  # Rotated to <path>.1 beyond this
+PROMETHEUS_PORT = 9464
+
+_context = contextvars.ContextVar("evalmate_trace_context", default={})
+
+
+@contextlib.contextmanager
+def trace_context(**attributes):
+    """Adds attributes to every span opened inside the block (in this thread or propagated ones)."""
+    token = _context.set({**_context.get(), **{k: v for k, v in attributes.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def propagate(fn):
+    """Wraps fn so it runs with the caller's trace context, e.g. when submitted to a thread pool."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def percentile(values, q):
+    """Nearest-rank q-quantile (0 <= q <= 1) of values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarise(spans, by=("stage",)):
+    """Rows of {group fields, count, errors, p50_ms, p95_ms, and summed bytes/pages/tokens}."""
+    groups = {}
+    for record in spans:
+        groups.setdefault(tuple(record.get(field) or "—" for field in by), []).append(record)
+    rows = []
+    for key, records in sorted(groups.items(), key=lambda item: tuple(str(k) for k in item[0])):
+        durations = [r["duration_ms"] for r in records]
+        row = dict(zip(by, key))
+        row.update({
+            "count": len(records),
+            "errors": sum(1 for r in records if not r["ok"]),
+            "p50_ms": round(percentile(durations, 0.5), 1),
+            "p95_ms": round(percentile(durations, 0.95), 1),
+        })
+        for field in ("bytes", "pages", "tokens"):
+            total = sum(r[field] for r in records if isinstance(r.get(field), (int, float)))
+            if total:
+                row[field] = total
+        rows.append(row)
+    return rows
+
+
+class JsonLinesSink:
+    """Appends one JSON object per span; every process writes to the same file."""
+
+    def __init__(self, path=TRACE_LOG_PATH, max_bytes=TRACE_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+            except OSError:
+                pass
+            # O_APPEND writes of a single line do not interleave across processes
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def recent(self, limit=5000):
+        """The last `limit` spans from the log, oldest first."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = deque(f, maxlen=limit)
+        except OSError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # Partially written line
+        return records
+
+
+class MemorySink:
+    """Keeps the most recent spans of this process."""
+
+    def __init__(self, maxlen=5000):
+        self._spans = deque(maxlen=maxlen)
+
+    def emit(self, record):
+        self._spans.append(record)
+
+    def recent(self, limit=5000):
+        return list(self._spans)[-limit:]
+
+
+class PrometheusSink(MemorySink):
+    """Serves /metrics: per stage and subject, span count, total seconds and p50/p95 over recent spans."""
+
+    def __init__(self, port=PROMETHEUS_PORT, maxlen=5000):
+        super().__init__(maxlen)
+        self._totals = {}
+        self._lock = threading.Lock()
+        self.port = port
+        self._start_server()
+
+    def emit(self, record):
+        super().emit(record)
+        key = (record["stage"], record.get("subject") or "")
+        with self._lock:
+            count, seconds = self._totals.get(key, (0, 0.0))
+            self._totals[key] = (count + 1, seconds + record["duration_ms"] / 1000)
+
+    def render(self):
+        lines = ["# TYPE evalmate_stage_duration_seconds summary"]
+        recent = {}
+        for record in self.recent():
+            recent.setdefault((record["stage"], record.get("subject") or ""), []).append(record["duration_ms"] / 1000)
+        with self._lock:
+            totals = dict(self._totals)
+        for (stage, subject), (count, seconds) in sorted(totals.items()):
+            labels = f'stage="{stage}",subject="{subject}"'
+            for q in (0.5, 0.95):
+                value = percentile(recent.get((stage, subject), []), q)
+                if value is not None:
+                    lines.append(f'evalmate_stage_duration_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"evalmate_stage_duration_seconds_count{{{labels}}} {count}")
+            lines.append(f"evalmate_stage_duration_seconds_sum{{{labels}}} {seconds:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def _start_server(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        except OSError as e:
+            # Another process (e.g. the Streamlit server vs. an OCR worker) already serves this port
+            print(f"⚠️ Prometheus metrics not served from this process: {e}")
+            return
+        threading.Thread(target=server.serve_forever, name="prometheus-metrics", daemon=True).start()
+
+
+class OpenTelemetrySink:
+    """Forwards spans to the globally configured OpenTelemetry tracer provider."""
+
+    def __init__(self):
+        from opentelemetry import trace
+        self._tracer = trace.get_tracer("evalmate")
+
+    def emit(self, record):
+        end_ns = int(record["end"] * 1e9)
+        otel_span = self._tracer.start_span(f"evalmate.{record['stage']}",
+                                            start_time=end_ns - int(record["duration_ms"] * 1e6))
+        for key, value in record.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(f"evalmate.{key}", value)
+        otel_span.end(end_time=end_ns)
+
+
+def _build_sinks(spec):
+    sinks = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, arg = item.partition(":")
+        try:
+            if name == "jsonl":
+                sinks.append(JsonLinesSink(os.path.expanduser(arg) if arg else TRACE_LOG_PATH))
+            elif name == "prometheus":
+                sinks.append(PrometheusSink(int(arg) if arg else PROMETHEUS_PORT))
+            elif name == "otel":
+                sinks.append(OpenTelemetrySink())
+            elif name == "memory":
+                sinks.append(MemorySink())
+            else:
+                print(f"⚠️ Unknown trace sink {name!r} ignored")
+        except Exception as e:
+            print(f"⚠️ Trace sink {name!r} unavailable: {e}")
+    return sinks
+
+
+class Tracer:
+    def __init__(self, sinks=None):
+        self._sinks = sinks
+        self._lock = threading.Lock()
+
+    @property
+    def sinks(self):
+        with self._lock:
+            if self._sinks is None:
+                self._sinks = _build_sinks(TRACE_SINKS)
+            return self._sinks
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, record):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                print(f"⚠️ Trace sink {type(sink).__name__} failed: {e}")
+
+    def recent(self, limit=5000):
+        """Recent spans from the first sink that keeps them (the shared log when configured)."""
+        for sink in self.sinks:
+            if hasattr(sink, "recent"):
+                return sink.recent(limit)
+        return []
+
+    @contextlib.contextmanager
+    def span(self, stage, **attributes):
+        """
+        Times the block as one span of `stage`. Yields the attribute dict, so
+        counts known only at the end (bytes, tokens) can be added inside the block.
+        """
+        attrs = {**_context.get(), **attributes}
+        start = time.perf_counter()
+        ok, error = True, None
+        try:
+            yield attrs
+        except BaseException as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.emit({"stage": stage, **attrs, "duration_ms": round(duration * 1000, 3), "ok": ok,
+                       "error": error, "end": time.time(), "pid": os.getpid()})
+
+
+tracer = Tracer()
+span = tracer.span
@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import os
+import threading
+
+from gcvutils.tracing import span
+
+try:
+    import google_crc32c  # Installed with google-cloud-storage; optional for the local bucket
+except ImportError:
+    google_crc32c = None
+
+# Files above this size go through a chunked, resumable upload (chunk size must be a multiple of 256 KiB)
+UPLOAD_RESUMABLE_THRESHOLD = int(os.environ.get("EVALMATE_UPLOAD_RESUMABLE_THRESHOLD", 8 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_checksums(file_obj):
+    """Base64 MD5 and CRC32C of a file-like object, in the format GCS reports them. Rewinds the file."""
+    file_obj.seek(0)
+    md5 = hashlib.md5()
+    crc = google_crc32c.Checksum() if google_crc32c is not None else None
+    size = 0
+    for block in iter(lambda: file_obj.read(_HASH_BLOCK_SIZE), b""):
+        md5.update(block)
+        if crc is not None:
+            crc.update(block)
+        size += len(block)
+    file_obj.seek(0)
+    return {
+        "md5_hash": base64.b64encode(md5.digest()).decode(),
+        "crc32c": base64.b64encode(crc.digest()).decode() if crc is not None else None,
+        "size": size,
+    }
+
+
+def _matches(blob, checksums):
+    """True if the stored object has the same content (MD5, or CRC32C for composite objects)."""
+    if blob is None or blob.size != checksums["size"]:
+        return False
+    if blob.md5_hash:
+        return blob.md5_hash == checksums["md5_hash"]
+    return bool(blob.crc32c) and blob.crc32c == checksums["crc32c"]
+
+
+class UploadManager:
+    """
+    Uploads files to the bucket only when their content changed.
+
+    The file is hashed locally and compared with the stored object's metadata, so
+    Streamlit reruns with the same file cost one metadata request instead of a full
+    upload. Large files are sent in resumable chunks and verified server-side.
+    """
+
+    def __init__(self, bucket, resumable_threshold=UPLOAD_RESUMABLE_THRESHOLD, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.bucket = bucket
+        self.resumable_threshold = resumable_threshold
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.stats = {"uploads": 0, "skipped": 0, "bytes_uploaded": 0, "bytes_skipped": 0}
+
+    def _record(self, uploaded, size):
+        with self._lock:
+            if uploaded:
+                self.stats["uploads"] += 1
+                self.stats["bytes_uploaded"] += size
+            else:
+                self.stats["skipped"] += 1
+                self.stats["bytes_skipped"] += size
+
+    def upload(self, blob_path, file_obj, content_type="application/octet-stream"):
+        """
+        Uploads file_obj to blob_path unless an identical object is already there.
+
+        Returns True if bytes were sent, False if the upload was skipped.
+        """
+        with span("upload", blob=blob_path) as s:
+            checksums = file_checksums(file_obj)
+            s["bytes"] = checksums["size"]
+            if _matches(self.bucket.get_blob(blob_path), checksums):
+                s["skipped"] = True
+                self._record(False, checksums["size"])
+                print(f"⏭️ Skipped upload of {blob_path}: unchanged ({checksums['size']} bytes)")
+                return False
+
+            if checksums["size"] > self.resumable_threshold:
+                # A chunk size makes the client use a resumable session, retried chunk by chunk
+                blob = self.bucket.blob(blob_path, chunk_size=self.chunk_size)
+            else:
+                blob = self.bucket.blob(blob_path)
+            blob.upload_from_file(file_obj, content_type=content_type, size=checksums["size"],
+                                  checksum="crc32c" if checksums["crc32c"] else "md5")
+            s["skipped"] = False
+            self._record(True, checksums["size"])
+            print(f"📤 Uploaded {blob_path} ({checksums['size']} bytes)")
+            return True
@@ -0,0 +1,62 @@
+import io
+import math
+import os
+
+from gcvutils.rasterize import fitz_lock, render_page
+
+# "adaptive": grayscale at a DPI chosen from page size, smallest of PNG/JPEG.
+# "legacy": the original fixed 150 DPI colour PNG, kept for comparison.
+VISION_ENCODING = os.environ.get("EVALMATE_VISION_ENCODING", "adaptive")
+
+# Pixel budget per page: about 250 DPI on A4/Letter, which keeps small handwriting
+# legible while staying far below Vision's per-image and per-request size limits.
+VISION_TARGET_PIXELS = 6_000_000
+VISION_MIN_DPI = 150
+VISION_MAX_DPI = 300
+VISION_LEGACY_DPI = 150
+
+# JPEG at this quality is indistinguishable from lossless for text recognition;
+# it is only used when it beats the grayscale PNG.
+VISION_JPEG_QUALITY = 85
+
+
+def adaptive_dpi(page, target_pixels=VISION_TARGET_PIXELS, min_dpi=VISION_MIN_DPI, max_dpi=VISION_MAX_DPI):
+    """DPI at which the page renders to about target_pixels, clamped to [min_dpi, max_dpi]."""
+    with fitz_lock:
+        rect = page.rect
+    area_sq_inches = (rect.width / 72.0) * (rect.height / 72.0)
+    if area_sq_inches <= 0:
+        return min_dpi
+    dpi = int(math.sqrt(target_pixels / area_sq_inches))
+    return max(min_dpi, min(max_dpi, dpi))
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.save(buffer, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+    else:
+        image.save(buffer, format="PNG", optimize=False, compress_level=6)
+    return buffer.getvalue()
+
+
+def encode_page_for_vision(page, mode=VISION_ENCODING):
+    """
+    Renders and encodes one page for DOCUMENT_TEXT_DETECTION.
+
+    Returns (image_bytes, info) where info records the dpi, format, pixel count
+    and size, so callers can log or benchmark what was sent.
+    """
+    if mode == "legacy":
+        dpi = VISION_LEGACY_DPI
+        image = render_page(page, dpi)
+        candidates = {"png": _encode(image, "png")}
+    else:
+        dpi = adaptive_dpi(page)
+        image = render_page(page, dpi, grayscale=True)
+        candidates = {fmt: _encode(image, fmt) for fmt in ("png", "jpeg")}
+
+    fmt, content = min(candidates.items(), key=lambda item: len(item[1]))
+    info = {"mode": mode, "dpi": dpi, "format": fmt, "pixels": image.width * image.height,
+            "bytes": len(content)}
+    return content, info
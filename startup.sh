@@ -4,4 +4,7 @@ echo "🔧 Uninstalling conflicting OpenCV version..."
 pip uninstall -y opencv-python opencv-contrib-python
 
 echo "✅ Installing clean dependencies..."
-pip install -r requirements.txt
\ No newline at end of file
+pip install -r requirements.txt
+
+# pix2text pulls opencv-python back in; swap it for the headless build once, here, not at every launch
+python -m gcvutils.environment
@@ -0,0 +1,30 @@
+"""BlobTextCache on the filesystem bucket: cached by generation, never stale."""
+from gcvutils.blob_cache import BlobTextCache
+from gcvutils.local_storage import LocalBucket
+
+
+def test_text_is_cached_per_generation(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"))
+    blob = bucket.blob("extracted_texts/hw1/alice.txt")
+    blob.upload_from_string("first")
+    cache = BlobTextCache(bucket)
+
+    assert cache.get(blob.name, blob.generation) == "first"
+    downloads = bucket.stats["downloads"]
+    assert cache.get(blob.name, blob.generation) == "first"
+    assert bucket.stats["downloads"] == downloads
+
+    blob.upload_from_string("second")
+    assert cache.get(blob.name, blob.generation) == "second"
+
+
+def test_text_of_unknown_generation_is_never_cached(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"))
+    blob = bucket.blob("extracted_texts/hw1/alice.txt")
+    blob.upload_from_string("first")
+    cache = BlobTextCache(bucket)
+
+    cache.prefetch([(blob.name, None)])
+    assert cache.get(blob.name) == "first"
+    blob.upload_from_string("second")
+    assert cache.get(blob.name) == "second"
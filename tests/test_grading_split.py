@@ -0,0 +1,151 @@
+"""Splitting long answers into sections that fit the context window, and grading them section by section."""
+import threading
+
+import groq
+import httpx
+import pytest
+
+from views import grading
+from views.LM import LLM, LLMGateway, estimate_prompt_tokens, estimate_tokens
+from views.grading import (SECTION_NOTE, chunk_text, grade_answer, merge_call, plan_grading, plan_sections,
+                           prompt_budget, split_by_question)
+
+
+class EchoBackend:
+    """Answers every request with a short summary of its last user message and counts the calls."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def complete(self, messages, **params):
+        with self._lock:
+            self.calls.append(messages)
+        return f"feedback on {messages[-2]['content'][:30]!r}", None
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(grading, "grading_cache", grading.GradingCache())
+    backend = EchoBackend()
+    gateway = LLMGateway(backend=backend)
+    return LLM(gateway=gateway), backend
+
+
+def long_text(paragraphs, words=120):
+    return "\n\n".join(" ".join(f"word{p}_{w}" for w in range(words)) for p in range(paragraphs))
+
+
+def test_split_by_question_needs_at_least_two_numbers():
+    assert split_by_question("1. Only one question here") == {}
+    sections = split_by_question("Intro\n1. First\nmore\nQ2) Second\nQuestion 3: Third")
+    assert list(sections) == ["1", "2", "3"]
+    assert sections["1"] == "Intro\n1. First\nmore"
+    assert sections["3"] == "Question 3: Third"
+
+
+def test_chunk_text_respects_the_token_budget():
+    text = long_text(30)
+    chunks = chunk_text(text, 500)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 500 for chunk in chunks)
+    assert "\n\n".join(chunks).split() == text.split()
+
+
+def test_chunk_text_splits_a_paragraph_longer_than_the_budget():
+    chunks = chunk_text("x" * 10_000, 100)
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == "x" * 10_000
+
+
+def test_every_planned_section_fits_in_one_request(llm):
+    llm, _ = llm
+    student, model = long_text(80), long_text(20)
+    sections = plan_sections(llm, student, model, "Be strict")
+    assert len(sections) > 1
+    for label, student_part, model_part in sections:
+        instructions = "Be strict\n" + SECTION_NOTE.format(label=label)
+        assert estimate_prompt_tokens(llm.build_messages(student_part, model_part, instructions)) <= prompt_budget()
+
+
+def test_sections_follow_question_numbers_when_both_answers_are_numbered(llm):
+    llm, _ = llm
+    student = "\n".join(f"{n}. " + long_text(8) for n in (1, 2, 3))
+    model = "\n".join(f"{n}. model answer {n}" for n in (1, 2, 3))
+    sections = plan_sections(llm, student, model)
+    assert [label.split(" (")[0] for label, _, _ in sections][0] == "Question 1"
+    assert {label.split(" (")[0] for label, _, _ in sections} == {"Question 1", "Question 2", "Question 3"}
+    for label, _, model_part in sections:
+        number = label.split(" (")[0].split()[-1]
+        assert model_part.startswith(f"{number}. model answer {number}")
+
+
+def test_short_answers_take_one_call(llm):
+    llm, backend = llm
+    calls = plan_grading(llm, "hw1", "short answer", "model answer")
+    assert [label for label, _ in calls] == ["Answer"]
+    assert grade_answer(llm, "hw1", "short answer", "model answer").startswith("feedback on")
+    assert len(backend.calls) == 1
+
+
+def test_long_answers_are_graded_per_section_then_merged(llm):
+    llm, backend = llm
+    student, model = long_text(80), long_text(20)
+    sections = plan_grading(llm, "hw1", student, model)
+    assert len(sections) > 1
+
+    feedback = grade_answer(llm, "hw1", student, model)
+    assert len(backend.calls) == len(sections) + 1
+    merge_request = backend.calls[-1]
+    assert merge_request[-2]["content"] == grading.MERGE_INSTRUCTIONS
+    assert feedback.startswith("feedback on")
+
+    # The section feedback is cached, so regrading only repeats the merge
+    grade_answer(llm, "hw1", student, model)
+    assert len(backend.calls) == len(sections) + 2
+
+
+def test_merge_call_passes_single_feedback_through(llm):
+    llm, backend = llm
+    assert merge_call(llm, [("Part 1", "fine")])() == "fine"
+    assert backend.calls == []
+
+
+class NoLimit:
+    def acquire(self):
+        pass
+
+    def pause(self, seconds):
+        pass
+
+
+def failing(error, times):
+    attempts = []
+
+    def fn():
+        attempts.append(True)
+        if len(attempts) <= times:
+            raise error
+        return "ok"
+
+    return fn, attempts
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(grading, "GRADING_BACKOFF_SECONDS", 0)
+    request = httpx.Request("POST", "http://llm.invalid/chat")
+    for error in (groq.APIConnectionError(request=request), httpx.ReadTimeout("slow", request=request),
+                  groq.RateLimitError("busy", response=httpx.Response(429, request=request), body=None)):
+        fn, attempts = failing(error, 2)
+        assert grading.call_with_retries(fn, limiter=NoLimit()) == "ok"
+        assert len(attempts) == 3
+
+
+def test_other_errors_surface_at_once():
+    request = httpx.Request("POST", "http://llm.invalid/chat")
+    for error in (KeyError("choices"), ValueError("bad JSON"),
+                  groq.BadRequestError("bad", response=httpx.Response(400, request=request), body=None)):
+        fn, attempts = failing(error, 1)
+        with pytest.raises(type(error)):
+            grading.call_with_retries(fn, limiter=NoLimit())
+        assert len(attempts) == 1
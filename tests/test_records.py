@@ -0,0 +1,269 @@
+"""Record stores, the shared catalogue and the OCR job queue, on the local SQLite and filesystem backends."""
+import threading
+import time
+
+import pytest
+
+from gcvutils import jobs
+from gcvutils.catalogue import SharedCatalogue
+from gcvutils.local_storage import LocalBucket
+from gcvutils.records import (ConflictError, GcsRecordStore, SqliteRecordStore, MIGRATION_KEY, MIGRATION_KIND,
+                              migrate_legacy_catalogue)
+
+
+@pytest.fixture(params=["sqlite", "gcs"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SqliteRecordStore(str(tmp_path / "records.sqlite3"))
+    return GcsRecordStore(LocalBucket(str(tmp_path / "bucket")))
+
+
+# -- generation preconditions ----------------------------------------------------
+
+def test_put_requires_missing_record_for_generation_zero(store):
+    store.put("assignments", "hw1", {"title": "hw1"}, 0)
+    with pytest.raises(ConflictError):
+        store.put("assignments", "hw1", {"title": "other"}, 0)
+    assert store.get("assignments", "hw1")[0] == {"title": "hw1"}
+
+
+def test_put_with_stale_generation_conflicts(store):
+    store.put("assignments", "hw1", {"v": 1}, 0)
+    _, generation = store.get("assignments", "hw1")
+    store.put("assignments", "hw1", {"v": 2}, generation)
+    with pytest.raises(ConflictError):
+        store.put("assignments", "hw1", {"v": 3}, generation)
+    assert store.get("assignments", "hw1")[0] == {"v": 2}
+
+
+def test_delete_with_stale_generation_conflicts(store):
+    store.put("assignments", "hw1", {"v": 1}, 0)
+    _, stale = store.get("assignments", "hw1")
+    store.put("assignments", "hw1", {"v": 2}, stale)
+    with pytest.raises(ConflictError):
+        store.delete("assignments", "hw1", stale)
+    store.delete("assignments", "hw1")
+    assert store.get("assignments", "hw1") == (None, 0)
+
+
+def test_update_retries_after_a_concurrent_write(store):
+    store.put("submissions", "alice", ["hw1"], 0)
+    interfered = []
+
+    def mutate(current):
+        if not interfered:
+            # Another writer lands between this update's read and its write
+            interfered.append(True)
+            _, generation = store.get("submissions", "alice")
+            store.put("submissions", "alice", current + ["hw2"], generation)
+        return current + ["hw3"]
+
+    store.update("submissions", "alice", mutate)
+    assert store.get("submissions", "alice")[0] == ["hw1", "hw2", "hw3"]
+
+
+def test_concurrent_updates_are_not_lost(store):
+    store.put("assignments", "hw1", {"graded": []}, 0)
+
+    def grade(name):
+        store.update("assignments", "hw1", lambda current: {"graded": current["graded"] + [name]})
+
+    threads = [threading.Thread(target=grade, args=(f"student{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(store.get("assignments", "hw1")[0]["graded"]) == [f"student{i}" for i in range(4)]
+
+
+def test_update_gives_up_on_a_record_that_keeps_changing(store, monkeypatch):
+    store.put("assignments", "hw1", {"v": 0}, 0)
+
+    def always_conflict(kind, key, record, generation):
+        raise ConflictError("changed")
+
+    monkeypatch.setattr(store, "put", always_conflict)
+    with pytest.raises(ConflictError):
+        store.update("assignments", "hw1", lambda current: {"v": current["v"] + 1})
+
+
+def test_gcs_list_only_downloads_changed_records(tmp_path):
+    bucket = LocalBucket(str(tmp_path / "bucket"))
+    store = GcsRecordStore(bucket)
+    store.put("assignments", "hw1", {"v": 1}, 0)
+    store.put("assignments", "hw 2/b", {"v": 1}, 0)
+    assert store.list("assignments") == {"hw1": {"v": 1}, "hw 2/b": {"v": 1}}
+
+    downloads = bucket.stats["downloads"]
+    store.update("assignments", "hw1", lambda current: {"v": 2})
+    after_update = bucket.stats["downloads"]
+    assert store.list("assignments") == {"hw1": {"v": 2}, "hw 2/b": {"v": 1}}
+    # The update read hw1 once; the listing reuses both known generations
+    assert after_update - downloads == 1
+    assert bucket.stats["downloads"] == after_update
+
+
+# -- legacy catalogue migration -------------------------------------------------
+
+def test_migration_imports_once_and_keeps_existing_records(store):
+    legacy = {"assignments.json": [{"title": "hw1"}, {"title": "hw2"}], "submissions.json": {"alice": ["hw1"]}}
+    load = lambda name, default: legacy.get(name, default)
+
+    assert migrate_legacy_catalogue(store, load, "assignments.json", "submissions.json")
+    assert set(store.list("assignments")) == {"hw1", "hw2"}
+    assert store.get("submissions", "alice")[0] == ["hw1"]
+    assert store.get(MIGRATION_KIND, MIGRATION_KEY)[0] == {"migrated": True}
+
+    legacy["assignments.json"].append({"title": "hw3"})
+    assert not migrate_legacy_catalogue(store, load, "assignments.json", "submissions.json")
+    assert "hw3" not in store.list("assignments")
+
+
+def test_migration_writes_nothing_when_a_legacy_file_cannot_be_read(store):
+    def load(name, default):
+        if name == "submissions.json":
+            raise OSError("storage unavailable")
+        return [{"title": "hw1"}]
+
+    with pytest.raises(OSError):
+        migrate_legacy_catalogue(store, load, "assignments.json", "submissions.json")
+    assert store.list("assignments") == {}
+    assert store.get(MIGRATION_KIND, MIGRATION_KEY) == (None, 0)
+
+
+# -- shared catalogue -----------------------------------------------------------
+
+class CountingStore(SqliteRecordStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.listings = 0
+
+    def list(self, kind):
+        self.listings += 1
+        return super().list(kind)
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    store = CountingStore(str(tmp_path / "records.sqlite3"))
+    return SharedCatalogue(store, LocalBucket(str(tmp_path / "bucket")), ttl=60)
+
+
+def test_catalogue_serves_fresh_snapshots_from_memory(catalogue):
+    catalogue.store.put("assignments", "hw1", {"title": "hw1"}, 0)
+    first = catalogue.records("assignments")
+    assert catalogue.records("assignments") is first
+    assert catalogue.store.listings == 1
+    assert catalogue.stats["hits"] == 1
+    with pytest.raises(TypeError):
+        first["hw1"]["title"] = "changed"
+
+
+def test_catalogue_revalidates_after_its_own_write(catalogue):
+    catalogue.store.put("assignments", "hw1", {"title": "hw1"}, 0)
+    catalogue.store.put("assignments", "hw2", {"title": "hw2"}, 0)
+    before = catalogue.records("assignments")
+
+    catalogue.update("assignments", "hw2", lambda current: {**current, "due": "friday"})
+    after = catalogue.records("assignments")
+    assert catalogue.store.listings == 2
+    assert after["hw2"]["due"] == "friday"
+    assert "due" not in before["hw2"]
+
+
+def test_catalogue_revalidates_after_the_ttl(catalogue):
+    catalogue.records("assignments")
+    catalogue.store.put("assignments", "hw1", {"title": "hw1"}, 0)  # Written by another server
+    assert "hw1" not in catalogue.records("assignments")
+    catalogue.ttl = 0
+    assert "hw1" in catalogue.records("assignments")
+
+
+def test_catalogue_json_redownloads_only_changed_blobs(catalogue):
+    catalogue.put_json("feedback.json", {"alice": "ok"})
+    assert catalogue.json("feedback.json") == {"alice": "ok"}
+    catalogue.ttl = 0
+    catalogue.json("feedback.json")
+    assert catalogue.stats["blob_downloads"] == 1
+    catalogue.put_json("feedback.json", {"alice": "better"})
+    assert catalogue.json("feedback.json") == {"alice": "better"}
+    assert catalogue.stats["blob_downloads"] == 2
+
+
+# -- job queue ------------------------------------------------------------------
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "ensure_dispatcher", lambda: None)
+    return jobs._Dispatcher()
+
+
+def claim(dispatcher):
+    conn = jobs._connect()
+    try:
+        return dispatcher._claim(conn)
+    finally:
+        conn.close()
+
+
+def test_jobs_are_claimed_in_order_up_to_the_running_limit(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_RUNNING_JOBS", 2)
+    first, second, third = (jobs.submit_job("extract", {"n": n}, owner="alice") for n in range(3))
+
+    assert claim(queue)["id"] == first
+    assert claim(queue)["id"] == second
+    assert claim(queue) is None
+    assert jobs.get_job(third)["status"] == jobs.QUEUED
+    assert jobs.queue_position(third) == 0  # Next in line
+
+
+def test_queue_rejects_jobs_beyond_capacity(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_QUEUED_JOBS", 1)
+    jobs.submit_job("extract", {}, owner="alice")
+    with pytest.raises(jobs.JobQueueFull):
+        jobs.submit_job("extract", {}, owner="bob")
+
+
+def set_job_times(job_id, **times):
+    conn = jobs._connect()
+    try:
+        for column, value in times.items():
+            conn.execute(f"UPDATE jobs SET {column} = ? WHERE id = ?", (value, job_id))
+    finally:
+        conn.close()
+
+
+def test_jobs_with_an_expired_lease_are_requeued(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_RUNNING_JOBS", 1)
+    job_id = jobs.submit_job("extract", {}, owner="alice")
+    assert claim(queue)["id"] == job_id
+    assert claim(queue) is None
+
+    # The worker running it died long ago and stopped renewing its lease
+    set_job_times(job_id, started_at=1.0, heartbeat_at=1.0)
+    reclaimed = claim(queue)
+    assert reclaimed["id"] == job_id
+    assert jobs.get_job(job_id)["status"] == jobs.RUNNING
+    assert jobs.get_job(job_id)["started_at"] > 1.0
+
+
+def test_long_jobs_that_renew_their_lease_are_not_requeued(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_RUNNING_JOBS", 1)
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(jobs, "_report_worker_stats", lambda: None)
+    job_id = jobs.submit_job("extract", {}, owner="alice")
+    assert claim(queue)["id"] == job_id
+    set_job_times(job_id, started_at=1.0, heartbeat_at=1.0)
+
+    def slow_job(kind, payload):
+        time.sleep(0.3)  # Long enough for the worker to renew the lease
+        assert claim(queue) is None
+        return {}
+
+    monkeypatch.setattr(jobs, "_run_job", slow_job)
+    jobs.run_job("extract", {}, job_id)
+    job = jobs.get_job(job_id)
+    assert job["status"] == jobs.RUNNING
+    assert job["started_at"] == 1.0
+    assert job["heartbeat_at"] > 1.0
@@ -0,0 +1,109 @@
+"""Text-layer vs OCR routing of PDF pages, on small PDFs built with PyMuPDF."""
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from gcvutils.page_routing import ROUTE_BLANK, ROUTE_OCR, ROUTE_TEXT, log_routing, route_page  # noqa: E402
+
+TYPED = "The derivative of x squared is two x, so the slope at x = 3 is 6."
+
+
+def one_page(draw):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    draw(page)
+    return doc, doc[0]
+
+
+def scribble(page, strokes=40):
+    """Dense dark strokes standing in for handwriting stored as vector paths."""
+    for i in range(strokes):
+        y = 100 + i * 15
+        page.draw_line((60, y), (540, y + 10), color=(0, 0, 0), width=3)
+
+
+def scanned_image(page):
+    """A full-page raster with dark marks, as a scanner would produce."""
+    pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 200, 280), False)
+    pix.set_rect(pix.irect, (255,))
+    for y in range(20, 260, 12):
+        pix.set_rect(fitz.IRect(20, y, 180, y + 5), (0,))
+    page.insert_image(page.rect, pixmap=pix)
+
+
+def test_typed_page_uses_the_text_layer():
+    doc, page = one_page(lambda p: p.insert_text((72, 72), TYPED))
+    route, text, _ = route_page(page)
+    assert route == ROUTE_TEXT
+    assert text == TYPED
+
+
+def test_empty_page_is_blank():
+    doc, page = one_page(lambda p: None)
+    assert route_page(page)[0] == ROUTE_BLANK
+
+
+def test_scanned_page_goes_to_ocr():
+    doc, page = one_page(scanned_image)
+    route, text, reason = route_page(page)
+    assert route == ROUTE_OCR
+    assert text == ""
+    assert "scanned" in reason
+
+
+@pytest.mark.parametrize("strokes", [1, 10, 30])
+def test_sparse_handwriting_goes_to_ocr(strokes):
+    doc, page = one_page(lambda p: scribble(p, strokes))
+    assert route_page(page)[0] == ROUTE_OCR
+
+
+def test_scan_with_one_short_answer_line_goes_to_ocr():
+    def draw(page):
+        pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 200, 280), False)
+        pix.set_rect(pix.irect, (255,))
+        pix.set_rect(fitz.IRect(20, 40, 60, 42), (0,))
+        page.insert_image(page.rect, pixmap=pix)
+
+    doc, page = one_page(draw)
+    assert route_page(page)[0] == ROUTE_OCR
+
+
+def test_short_text_layer_alone_is_used_as_is():
+    doc, page = one_page(lambda p: p.insert_text((540, 820), "3"))
+    assert route_page(page)[:2] == (ROUTE_TEXT, "3")
+
+
+def test_typed_page_with_a_large_image_goes_to_ocr():
+    def draw(page):
+        scanned_image(page)
+        page.insert_text((72, 72), TYPED)
+
+    doc, page = one_page(draw)
+    route, _, reason = route_page(page)
+    assert route == ROUTE_OCR
+    assert "images" in reason
+
+
+def test_typed_page_with_handwritten_strokes_goes_to_ocr(monkeypatch):
+    monkeypatch.setattr("gcvutils.page_routing.DRAWING_MAX_PATHS", 10)
+
+    def draw(page):
+        page.insert_text((72, 72), TYPED)
+        scribble(page)
+
+    doc, page = one_page(draw)
+    assert route_page(page)[0] == ROUTE_OCR
+
+
+def test_text_layer_can_be_disabled():
+    doc, page = one_page(lambda p: p.insert_text((72, 72), TYPED))
+    assert route_page(page, use_text_layer=False)[0] == ROUTE_OCR
+
+    doc, page = one_page(scribble)
+    assert route_page(page, use_text_layer=False)[0] == ROUTE_OCR
+
+
+def test_log_routing_counts_each_route(capsys):
+    routes = {0: (ROUTE_TEXT, "typed"), 1: (ROUTE_OCR, "scanned"), 2: (ROUTE_OCR, "scanned"), 3: (ROUTE_BLANK, "")}
+    assert log_routing(routes, 4) == {ROUTE_TEXT: 1, ROUTE_BLANK: 1, ROUTE_OCR: 2}
+    assert "2 sent to OCR (of 4)" in capsys.readouterr().out
@@ -1,9 +1,252 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import httpx
 from groq import Groq
 
-GROQ_API_KEY = "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"  # Replace with your actual API key
+from gcvutils.tracing import percentile, span
+
+
+def groq_api_key():
+    """The Groq API key from GROQ_API_KEY or, inside Streamlit, st.secrets["groq"]["api_key"]."""
+    key = os.environ.get("GROQ_API_KEY")
+    if key:
+        return key
+    try:
+        import streamlit as st
+        key = st.secrets["groq"]["api_key"]
+    except Exception:
+        key = None
+    if not key:
+        raise RuntimeError("No Groq API key: set GROQ_API_KEY or add [groq] api_key to .streamlit/secrets.toml")
+    return key
+
+
+# Gateway settings; EVALMATE_LLM_BASE_URL points the client at an OpenAI-compatible stub server
+LLM_MODEL = "llama3-70b-8192"
+LLM_BASE_URL = os.environ.get("EVALMATE_LLM_BASE_URL") or None
+LLM_TIMEOUT_SECONDS = float(os.environ.get("EVALMATE_LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT_SECONDS = 5.0
+LLM_MAX_CONNECTIONS = 16
+LLM_MAX_CONCURRENCY = int(os.environ.get("EVALMATE_LLM_MAX_CONCURRENCY", 8))
+# Optional fixed request budget; 0 sends freely and backs off only when the provider says so
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("EVALMATE_LLM_REQUESTS_PER_MINUTE", 0))
+
+# llama3-70b-8192: prompt and completion share an 8192-token window
+LLM_CONTEXT_TOKENS = 8192
+
+LLM_PARAMS = {
+    "model": LLM_MODEL,
+    "temperature": 0.5,
+    "max_tokens": 1024,
+    "top_p": 1,
+    "stop": None,
+}
+
+
+def estimate_tokens(text):
+    """Rough token count for Llama-family tokenizers (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def estimate_prompt_tokens(messages):
+    # A few tokens of chat-template overhead per message
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _parse_reset(value):
+    """Seconds in an x-ratelimit-reset-* header ("7.66s", "2m59.56s", "120ms"), or None."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts) if parts else None
+
+
+class RateLimiter:
+    """
+    Paces LLM requests for the whole process. With per_minute > 0 calls are spaced
+    evenly; otherwise they go out freely until the provider signals a limit: a 429's
+    Retry-After (pause()) or an exhausted x-ratelimit-remaining-* budget (observe()).
+    """
+
+    def __init__(self, per_minute=LLM_REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._next - now, 0.0)
+            self._next = max(self._next, now) + self.interval
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+    def observe(self, headers):
+        """Holds further calls until the reset time when a request or token budget is used up."""
+        for budget in ("requests", "tokens"):
+            try:
+                remaining = int(headers.get(f"x-ratelimit-remaining-{budget}"))
+            except (TypeError, ValueError):
+                continue
+            reset = _parse_reset(headers.get(f"x-ratelimit-reset-{budget}"))
+            if remaining <= 0 and reset:
+                self.pause(reset)
+
+
+class GroqBackend:
+    """Groq chat completions over a single keep-alive connection pool."""
+
+    def __init__(self, api_key=None, base_url=LLM_BASE_URL, timeout=LLM_TIMEOUT_SECONDS,
+                 max_connections=LLM_MAX_CONNECTIONS, on_headers=None):
+        self.on_headers = on_headers  # Receives every response's headers, e.g. RateLimiter.observe
+        self._first_byte = threading.local()
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections,
+                                keepalive_expiry=120),
+            timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            event_hooks={"response": [self._on_response]},
+        )
+        self.client = Groq(api_key=api_key or groq_api_key(), base_url=base_url, http_client=self.http_client)
+
+    def _on_response(self, response):
+        # Called when the response headers arrive, before the body is read
+        self._first_byte.at = time.perf_counter()
+        if self.on_headers is not None:
+            self.on_headers(response.headers)
+
+    def complete(self, messages, **params):
+        """Returns (text, perf_counter time of the first response byte or None)."""
+        self._first_byte.at = None
+        completion = self.client.chat.completions.create(messages=messages, stream=False, **params)
+        return completion.choices[0].message.content, self._first_byte.at
+
+    def stream(self, messages, **params):
+        """Yields text deltas as they arrive; closing the generator closes the HTTP stream."""
+        response = self.client.chat.completions.create(messages=messages, stream=True, **params)
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+
+
+class LLMGateway:
+    """
+    Process-wide entry point for LLM calls: bounds concurrency, reuses one backend
+    (and so one connection pool), records per-call latency and owns the rate limiter
+    that the backend's rate-limit headers feed.
+    """
+
+    def __init__(self, backend=None, max_concurrency=LLM_MAX_CONCURRENCY, history=1000):
+        self.rate_limiter = RateLimiter()
+        self._backend_lock = threading.Lock()
+        self._backend = None
+        if backend is not None:
+            self.set_backend(backend)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._calls = deque(maxlen=history)
+
+    @property
+    def backend(self):
+        with self._backend_lock:
+            if self._backend is None:
+                self._backend = GroqBackend(on_headers=self.rate_limiter.observe)
+            return self._backend
+
+    def set_backend(self, backend):
+        """Swaps the backend, e.g. for a local stub in benchmarks."""
+        if hasattr(backend, "on_headers"):
+            backend.on_headers = self.rate_limiter.observe
+        with self._backend_lock:
+            self._backend = backend
+
+    def complete(self, messages, **params):
+        backend = self.backend
+        queued_at = time.perf_counter()
+        with self._slots, span("llm", model=params.get("model", LLM_MODEL), streamed=False,
+                               prompt_tokens=estimate_prompt_tokens(messages)) as s:
+            started_at = time.perf_counter()
+            first_byte_at, ok = None, False
+            try:
+                text, first_byte_at = backend.complete(messages, **{**LLM_PARAMS, **params})
+                ok = True
+                s["completion_tokens"] = estimate_tokens(text or "")
+                s["tokens"] = s["prompt_tokens"] + s["completion_tokens"]
+                return text
+            finally:
+                finished_at = time.perf_counter()
+                self._calls.append({
+                    "queue_wait": started_at - queued_at,
+                    "ttfb": (first_byte_at - started_at) if first_byte_at else None,
+                    "total": finished_at - started_at,
+                    "ok": ok,
+                })
+
+    def stream(self, messages, **params):
+        """
+        Streaming variant of complete(). Holds a concurrency slot until the stream is
+        exhausted or closed; time to first byte is measured to the first token.
+        """
+        backend = self.backend
+        queued_at = time.perf_counter()
+        with self._slots, span("llm", model=params.get("model", LLM_MODEL), streamed=True,
+                               prompt_tokens=estimate_prompt_tokens(messages)) as s:
+            started_at = time.perf_counter()
+            first_token_at, ok = None, False
+            completion_chars = 0
+            try:
+                for token in backend.stream(messages, **{**LLM_PARAMS, **params}):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        s["ttfb_ms"] = round((first_token_at - started_at) * 1000, 1)
+                    completion_chars += len(token)
+                    yield token
+                ok = True
+            finally:
+                s["completion_tokens"] = (completion_chars + 3) // 4
+                s["tokens"] = s["prompt_tokens"] + s["completion_tokens"]
+                finished_at = time.perf_counter()
+                self._calls.append({
+                    "queue_wait": started_at - queued_at,
+                    "ttfb": (first_token_at - started_at) if first_token_at else None,
+                    "total": finished_at - started_at,
+                    "ok": ok,
+                })
+
+    def metrics(self):
+        """p50/p95 of queue wait, time to first byte and total time over recent calls."""
+        calls = list(self._calls)
+        summary = {"calls": len(calls), "errors": sum(1 for c in calls if not c["ok"])}
+        for field in ("queue_wait", "ttfb", "total"):
+            values = [c[field] for c in calls if c[field] is not None]
+            summary[field] = {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+        return summary
+
+
+gateway = LLMGateway()
+
 
 class LLM:
-    def __init__(self) -> None:
+    def __init__(self, gateway=gateway) -> None:
+        self.gateway = gateway
         self.messages = [
             {'role': 'system', "content": "You are a bot that will grade assignments and provide feedback to students."},
             {'role': 'system', "content": "You will take instructions from the teacher and grade the assignments accordingly."},
@@ -12,10 +255,31 @@ class LLM:
             {'role': 'system', "content": "Do not write in bold or italic, you will not use bold or italic characters."}
         ]
 
+    def build_messages(self, student_answer, model_answer, additional_instructions=""):
+        """Returns the message list for one grading request without modifying self.messages."""
+        messages = list(self.messages)
+        if additional_instructions:
+            messages.append({'role': 'system', 'content': f"Grading Instructions: {additional_instructions}"})
+        messages.append({'role': 'user', 'content': f"Student Answer: {student_answer}"})
+        messages.append({'role': 'user', 'content': f"Model Answer: {model_answer}"})
+        return messages
+
+    def grade(self, student_answer, model_answer, additional_instructions=""):
+        """
+        Same request as AI() but errors are raised instead of returned,
+        so callers can retry them. Used for bulk grading.
+        """
+        assert student_answer, "Student answer cannot be empty"
+        assert model_answer, "Model answer cannot be empty"
+
+        return self.gateway.complete(self.build_messages(student_answer, model_answer, additional_instructions))
+
     def AI(self, student_answer, model_answer, additional_instructions=""):
         """
         Grades the student's answer by comparing it to the model answer and additional teacher-provided instructions.
 
+        Each call is independent: the instance's base prompt is reused, never extended.
+
         Parameters:
         - student_answer (str): The extracted student answer to grade.
         - model_answer (str): The teacher-provided model answer for comparison.
@@ -27,29 +291,22 @@ class LLM:
         assert student_answer, "Student answer cannot be empty"
         assert model_answer, "Model answer cannot be empty"
 
-        if additional_instructions:
-            self.messages.append({'role': 'system', 'content': f"Grading Instructions: {additional_instructions}"})
+        try:
+            return self.gateway.complete(self.build_messages(student_answer, model_answer, additional_instructions))
+        except Exception as e:
+            print(f"Error occurred: {e}")
+            return f"Error occurred: {e}"
 
-        self.messages.append({'role': 'user', 'content': f"Student Answer: {student_answer}"})
-        self.messages.append({'role': 'user', 'content': f"Model Answer: {model_answer}"})
+    def stream_AI(self, student_answer, model_answer, additional_instructions=""):
+        """
+        Streaming version of AI(): yields the response as tokens arrive.
+        Closing the generator (e.g. when the teacher cancels) stops generation.
+        """
+        assert student_answer, "Student answer cannot be empty"
+        assert model_answer, "Model answer cannot be empty"
 
         try:
-            client = Groq(api_key=GROQ_API_KEY)
-
-            chat_completion = client.chat.completions.create(
-                messages=self.messages,
-                model="llama3-70b-8192",
-                temperature=0.5,
-                max_tokens=1024,
-                top_p=1,
-                stop=None,
-                stream=False,
-            )
-
-            response = chat_completion.choices[0].message.content
-            self.messages.append({'role': 'assistant', 'content': response})
-            return response
-
+            yield from self.gateway.stream(self.build_messages(student_answer, model_answer, additional_instructions))
         except Exception as e:
             print(f"Error occurred: {e}")
-            return f"Error occurred: {e}"
\ No newline at end of file
+            yield f"Error occurred: {e}"
\ No newline at end of file
@@ -1,54 +1,298 @@
 import streamlit as st
 import json
 import os
+import posixpath
 import time as TIME
 from datetime import datetime
 from views.LM import LLM
-from gcvutils.textextract_gcv import extract_handwritten_text_from_pdf
+from views.grading import (run_concurrently, grade_answer, plan_grading, merge_call, fits_in_context,
+                           cached_stream, grading_cache, enable_persistent_tier)
 from datetime import datetime, time, timedelta
-from google.cloud import storage
-from google.oauth2 import service_account
-from gcvutils.matheqs import process_pdf_from_gcs_to_text
-
-# File paths for persistent storage
+from gcvutils.cloud import get_bucket
+from gcvutils.blob_cache import BlobTextCache
+from gcvutils.uploads import UploadManager
+from gcvutils.records import open_record_store, migrate_legacy_catalogue
+from gcvutils.catalogue import SharedCatalogue
+from gcvutils.tracing import tracer, trace_context, span, summarise as summarise_spans
+from gcvutils.jobs import (submit_job, active_jobs, unacknowledged_jobs, acknowledge_job,
+                           queue_position, ensure_dispatcher, JobQueueFull, worker_stats, restart_workers)
+
+# File paths for persistent storage (the assignments and submissions files are only read by the one-time import)
 ASSIGNMENTS_FILE = "assignments/assignments.json"
 NOTIFICATIONS_FILE = "notifications/notifications.json"
 SUBMISSIONS_FILE = "submissions/submissions.json"
 STUDENT_FEEDBACK_FILE = "feedbacks/student_feedbacks.json"
 FEEDBACKS_FOLDER = "feedbacks"
 SECRETS_FILE = ".streamlit/secrets.toml"
-
-credentials = service_account.Credentials.from_service_account_info(st.secrets["google_credentials"])
-bucket_name = st.secrets["gcs"]["bucket_name"]
-client = storage.Client(credentials=credentials)
-bucket = client.bucket(bucket_name)
+SUBMISSIONS_PER_PAGE = 10
+
+# Shared, pooled bucket handle (created once per process, reused on every rerun)
+bucket = get_bucket()
+enable_persistent_tier(bucket)
+
+def read_json_blob(blob_name, default=None):
+    """
+    Downloads and parses a JSON blob, bypassing the shared catalogue (used for one-off imports).
+    Returns default only when the blob does not exist; read and parse errors are raised.
+    """
+    blob = bucket.get_blob(blob_name)
+    if blob is None:
+        return default
+    return json.loads(blob.download_as_text())
+
+@st.cache_resource
+def get_record_store():
+    """
+    Per-record catalogue storage, shared by all sessions; imports the legacy JSON files once.
+    A failed import raises, so the store is not cached and the import is retried on the next run.
+    """
+    store = open_record_store(bucket)
+    if migrate_legacy_catalogue(store, read_json_blob, ASSIGNMENTS_FILE, SUBMISSIONS_FILE):
+        print("✅ Migrated assignments/submissions JSON to per-record storage")
+    return store
+
+@st.cache_resource
+def get_catalogue():
+    """One parsed, read-only copy of the catalogue for every session in this process."""
+    return SharedCatalogue(get_record_store(), bucket)
+
+catalogue = get_catalogue()
 
 def load_data(blob_name, default=None):
-    """Loads JSON data from GCS."""
+    """Loads JSON data from GCS as a shared, read-only view."""
     try:
-        blob = bucket.blob(blob_name)
-        if blob.exists():
-            data = blob.download_as_text()
-            return json.loads(data)
+        data = catalogue.json(blob_name)
+        if data is not None:
+            return data
     except Exception as e:
         st.error(f"Error loading {blob_name}: {e}")
     return default if default is not None else []
 
-def save_data(blob_name, data):
-    """Saves JSON data to GCS."""
+def load_assignments():
+    """Loads every assignment record (read-only), oldest first."""
+    assignments = catalogue.records("assignments").values()
+    return sorted(assignments, key=lambda a: (a.get("created_at", 0), a.get("title", "")))
+
+def load_submissions(username):
+    """Returns {username: (submitted titles)} for one student."""
+    return {username: catalogue.record("submissions", username) or ()}
+
+def load_feedback_status(username):
+    """
+    Returns {assignment title: last update time} for every feedback file of this student,
+    using a single listing of the feedbacks folder instead of one lookup per assignment.
+    """
+    suffix = f"/{username}_feedback.txt"
+    prefix = f"{FEEDBACKS_FOLDER}/"
     try:
-        blob = bucket.blob(blob_name)
-        blob.upload_from_string(json.dumps(data, indent=4), content_type='application/json')
+        try:
+            blobs = list(bucket.list_blobs(prefix=prefix, match_glob=f"{prefix}**{suffix}"))
+        except TypeError:  # google-cloud-storage without match_glob support
+            blobs = bucket.list_blobs(prefix=prefix)
+        return {blob.name[len(prefix):-len(suffix)]: blob.updated
+                for blob in blobs if blob.name.endswith(suffix)}
     except Exception as e:
-        st.error(f"Error saving {blob_name}: {e}")
-
-# Load session data
-if "assignments" not in st.session_state:
-    st.session_state.assignments = load_data(ASSIGNMENTS_FILE, [])
-
+        st.error(f"Error loading feedback status: {e}")
+        return {}
+
+@st.cache_resource
+def get_upload_manager():
+    """Uploads shared by every session, so skipped and uploaded bytes are counted per process."""
+    return UploadManager(bucket)
+
+@st.cache_resource
+def get_text_cache():
+    """Submission texts shared by every teacher session in this process."""
+    return BlobTextCache(bucket)
+
+text_cache = get_text_cache()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_submission_index(prefixes):
+    """Returns {blob name: {"size", "generation"}} for the extracted texts under the given prefixes."""
+    index = {}
+    for prefix in prefixes:
+        for blob in bucket.list_blobs(prefix=prefix):
+            index[blob.name] = {"size": blob.size, "generation": blob.generation}
+    return index
+
+def paginate(items, key, per_page=SUBMISSIONS_PER_PAGE):
+    """Shows a page picker when needed and returns the items on the selected page."""
+    if len(items) <= per_page:
+        return items
+    pages = (len(items) + per_page - 1) // per_page
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+    start = (page - 1) * per_page
+    st.caption(f"Showing {start + 1}–{min(start + per_page, len(items))} of {len(items)}")
+    return items[start:start + per_page]
+
+# Shared read-only view; sessions keep no copy of their own
 if "student_feedbacks" not in st.session_state:
     st.session_state.student_feedbacks = load_data(STUDENT_FEEDBACK_FILE, {})
 
+def model_admin_panel():
+    """Shows the OCR models' load metrics as reported by the extraction workers and lets an operator restart them."""
+    with st.expander("🛠️ OCR Models"):
+        # The models live in the worker processes; this server never imports torch
+        workers = [w for w in worker_stats() if "models" in w["stats"]]
+        if not workers:
+            st.caption("No extraction worker has loaded the OCR models yet.")
+        for worker in workers:
+            metrics = worker["stats"]["models"]
+            store = worker["stats"]["model_store"]
+            updated = datetime.fromtimestamp(worker["updated_at"]).strftime("%H:%M:%S")
+            st.markdown(f"**Worker {worker['pid']}** (reported {updated}) — "
+                        f"🧮 {metrics['_process']['rss_bytes'] / 1e6:.0f} MB")
+            st.caption(f"📦 Model store: {store['downloads']} downloads "
+                       f"({store['bytes'] / 1e6:.0f} MB in {store['seconds']:.1f}s), {store['reused']} reused")
+            for name, stats in metrics.items():
+                if name.startswith("_"):
+                    continue
+                status = "✅ Loaded" if stats["loaded"] else "💤 Not loaded"
+                load_info = f" in {stats['load_seconds']}s" if stats["load_seconds"] is not None else ""
+                mem_info = f", +{stats['rss_delta_bytes'] / 1e6:.0f} MB" if stats["rss_delta_bytes"] else ""
+                st.write(f"{name} — {status}{load_info}{mem_info} (loads: {stats['load_count']})")
+                if stats["last_error"]:
+                    st.warning(f"⚠️ Last error: {stats['last_error']}")
+        st.caption("Restarting replaces the worker processes once their running jobs finish, "
+                   "which unloads every model; they are loaded again (at the latest version) on first use.")
+        if st.button("🔄 Restart OCR workers", key="restart_ocr_workers"):
+            restart_workers()
+            st.success("✅ Restart requested.")
+
+def ocr_cache_panel():
+    """Shows how many pages the OCR cache has saved, summed over the extraction workers' reports."""
+    with st.expander("♻️ OCR Cache"):
+        reports = [w["stats"]["ocr_cache"] for w in worker_stats() if "ocr_cache" in w["stats"]]
+        if not reports:
+            st.caption("No extraction worker has used the OCR cache yet.")
+            return
+        stats = {key: sum(report[key] for report in reports) for key in reports[0]}
+        hits = stats["hits_local"] + stats["hits_shared"]
+        lookups = hits + stats["misses"]
+        hit_rate = hits / lookups if lookups else 0.0
+        st.write(f"Pages reused: **{hits}** (local {stats['hits_local']}, shared {stats['hits_shared']}) — "
+                 f"pages OCR'd: **{stats['misses']}** — hit rate: **{hit_rate:.0%}**")
+        st.write(f"Entries stored: {stats['stores']}, evicted: {stats['evictions']} "
+                 f"(across {len(reports)} worker(s))")
+
+def catalogue_cache_panel():
+    """Shows how often catalogue reads were served from the shared in-memory copy."""
+    with st.expander("🗂️ Catalogue Cache"):
+        stats = catalogue.stats
+        reads = stats["hits"] + stats["revalidations"]
+        hit_rate = stats["hits"] / reads if reads else 0.0
+        st.write(f"Reads served from memory: **{stats['hits']}** of {reads} ({hit_rate:.0%}) — "
+                 f"revalidations: {stats['revalidations']}, JSON downloads: {stats['blob_downloads']}, "
+                 f"invalidations: {stats['invalidations']}")
+
+def upload_stats_panel():
+    """Shows how many PDF uploads were skipped because the stored copy was identical."""
+    with st.expander("📤 Uploads"):
+        stats = get_upload_manager().stats
+        st.write(f"Uploaded: **{stats['uploads']}** ({stats['bytes_uploaded'] / 1e6:.1f} MB) — "
+                 f"skipped as unchanged: **{stats['skipped']}** ({stats['bytes_skipped'] / 1e6:.1f} MB)")
+
+def pipeline_latency_panel():
+    """p50/p95 per pipeline stage and subject, from the spans recorded by every server and OCR worker."""
+    with st.expander("⏱️ Pipeline Latency"):
+        if not st.toggle("Load recent spans", key="show_pipeline_latency"):
+            return
+        spans = tracer.recent()
+        if not spans:
+            st.caption("No spans recorded yet.")
+            return
+        st.caption(f"Last {len(spans)} spans")
+        st.dataframe(summarise_spans(spans, by=("stage",)), use_container_width=True)
+        st.markdown("**By subject**")
+        st.dataframe(summarise_spans(spans, by=("stage", "subject")), use_container_width=True)
+
+def stream_to_session(key, chunks):
+    """
+    Passes chunks through to st.write_stream while keeping the text so far in
+    st.session_state[key]; a rerun (e.g. Cancel) tears down the stream, and the
+    partial feedback is then still there to edit.
+    """
+    st.session_state[key] = ""
+    for chunk in chunks:
+        st.session_state[key] += chunk
+        yield chunk
+
+def get_session_llm():
+    """One grading session per teacher; all sessions share the pooled LLM gateway."""
+    if "llm" not in st.session_state:
+        st.session_state.llm = LLM()
+    return st.session_state.llm
+
+def bulk_grade(assignment, ungraded, index, instructions=""):
+    """
+    Generates feedback drafts for every pending submission of an assignment concurrently.
+    Every section of every answer is one task on a single pool, retried on its own; answers
+    graded in sections are merged in a second round. Each draft lands in session state as
+    soon as it is complete, ready for review.
+    """
+    title = assignment["title"]
+    todo = {username: path for username, path in ungraded
+            if f"feedback_{title}_{username}" not in st.session_state}
+    if not todo:
+        st.info("✍️ Every pending submission already has a draft.")
+        return
+
+    text_cache.prefetch([(path, index.get(path, {}).get("generation")) for path in todo.values()])
+
+    llm = get_session_llm()
+    progress = st.progress(0)
+    status = st.empty()
+    failures = {}
+    drafted = 0
+
+    def draft(username, feedback):
+        nonlocal drafted
+        st.session_state[f"feedback_{title}_{username}"] = feedback
+        drafted += 1
+        progress.progress((drafted + len(failures)) / len(todo))
+        status.write(f"⚙️ {drafted + len(failures)}/{len(todo)} graded — latest: {username}")
+
+    plans = {}
+    for username, path in todo.items():
+        try:
+            content = text_cache.get(path, index.get(path, {}).get("generation"))
+            plans[username] = plan_grading(llm, title, student_answer=content,
+                                           model_answer=assignment["model_answer"],
+                                           additional_instructions=instructions)
+        except Exception as e:
+            failures[username] = e
+
+    tasks = {(username, i): fn for username, calls in plans.items() for i, (_, fn) in enumerate(calls)}
+    sections = {username: {} for username in plans}
+    merges = {}
+    with trace_context(subject=assignment.get("subject"), assignment=title):
+        for (username, i), feedback, error in run_concurrently(tasks):
+            if username in failures:
+                continue
+            if error is not None:
+                failures[username] = error
+                continue
+            sections[username][i] = feedback
+            calls = plans[username]
+            if len(sections[username]) == len(calls):
+                labelled = [(calls[j][0], sections[username][j]) for j in range(len(calls))]
+                if len(calls) == 1:
+                    draft(username, labelled[0][1])
+                else:
+                    merges[username] = merge_call(llm, labelled)
+
+        for username, feedback, error in run_concurrently(merges):
+            if error is None:
+                draft(username, feedback)
+            else:
+                failures[username] = error
+
+    if failures:
+        st.warning("⚠️ Some submissions could not be graded:\n\n" +
+                   "\n\n".join(f"{username}: {error}" for username, error in failures.items()))
+    st.success(f"✅ Drafted feedback for {drafted} submission(s). Review them below.")
+
 def teacher_dashboard():
     st.title("Teacher Dashboard")
     st.write("👩‍🏫 Manage Assignments and Notifications")
@@ -56,6 +300,12 @@ def teacher_dashboard():
     if st.button("Logout"):
         logout()
 
+    model_admin_panel()
+    ocr_cache_panel()
+    catalogue_cache_panel()
+    pipeline_latency_panel()
+    upload_stats_panel()
+
     # Add New Assignment
     st.markdown("## 📝 Add New Assignment")
     with st.container():
@@ -79,18 +329,23 @@ def teacher_dashboard():
                     "submission_deadline": f"{due_date} {due_time}",
                     "model_answer": model_answer,
                     "extracted_texts": {},
-                    "graded_students": {}
+                    "graded_students": {},
+                    "created_at": TIME.time()
                 }
-                st.session_state.assignments.append(new_assignment)
-                save_data(ASSIGNMENTS_FILE, st.session_state.assignments)
-                st.success(f"✅ Assignment '{assignment_title}' added successfully!")
-                TIME.sleep(2)
-                st.rerun()
+                created = catalogue.update("assignments", assignment_title,
+                                           lambda current: new_assignment if current is None else current)
+                if created is not new_assignment:
+                    st.error(f"❌ An assignment titled '{assignment_title}' already exists.")
+                else:
+                    st.success(f"✅ Assignment '{assignment_title}' added successfully!")
+                    TIME.sleep(2)
+                    st.rerun()
 
     # Categorization
+    assignments = load_assignments()
     pending_grading, finalized_submissions, no_submissions, all_assignments = [], [], [], []
 
-    for assignment in st.session_state.assignments:
+    for assignment in assignments:
         total_subs = len(assignment["extracted_texts"])
         if total_subs == 0:
             no_submissions.append(assignment)
@@ -105,7 +360,7 @@ def teacher_dashboard():
 
     # Subject Filter
     st.markdown("## 📂 Filter Assignments by Subject")
-    all_subjects = ["All"] + sorted(set(a.get("subject", "Unspecified") for a in st.session_state.assignments))
+    all_subjects = ["All"] + sorted(set(a.get("subject", "Unspecified") for a in assignments))
     selected_subject = st.selectbox("📚 Select Subject", all_subjects)
 
     def filter_by_subject(assignments):
@@ -125,33 +380,92 @@ def teacher_dashboard():
         else:
             for assignment in pending_grading:
                 st.subheader(f"🟡 {assignment['title']} ({assignment.get('subject', 'N/A')})")
-                for username, extracted_text_path in assignment["extracted_texts"].items():
-                    if assignment["graded_students"].get(username, {}).get("finalized", False):
+                cache_stats = grading_cache.stats(assignment["title"])
+                if cache_stats["hits"] or cache_stats["misses"]:
+                    st.caption(f"♻️ Grading cache: {cache_stats['hit_rate']:.0%} hit rate, "
+                               f"~{cache_stats['tokens_saved']:,} tokens saved")
+                ungraded = [(username, path) for username, path in assignment["extracted_texts"].items()
+                            if not assignment["graded_students"].get(username, {}).get("finalized", False)]
+                index = load_submission_index(tuple(sorted({posixpath.dirname(path) + "/" for _, path in ungraded})))
+                if assignment["model_answer"]:
+                    col1, col2 = st.columns([3, 1])
+                    with col1:
+                        bulk_instructions = st.text_input("Optional Grading Instructions (all pending)",
+                                                          key=f"bulk_instructions_{assignment['title']}")
+                    with col2:
+                        if st.button(f"⚡ Grade all pending ({len(ungraded)})", key=f"bulk_{assignment['title']}"):
+                            bulk_grade(assignment, ungraded, index, bulk_instructions)
+
+                visible = paginate(ungraded, key=f"page_{assignment['title']}")
+
+                # Start downloading this page's submissions in the background; nothing waits on it
+                text_cache.prefetch([(path, index.get(path, {}).get("generation")) for _, path in visible])
+
+                for username, extracted_text_path in visible:
+                    meta = index.get(extracted_text_path, {})
+                    size_info = f" (~{meta['size']:,} chars)" if meta.get("size") is not None else ""
+                    if not st.toggle(f"📄 Submission from {username}{size_info}",
+                                     key=f"open_{assignment['title']}_{username}"):
                         continue
 
                     try:
-                        content = bucket.blob(extracted_text_path).download_as_text()
+                        content = text_cache.get(extracted_text_path, meta.get("generation"))
                     except Exception as e:
                         st.warning(f"⚠️ Could not load submission for {username}: {e}")
                         continue
 
-                    with st.expander(f"📄 Submission from {username}"):
+                    with st.container(border=True):
                         st.text_area("Extracted Answer", value=content, height=150, disabled=True,
                                      key=f"extracted_{assignment['title']}_{username}")
                         instructions = st.text_area("Optional Grading Instructions",
                                                     key=f"instructions_{assignment['title']}_{username}")
 
-                        if st.button(f"⚙️ Generate Feedback", key=f"generate_{assignment['title']}_{username}"):
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            generate = st.button(f"⚙️ Generate Feedback", key=f"generate_{assignment['title']}_{username}")
+                        with col2:
+                            # Regenerate skips the grading cache and replaces its entry
+                            regenerate = st.button("🔁 Regenerate", key=f"regenerate_{assignment['title']}_{username}")
+
+                        if generate or regenerate:
                             if not assignment["model_answer"]:
                                 st.error("❌ Model answer is required.")
                             else:
-                                llm = LLM()
-                                feedback = llm.AI(
-                                    student_answer=content,
-                                    model_answer=assignment["model_answer"],
-                                    additional_instructions=instructions
-                                )
-                                st.session_state[f"feedback_{assignment['title']}_{username}"] = feedback
+                                llm = get_session_llm()
+                                feedback_key = f"feedback_{assignment['title']}_{username}"
+                                st.session_state.pop(f"edit_{assignment['title']}_{username}", None)
+                                st.markdown("### ✍️ Review & Edit Feedback Before Sending")
+                                # Any click reruns the script, which closes the stream and stops generation;
+                                # the text streamed so far is kept (see stream_to_session)
+                                st.button("⏹️ Cancel", key=f"cancel_{assignment['title']}_{username}")
+                                with trace_context(subject=assignment.get("subject"), assignment=assignment["title"]):
+                                    if fits_in_context(llm, content, assignment["model_answer"], instructions):
+                                        feedback = st.write_stream(stream_to_session(feedback_key, cached_stream(
+                                            llm,
+                                            assignment["title"],
+                                            student_answer=content,
+                                            model_answer=assignment["model_answer"],
+                                            additional_instructions=instructions,
+                                            regenerate=regenerate
+                                        )))
+                                    else:
+                                        # Too long for one request: grade sections concurrently, then merge
+                                        section_progress = st.progress(0, text="📚 Long answer: grading in sections...")
+                                        try:
+                                            feedback = grade_answer(
+                                                llm,
+                                                assignment["title"],
+                                                student_answer=content,
+                                                model_answer=assignment["model_answer"],
+                                                additional_instructions=instructions,
+                                                regenerate=regenerate,
+                                                on_progress=lambda done, total: section_progress.progress(
+                                                    done / total, text=f"📚 Graded {done}/{total} sections")
+                                            )
+                                        except Exception as e:
+                                            feedback = f"Error occurred: {e}"
+                                st.session_state[feedback_key] = feedback
+                                st.session_state.pop(f"edit_{assignment['title']}_{username}", None)
                                 st.rerun()
 
                         feedback_key = f"feedback_{assignment['title']}_{username}"
@@ -163,15 +477,19 @@ def teacher_dashboard():
                                                   key=f"edit_{assignment['title']}_{username}")
 
                             if st.button("✅ Finalize & Send Feedback", key=f"finalize_{assignment['title']}_{username}"):
-                                assignment["graded_students"][username] = {
-                                    "feedback": edited,
-                                    "finalized": True
-                                }
+                                grade = {"feedback": edited, "finalized": True}
 
                                 feedback_blob_path = f"{FEEDBACKS_FOLDER}/{assignment['title']}/{username}_feedback.txt"
-                                bucket.blob(feedback_blob_path).upload_from_string(edited, content_type='text/plain')
+                                with span("gcs_write", subject=assignment.get("subject"), assignment=assignment["title"],
+                                          blob=feedback_blob_path, bytes=len(edited.encode("utf-8"))):
+                                    bucket.blob(feedback_blob_path).upload_from_string(edited, content_type='text/plain')
+
+                                def record_grade(current, username=username, grade=grade):
+                                    if current is not None:
+                                        current.setdefault("graded_students", {})[username] = grade
+                                    return current
 
-                                save_data(ASSIGNMENTS_FILE, st.session_state.assignments)
+                                catalogue.update("assignments", assignment["title"], record_grade)
                                 st.success(f"✅ Feedback sent to {username}!")
                                 TIME.sleep(2)
                                 st.rerun()
@@ -216,10 +534,38 @@ def teacher_dashboard():
                                  key=f"view_model_{assignment['title']}")
                 with col3:
                     if st.button("🗑️ Delete", key=f"delete_{assignment['title']}"):
-                        st.session_state.assignments.remove(assignment)
-                        save_data(ASSIGNMENTS_FILE, st.session_state.assignments)
+                        catalogue.delete("assignments", assignment["title"])
                         st.rerun()
 
+def apply_finished_extractions(username):
+    """
+    Reports background extractions that finished since the last rerun. The worker has
+    already recorded the submission; the catalogue is refreshed so it shows immediately.
+    """
+    jobs = unacknowledged_jobs(username)
+    if any(job["status"] == "done" for job in jobs):
+        catalogue.invalidate("assignments")
+        catalogue.invalidate("submissions")
+    for job in jobs:
+        title = job["payload"]["title"]
+        if job["status"] == "done":
+            st.success(f"📌 Your submission for '{title}' has been recorded and text extracted successfully!")
+        else:
+            st.error(f"❌ Error during text extraction for '{title}': {job['error']}")
+        acknowledge_job(job["id"])
+
+@st.fragment(run_every=3)
+def extraction_status(username):
+    """Polls the job queue and reruns the page once a background extraction finishes."""
+    if unacknowledged_jobs(username):
+        st.rerun()
+    for job in active_jobs(username):
+        title = job["payload"]["title"]
+        if job["status"] == "running":
+            st.info(f"⚙️ Extracting text for '{title}'...")
+        else:
+            st.info(f"⏳ '{title}' is queued ({queue_position(job['id'])} submission(s) ahead).")
+
 def student_dashboard():
     st.title("Student Dashboard")
     st.write("📚 View Assignments, Feedback, and Notifications")
@@ -235,21 +581,29 @@ def student_dashboard():
         st.error("You are not logged in. Please log in first.")
         return
 
-    # Load data from GCS
-    st.session_state.assignments = load_data(ASSIGNMENTS_FILE, default=[])
-    st.session_state.submissions = load_data(SUBMISSIONS_FILE, default={})
+    ensure_dispatcher()
+    apply_finished_extractions(username)
+
+    # Shared read-only views of the catalogue; loaded after recording finished extractions
+    assignments = load_assignments()
+    submissions = load_submissions(username)
 
-    if not isinstance(st.session_state.assignments, list):
+    if not isinstance(assignments, list):
         st.error("🚨 Assignments file is not in the correct format.")
         st.stop()
 
-    if not isinstance(st.session_state.submissions, dict):
-        st.session_state.submissions = {}
+    if not isinstance(submissions, dict):
+        submissions = {}
+
+    extracting_titles = {job["payload"]["title"] for job in active_jobs(username)}
+    if extracting_titles:
+        extraction_status(username)
 
     st.subheader("🔔 Notifications")
     today_notifications = []
+    feedback_updates = load_feedback_status(username)
 
-    for assignment in st.session_state.assignments:
+    for assignment in assignments:
         title = assignment.get("title")
         subject = assignment.get("subject", "Unknown Subject")
 
@@ -266,11 +620,8 @@ def student_dashboard():
         if deadline == current_date and not submission_exists:
             today_notifications.append(f"❗ You missed the deadline for '{title}' today!")
 
-        feedback_blob = f"{FEEDBACKS_FOLDER}/{title}/{username}_feedback.txt"
-        feedback_file = bucket.blob(feedback_blob)
-        if feedback_file.exists():
-            feedback_file.reload()
-            mod_time = feedback_file.updated.date()
+        if title in feedback_updates:
+            mod_time = feedback_updates[title].date()
             if mod_time == current_date:
                 today_notifications.append(f"✅ Your assignment '{title}' was graded today!")
 
@@ -282,7 +633,7 @@ def student_dashboard():
         st.write("📭 No new notifications for today.")
 
     st.subheader("🧠 Filter Assignments by Subject")
-    all_subjects = list({a.get("subject", "Unknown Subject") for a in st.session_state.assignments})
+    all_subjects = list({a.get("subject", "Unknown Subject") for a in assignments})
     selected_subject = st.selectbox("Select Subject", ["All"] + sorted(all_subjects))
 
     st.subheader("📝 Assignments")
@@ -290,7 +641,7 @@ def student_dashboard():
 
     upcoming_shown = past_due_shown = graded_shown = pending_grading_shown = False
 
-    for idx, assignment in enumerate(st.session_state.assignments):
+    for idx, assignment in enumerate(assignments):
         title = assignment.get("title")
         subject = assignment.get("subject", "Unknown Subject")
 
@@ -302,15 +653,19 @@ def student_dashboard():
         except Exception:
             continue
 
-        submissions = st.session_state.submissions.get(username, [])
-        is_submitted = title in submissions
+        is_submitted = title in submissions.get(username, ())
 
-        feedback_blob = f"{FEEDBACKS_FOLDER}/{title}/{username}_feedback.txt"
-        feedback_file = bucket.blob(feedback_blob)
-        is_graded = feedback_file.exists()
+        is_graded = title in feedback_updates
+
+        # ⏳ Extraction queued or running in the background
+        if title in extracting_titles and not is_submitted:
+            with tabs[0]:
+                upcoming_shown = True
+                st.write(f"**{title}** *(Subject: {subject})* — Deadline: {assignment['submission_deadline']}")
+                st.info("⏳ Your PDF is being processed. This page updates automatically.")
 
         # 📅 Upcoming
-        if current_date <= deadline and not is_submitted:
+        elif current_date <= deadline and not is_submitted:
             with tabs[0]:
                 upcoming_shown = True
                 st.write(f"**{title}** *(Subject: {subject})* — Deadline: {assignment['submission_deadline']}")
@@ -319,35 +674,23 @@ def student_dashboard():
                 if uploaded_file:
                     # Step 1: Upload PDF to GCS
                     pdf_blob_path = f"uploads/{title.replace(' ', '_')}/{username}.pdf"
-                    pdf_blob = bucket.blob(pdf_blob_path)
-                    pdf_blob.upload_from_file(uploaded_file, content_type="application/pdf")
+                    # Reruns (e.g. clicking "Extract Text") re-send nothing if the stored PDF is identical
+                    with trace_context(subject=subject, assignment=title):
+                        get_upload_manager().upload(pdf_blob_path, uploaded_file, content_type="application/pdf")
                     st.success(f"✅ File uploaded successfully for {title}!")
 
                     if st.button(f"Extract Text for {title}", key=f"extract_{idx}"):
+                        # Step 2: Queue extraction on the background OCR workers
+                        kind = "extract_maths" if subject.lower() == "maths" else "extract_handwritten"
                         try:
-                            # Step 2: Process from GCS and return blob path
-                            if subject.lower() == "maths":
-                                from gcvutils.matheqs import process_pdf_from_gcs_to_text, upload_extracted_text_to_gcs
-                                extracted_text = process_pdf_from_gcs_to_text(pdf_blob_path)
-                                extracted_blob_path = upload_extracted_text_to_gcs(extracted_text, title, username)
-                            else:
-                                from gcvutils.textextract_gcv import extract_handwritten_text_from_pdf
-                                extracted_blob_path = extract_handwritten_text_from_pdf(pdf_blob_path, title, username)
-
-                            # Step 3: Update assignment metadata
-                            for assign in st.session_state.assignments:
-                                if assign.get("title") == title:
-                                    assign.setdefault("submitted_files", []).append(pdf_blob_path)
-                                    assign.setdefault("extracted_texts", {})[username] = extracted_blob_path
-                                    break
-
-                            save_data(ASSIGNMENTS_FILE, st.session_state.assignments)
-                            st.session_state.submissions.setdefault(username, []).append(title)
-                            save_data(SUBMISSIONS_FILE, st.session_state.submissions)
-
-                            st.success("📌 Your submission has been recorded and text extracted successfully!")
+                            submit_job(kind, {"pdf_blob_path": pdf_blob_path, "title": title, "username": username,
+                                              "subject": subject},
+                                       owner=username)
+                            st.rerun()
+                        except JobQueueFull:
+                            st.warning("🚦 The server is busy processing other submissions. Please try again in a minute.")
                         except Exception as e:
-                            st.error(f"❌ Error during text extraction: {e}")
+                            st.error(f"❌ Could not queue text extraction: {e}")
 
         elif current_date > deadline and not is_submitted:
             with tabs[1]:
@@ -360,9 +703,9 @@ def student_dashboard():
                 graded_shown = True
 
                 try:
-                    if feedback_file.exists():
-                        feedback_file.reload()  # ✅ Ensures metadata like `.updated` is available
-                        mod_time = feedback_file.updated.date()
+                    feedback_file = bucket.blob(f"{FEEDBACKS_FOLDER}/{title}/{username}_feedback.txt")
+                    if title in feedback_updates:
+                        mod_time = feedback_updates[title].date()
                         feedback = feedback_file.download_as_text()
                         st.success(f"📘 **{title}** *(Subject: {subject})* - Feedback (Last Updated: {mod_time}):")
                         st.text_area("Feedback", value=feedback, height=150, disabled=True, key=f"{title}_{username}_feedback_display")
@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import groq
+import httpx
+
+from gcvutils.tracing import propagate
+from views.LM import LLM_PARAMS, LLM_CONTEXT_TOKENS, estimate_tokens, estimate_prompt_tokens, gateway
+
+# Grading cache: in-memory LRU in front of one bucket object per response
+GRADING_CACHE_MAX_ENTRIES = 1024
+GRADING_CACHE_PREFIX = "grading_cache/"
+
+# Bulk grading limits; pacing comes from the gateway's process-wide rate limiter
+GRADING_MAX_WORKERS = int(os.environ.get("EVALMATE_GRADING_MAX_WORKERS", 8))
+GRADING_MAX_RETRIES = 4
+GRADING_BACKOFF_SECONDS = 2.0
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error):
+    # Dropped connections, timeouts, 429 and 5xx are transient; other 4xx and any other exception are not
+    if isinstance(error, (groq.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def call_with_retries(fn, limiter=None, max_retries=GRADING_MAX_RETRIES):
+    """
+    Calls fn() within the rate limit (the gateway's limiter unless one is given),
+    retrying transient failures with jittered backoff.
+    """
+    limiter = limiter or gateway.rate_limiter
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return fn()
+        except AssertionError:
+            raise
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is not None:
+                limiter.pause(delay)
+            else:
+                time.sleep(random.uniform(0, GRADING_BACKOFF_SECONDS * (2 ** attempt)))
+
+
+def run_concurrently(tasks, max_workers=GRADING_MAX_WORKERS, limiter=None):
+    """
+    Runs {key: zero-argument callable} on a bounded pool and yields
+    (key, result, error) as each task finishes, in completion order.
+    """
+    if not tasks:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks)), thread_name_prefix="grading") as pool:
+        futures = {pool.submit(propagate(call_with_retries), fn, limiter): key for key, fn in tasks.items()}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], (None if error else future.result()), error
+
+
+def _normalize(text):
+    """Canonical form for cache keys: NFKC, collapsed whitespace, trimmed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def grading_cache_key(messages, model=LLM_PARAMS["model"], temperature=LLM_PARAMS["temperature"]):
+    """Hash of the normalized prompt (system prompt, instructions, both answers), model and temperature."""
+    payload = {
+        "messages": [[m["role"], _normalize(m["content"])] for m in messages],
+        "model": model,
+        "temperature": temperature,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class GradingCache:
+    """Bounded in-memory LRU of LLM feedback, backed by an optional persistent bucket tier."""
+
+    def __init__(self, max_entries=GRADING_CACHE_MAX_ENTRIES, bucket=None, prefix=GRADING_CACHE_PREFIX):
+        self.max_entries = max_entries
+        self.bucket = bucket
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.bucket is not None:
+            try:
+                text = json.loads(self.bucket.blob(f"{self.prefix}{key}.json").download_as_text())["feedback"]
+                self._remember(key, text)
+                return text
+            except Exception:
+                pass
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if self.bucket is not None:
+            try:
+                self.bucket.blob(f"{self.prefix}{key}.json").upload_from_string(
+                    json.dumps({"feedback": text}), content_type="application/json")
+            except Exception as e:
+                print(f"⚠️ Could not persist grading cache entry {key[:12]}: {e}")
+
+    def record(self, scope, hit, tokens=0):
+        """Counts a lookup for scope (an assignment title); tokens is the prompt+response size saved on a hit."""
+        with self._lock:
+            stats = self._stats.setdefault(scope, {"hits": 0, "misses": 0, "tokens_saved": 0})
+            stats["hits" if hit else "misses"] += 1
+            stats["tokens_saved"] += tokens if hit else 0
+
+    def stats(self, scope):
+        with self._lock:
+            stats = dict(self._stats.get(scope, {"hits": 0, "misses": 0, "tokens_saved": 0}))
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+grading_cache = GradingCache()
+
+
+def enable_persistent_tier(bucket):
+    if grading_cache.bucket is None:
+        grading_cache.bucket = bucket
+
+
+def _saved_tokens(messages, text):
+    return sum(estimate_tokens(m["content"]) for m in messages) + estimate_tokens(text)
+
+
+def cached_grade(llm, scope, student_answer, model_answer, additional_instructions="", regenerate=False):
+    """llm.grade() through the grading cache; regenerate=True bypasses and refreshes the entry."""
+    messages = llm.build_messages(student_answer, model_answer, additional_instructions)
+    key = grading_cache_key(messages)
+    if not regenerate:
+        cached = grading_cache.get(key)
+        if cached is not None:
+            grading_cache.record(scope, True, _saved_tokens(messages, cached))
+            return cached
+    grading_cache.record(scope, False)
+    feedback = llm.grade(student_answer, model_answer, additional_instructions)
+    grading_cache.put(key, feedback)
+    return feedback
+
+
+def cached_stream(llm, scope, student_answer, model_answer, additional_instructions="", regenerate=False):
+    """llm.stream_AI() through the grading cache; a hit is yielded in one piece."""
+    messages = llm.build_messages(student_answer, model_answer, additional_instructions)
+    key = grading_cache_key(messages)
+    if not regenerate:
+        cached = grading_cache.get(key)
+        if cached is not None:
+            grading_cache.record(scope, True, _saved_tokens(messages, cached))
+            yield cached
+            return
+    grading_cache.record(scope, False)
+    parts = []
+    for token in llm.stream_AI(student_answer, model_answer, additional_instructions):
+        parts.append(token)
+        yield token
+    feedback = "".join(parts)
+    if feedback and not feedback.startswith("Error occurred"):
+        grading_cache.put(key, feedback)
+
+
+# Long answers: requests are sized to this share of the context window left after the
+# completion budget, leaving headroom for the character-based token estimate
+CONTEXT_SAFETY_FACTOR = 0.85
+SECTION_NOTE = ("You are grading one section ({label}) of a longer answer. "
+                "Grade only this section against the matching part of the model answer.")
+MERGE_INSTRUCTIONS = ("Below is feedback on separate sections of one student's answer. Combine it into a "
+                      "single coherent feedback for the student, keeping every point and giving one overall grade.")
+
+QUESTION_PATTERN = re.compile(r"^\s*(?:Q(?:uestion)?\.?\s*)?(\d{1,3})\s*[.):]", re.IGNORECASE | re.MULTILINE)
+
+
+def prompt_budget():
+    """Tokens available for the prompt of one request."""
+    return int((LLM_CONTEXT_TOKENS - LLM_PARAMS["max_tokens"]) * CONTEXT_SAFETY_FACTOR)
+
+
+def fits_in_context(llm, student_answer, model_answer, additional_instructions=""):
+    messages = llm.build_messages(student_answer, model_answer, additional_instructions)
+    return estimate_prompt_tokens(messages) <= prompt_budget()
+
+
+def split_by_question(text):
+    """Returns {question number: section} in order, or {} when the text is not numbered."""
+    matches = list(QUESTION_PATTERN.finditer(text))
+    if len(matches) < 2:
+        return {}
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[match.start():end].strip()
+        if i == 0 and text[:match.start()].strip():
+            body = text[:match.start()].strip() + "\n" + body
+        number = match.group(1)
+        sections[number] = f"{sections[number]}\n{body}" if number in sections else body
+    return sections
+
+
+def chunk_text(text, max_tokens):
+    """Packs paragraphs greedily into chunks of at most max_tokens (estimated)."""
+    max_chars = max(max_tokens * 4, 1)
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if paragraph:
+            pieces.append(paragraph)
+
+    chunks, current = [], ""
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if estimate_tokens(candidate) > max_tokens and current:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks or [text]
+
+
+def plan_sections(llm, student_answer, model_answer, additional_instructions=""):
+    """
+    Splits a long answer into [(label, student part, model part)], aligned by question
+    number when both answers are numbered and by position otherwise, each sized to fit.
+    """
+    student_questions = split_by_question(student_answer)
+    model_questions = split_by_question(model_answer)
+    if student_questions and model_questions:
+        pairs = [(f"Question {n}", part, model_questions.get(n, model_answer))
+                 for n, part in student_questions.items()]
+    else:
+        pairs = [("Part", student_answer, model_answer)]
+
+    overhead = estimate_prompt_tokens(llm.build_messages("", "", additional_instructions)) + \
+        estimate_tokens(SECTION_NOTE) + 16
+    sections = []
+    for label, student_part, model_part in pairs:
+        model_chunks = chunk_text(model_part, (prompt_budget() - overhead) // 2)
+        longest_model = max(estimate_tokens(c) for c in model_chunks)
+        student_chunks = chunk_text(student_part, prompt_budget() - overhead - longest_model)
+        for i, chunk in enumerate(student_chunks):
+            # Pair each student chunk with the model chunk at the same relative position
+            model_chunk = model_chunks[min(i * len(model_chunks) // len(student_chunks), len(model_chunks) - 1)]
+            suffix = f" ({i + 1}/{len(student_chunks)})" if len(student_chunks) > 1 else ""
+            sections.append((f"{label}{suffix}" if label != "Part" else f"Part {len(sections) + 1}",
+                             chunk, model_chunk))
+    return sections
+
+
+def plan_grading(llm, scope, student_answer, model_answer, additional_instructions="", regenerate=False):
+    """
+    The independent LLM calls that grade one answer, as [(label, zero-argument callable)].
+    An answer that fits the context window is one cached call; a longer one is one call
+    per section, whose feedback merge_call() then combines. Each call can be retried on its own.
+    """
+    if fits_in_context(llm, student_answer, model_answer, additional_instructions):
+        return [("Answer", lambda: cached_grade(llm, scope, student_answer, model_answer,
+                                                additional_instructions, regenerate))]
+
+    calls = []
+    for label, student_part, model_part in plan_sections(llm, student_answer, model_answer,
+                                                         additional_instructions):
+        instructions = "\n".join(filter(None, [additional_instructions, SECTION_NOTE.format(label=label)]))
+        calls.append((label, lambda s=student_part, m=model_part, ins=instructions:
+                      cached_grade(llm, scope, s, m, ins, regenerate)))
+    return calls
+
+
+def merge_call(llm, labelled_feedback):
+    """
+    Zero-argument callable returning the feedback for [(label, section feedback)]: the
+    feedback itself for one section, otherwise one merge request, or the labelled sections
+    joined when they are too long to merge in one request.
+    """
+    if len(labelled_feedback) == 1:
+        feedback = labelled_feedback[0][1]
+        return lambda: feedback
+    combined = "\n\n".join(f"{label}:\n{feedback}" for label, feedback in labelled_feedback)
+    merge_messages = list(llm.messages) + [{'role': 'system', 'content': MERGE_INSTRUCTIONS},
+                                           {'role': 'user', 'content': combined}]
+    if estimate_prompt_tokens(merge_messages) > prompt_budget():
+        return lambda: combined  # Per-section feedback is still complete
+    return lambda: llm.gateway.complete(merge_messages)
+
+
+def grade_answer(llm, scope, student_answer, model_answer, additional_instructions="", regenerate=False,
+                 on_progress=None):
+    """
+    Grades an answer of any length. Answers that fit the context window take one cached call;
+    longer ones are graded section by section concurrently and the feedback is merged.
+    """
+    calls = plan_grading(llm, scope, student_answer, model_answer, additional_instructions, regenerate)
+    if len(calls) == 1:
+        return calls[0][1]()
+
+    feedbacks = {}
+    for i, feedback, error in run_concurrently({i: fn for i, (_, fn) in enumerate(calls)}):
+        if error is not None:
+            raise error
+        feedbacks[i] = feedback
+        if on_progress:
+            on_progress(len(feedbacks), len(calls))
+    return call_with_retries(merge_call(llm, [(calls[i][0], feedbacks[i]) for i in range(len(calls))]))